@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Render rate of the software effects, rendered in batches of frames
+
+Usage:
+  $ python benchmarks/bench_effects.py [--batch 64] [--seconds 10] [--fps 50] [--max-cpu 0.1]
+
+For each effect it prints the frames rendered per second and the fraction of
+one core needed to render --fps frames per second (the keyboard shows about
+50 frames/s with the default gap). Exits with status 1 if an effect needs
+more than --max-cpu
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from keyboard_fusion_rgb import KeyboardFusionRGB
+from keyboard_fusion_emulator import EmulatedKeyboard
+from keyboard_fusion_effects import Gradient, Wave, Ripple, Plasma, Fire, Starfield, Noise
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+  parser.add_argument('--batch', type=int, default=64, help='frames rendered at once')
+  parser.add_argument('--seconds', type=float, default=10, help='seconds of effect to render')
+  parser.add_argument('--fps', type=float, default=50, help='frame rate of the keyboard')
+  parser.add_argument('--max-cpu', type=float, default=0.1, help='maximum fraction of one core')
+  args = parser.parse_args()
+
+  geometry = KeyboardFusionRGB(transport=EmulatedKeyboard()).geometry
+  effects = [Gradient(geometry, speed=0.2), Wave(geometry), Ripple(geometry, 'G'), Plasma(geometry),
+             Fire(geometry), Starfield(geometry), Noise(geometry)]
+  n_frames = int(args.seconds * args.fps)
+
+  status = 0
+  print('{:<10} {:>14} {:>10}'.format('effect', 'frames/s', 'cpu'))
+  for effect in effects:
+    t_start = time.process_time()
+    for ix in range(0, n_frames, args.batch):
+      effect.render((ix + np.arange(min(args.batch, n_frames - ix))) / args.fps)
+    elapsed = max(time.process_time() - t_start, 1e-9)
+    cpu = elapsed / args.seconds
+    print('{:<10} {:>14.0f} {:>9.2%}'.format(type(effect).__name__, n_frames / elapsed, cpu))
+    if cpu > args.max_cpu:
+      status = 1
+  if status:
+    print('an effect needs more than {:.0%} of one core'.format(args.max_cpu))
+  return status
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Allocation and time per call to build the feature reports, compared with
+building them as 264-element lists (previous implementation)
+
+Usage:
+  $ python benchmarks/bench_reports.py [--calls 10000]
+"""
+import argparse
+import os
+import sys
+import timeit
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from keyboard_fusion_rgb import KeyboardFusionRGB, CustomFrame
+from keyboard_fusion_emulator import EmulatedKeyboard
+
+
+def list_mode_request(keyboard, mode, brightness, buf_mode):
+  offset = keyboard.mode_offsets[mode]
+  buf_req = ([0x07, 0x02] + [0x00] * 8 + [mode] + [0x00] + [brightness] +
+             [0x00] * offset + buf_mode)
+  return buf_req + [0x00] * (keyboard.data_size - len(buf_req))
+
+
+def list_custom_requests(frame):
+  tmp = list(np.reshape(frame.rgb, 384, 'F'))
+  return ([0x07, 0x06, 0x00, 0x01] + [0x00] * 4 + tmp[:256],
+          [0x07, 0x06, 0x00, 0x02] + [0x00] * 4 + tmp[256:] + [0x00] * 128)
+
+
+def patch_custom_requests(keyboard, frame):
+  planes_rg, planes_b = keyboard._get_custom_planes()
+  planes_rg[...] = frame.rgb[:, :2].T
+  planes_b[...]  = frame.rgb[:, 2:].T
+  return keyboard._custom_requests
+
+
+def peak_bytes(fn):
+  '''
+  Peak of memory allocated (bytes) during one call
+  '''
+
+  fn()  # warm up
+  tracemalloc.start()
+  tracemalloc.reset_peak()
+  base = tracemalloc.get_traced_memory()[0]
+  fn()
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  return peak - base
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+  parser.add_argument('--calls', type=int, default=10000, help='calls for the timing')
+  args = parser.parse_args()
+
+  keyboard = KeyboardFusionRGB(transport=EmulatedKeyboard())
+  frame = CustomFrame(np.random.randint(0, 256, (128, 3)))
+  buf_mode = [5, 1, 0, 0xFF, 0x00, 0x00, 0x00, 0x00, 0xFF]
+
+  cases = [('set mode, list',     lambda: list_mode_request(keyboard, 0x0D, 50, buf_mode)),
+           ('set mode, template', lambda: keyboard.build_mode_request(0x0D, 50, buf_mode)),
+           ('custom, list',       lambda: list_custom_requests(frame)),
+           ('custom, template',   lambda: patch_custom_requests(keyboard, frame))]
+
+  print('{:<20} {:>14} {:>12}'.format('request', 'peak bytes', 'us / call'))
+  for name, fn in cases:
+    t_call = timeit.timeit(fn, number=args.calls) / args.calls
+    print('{:<20} {:>14d} {:>12.2f}'.format(name, peak_bytes(fn), t_call * 1e6))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Startup time of the command line interface, compared with an empty Python
+interpreter. A mode command (e.g. 'static') must not load NumPy nor the
+optional modules, and its overhead must stay within the startup budget
+
+Usage:
+  $ python benchmarks/bench_startup.py [--runs 20] [--budget-ms 50]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# runs a mode command against the emulated keyboard and lists heavy modules loaded.
+# The gaps between reports are required by the keyboard, they are not startup time
+CLI_CODE = '''
+import sys
+import keyboard_fusion_cli
+keyboard_fusion_cli.main(['--emulate', '--delay-ms', '0', 'static', '--color', 'ff0000'])
+print(','.join(name for name in ('numpy', 'keyboard_fusion_animation', 'keyboard_fusion_async')
+               if name in sys.modules))
+'''
+
+
+def run_python(code, n_runs):
+  '''
+  Median wall time in seconds of a new interpreter running code, and its output
+  '''
+
+  env = dict(os.environ, PYTHONPATH=ROOT)
+  times = []
+  for i_run in range(n_runs):
+    t_start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', code], env=env, check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True).stdout
+    times.append(time.perf_counter() - t_start)
+  return sorted(times)[n_runs // 2], output.strip()
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument('--runs', type=int, default=20)
+  parser.add_argument('--budget-ms', type=float, default=50.0,
+                      help='exit with error if the overhead is larger, the default is 50 ms')
+  args = parser.parse_args()
+
+  t_empty, _ = run_python('pass', args.runs)
+  t_cli, loaded = run_python(CLI_CODE, args.runs)
+  overhead_ms = (t_cli - t_empty) * 1e3
+  print('empty interpreter : {:7.1f} ms'.format(t_empty * 1e3))
+  print('cli static mode   : {:7.1f} ms'.format(t_cli * 1e3))
+  print('overhead          : {:7.1f} ms  (budget {:.0f} ms)'.format(overhead_ms, args.budget_ms))
+  print('heavy modules     : ' + (loaded or 'none'))
+
+  if loaded:
+    print('FAIL: modules loaded for a mode command: ' + loaded)
+    sys.exit(1)
+  if overhead_ms > args.budget_ms:
+    print('FAIL: startup overhead above the budget')
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Throughput of KeyboardFusionRGB with the emulated keyboard, no hardware needed
+
+Usage:
+  $ python benchmarks/bench_throughput.py [--latency-ms 0.5] [--frames 50] [--min-fps 0]
+
+Exits with status 1 if the custom frame rate is lower than --min-fps,
+so it can be used as regression test in CI
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from keyboard_fusion_rgb import KeyboardFusionRGB
+from keyboard_fusion_emulator import EmulatedKeyboard
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+  parser.add_argument('--latency-ms', type=float, default=0.5, help='emulated latency per report')
+  parser.add_argument('--frames', type=int, default=50, help='number of custom frames to write')
+  parser.add_argument('--min-fps', type=float, default=0, help='minimum custom frames per second')
+  args = parser.parse_args()
+
+  emulator = EmulatedKeyboard(latency_s=args.latency_ms / 1000)
+  keyboard = KeyboardFusionRGB(transport=emulator)
+  dict_keys = keyboard.set_custom_mode(brightness=100)
+
+  # used keys only, and each frame changes the 3 planes (both requests)
+  keys = list(keyboard.layout.index)
+  n_start = emulator.n_sent
+  t_start = time.perf_counter()
+  for ix in range(args.frames):
+    dict_keys[keys[ix % len(keys)]] = [(ix + 1) % 256, (7 * ix + 1) % 256, 255 - ix % 256]
+    keyboard.set_custom_configuration(dict_keys)
+  elapsed = time.perf_counter() - t_start
+
+  fps = args.frames / elapsed
+  print('custom frames : {:d}'.format(args.frames))
+  print('reports sent  : {:d} ({:.2f} per frame)'.format(emulator.n_sent, (emulator.n_sent - n_start) / args.frames))
+  print('elapsed       : {:.3f} s'.format(elapsed))
+  print('frame rate    : {:.1f} frames/s'.format(fps))
+  if fps < args.min_fps:
+    print('frame rate is lower than {:.1f} frames/s'.format(args.min_fps))
+    return 1
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Animation engine for the Custom mode of the Fusion RGB Keyboard
+
+A frame generator is driven at a target frame rate on a monotonic clock.
+When writing to the keyboard falls behind, the frames whose time already
+passed are dropped (the generator jumps to the current time), so the lag
+does not build up.
+
+Example:
+  keyboard.set_custom_mode(brightness = 100)
+  animation = Animation(keyboard, lambda ix, t: frames[ix % len(frames)], fps = 30)
+  stats = animation.run(duration_s = 10)
+
+@author: Raymundo Cassani
+"""
+import math
+import time
+
+class AnimationStats:
+  """
+  Statistics of an animation run
+  """
+
+  def __init__(self, fps):
+    self.target_fps     = fps
+    self.frames_shown   = 0
+    self.frames_dropped = 0
+    self.elapsed_s      = 0.0
+    # delay of the shown frames with respect to their schedule, running
+    # statistics (Welford) so memory does not grow with the run
+    self.n_lateness      = 0
+    self.mean_lateness_s = 0.0
+    self.max_lateness_s  = 0.0
+    self._m2_lateness    = 0.0
+
+  def add_lateness(self, lateness_s):
+    '''
+    Adds the delay of a shown frame with respect to its schedule
+    '''
+
+    self.n_lateness += 1
+    delta = lateness_s - self.mean_lateness_s
+    self.mean_lateness_s += delta / self.n_lateness
+    self._m2_lateness += delta * (lateness_s - self.mean_lateness_s)
+    self.max_lateness_s = max(self.max_lateness_s, lateness_s)
+
+  @property
+  def achieved_fps(self):
+    '''
+    Frames shown per second
+    '''
+
+    return self.frames_shown / self.elapsed_s if self.elapsed_s > 0 else 0.0
+
+  @property
+  def jitter_s(self):
+    '''
+    Standard deviation in seconds of the delay of the frames with respect to their schedule
+    '''
+
+    if self.n_lateness < 2:
+      return 0.0
+    return math.sqrt(self._m2_lateness / (self.n_lateness - 1))
+
+  def __repr__(self):
+    return ('AnimationStats(target_fps={:.1f}, achieved_fps={:.1f}, frames_shown={:d}, '
+            'frames_dropped={:d}, jitter_ms={:.2f})'.format(self.target_fps, self.achieved_fps,
+            self.frames_shown, self.frames_dropped, self.jitter_s * 1000))
+
+
+class Animation:
+  """
+  Drives a frame generator at a fixed frame rate with KeyboardFusionRGB
+  """
+
+  def __init__(self, keyboard, frame_fn, fps = 30):
+    '''
+    Parameters
+    ----------
+    keyboard : KeyboardFusionRGB
+      DESCRIPTION. Keyboard, it has to be in Custom mode
+    frame_fn : Callable (ix_frame, t_s) -> CustomFrame or Array (128, 3)
+      DESCRIPTION. Returns the frame with index ix_frame, shown at t_s seconds
+      from the start. Returning None stops the animation
+    fps : Float, optional
+      DESCRIPTION. Target frames per second, the default is 30
+    '''
+
+    self.keyboard = keyboard
+    self.frame_fn = frame_fn
+    self.fps      = fps
+    self.running  = False
+    self.stats    = None
+
+  def stop(self):
+    '''
+    Stops the animation after the current frame (e.g. from another thread)
+    '''
+
+    self.running = False
+
+  def run(self, duration_s = None, n_frames = None):
+    '''
+    Runs the animation until the duration or the number of frames is reached,
+    frame_fn returns None or stop() is called
+
+    Parameters
+    ----------
+    duration_s : Float, optional
+      DESCRIPTION. Duration of the animation in seconds, the default is None (no limit)
+    n_frames : Int, optional
+      DESCRIPTION. Number of frames in the schedule (shown + dropped), the default is None (no limit)
+
+    Returns
+    -------
+    stats : AnimationStats
+      DESCRIPTION. Achieved frame rate, jitter and dropped frames
+    '''
+
+    period = 1.0 / self.fps
+    ix_end = math.inf
+    if duration_s is not None:
+      ix_end = math.ceil(duration_s * self.fps - 1e-9)
+    if n_frames is not None:
+      ix_end = min(ix_end, n_frames)
+    stats = AnimationStats(self.fps)
+    self.stats = stats
+    self.running = True
+    t_start = time.monotonic()
+    ix_frame = 0
+    while self.running and ix_frame < ix_end:
+      t_frame = ix_frame * period
+      # wait for the frame time
+      delay = t_start + t_frame - time.monotonic()
+      if delay > 0:
+        time.sleep(delay)
+      frame = self.frame_fn(ix_frame, t_frame)
+      if frame is None:
+        break
+      stats.add_lateness(time.monotonic() - t_start - t_frame)
+      self.keyboard.set_custom_frame(frame)
+      stats.frames_shown += 1
+      # if the writing took longer than the period, jump to the current frame
+      ix_next = min(ix_end, max(ix_frame + 1, int((time.monotonic() - t_start) / period)))
+      stats.frames_dropped += ix_next - ix_frame - 1
+      ix_frame = ix_next
+    stats.elapsed_s = max(time.monotonic() - t_start, ix_frame * period)
+    self.running = False
+    return stats
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+asyncio API for the Fusion RGB Keyboard
+
+AsyncKeyboardFusionRGB has awaitable versions of the KeyboardFusionRGB
+methods. The gap between feature reports is awaited with asyncio.sleep(),
+and the access to the keyboard is serialized with an asyncio.Lock, so many
+coroutines can share one keyboard without threads. The transport calls
+(send_feature_report() and get_feature_report()) are synchronous: each one
+blocks the event loop while it runs, only the gaps between them are awaited.
+Use keyboard_fusion_writer.BackgroundWriter if that is not acceptable.
+
+Example:
+  async with AsyncKeyboardFusionRGB(layout = 'eng_us') as keyboard:
+    await keyboard.set_static_mode(color_rgb=[0xff, 0x00, 0x00])
+    await keyboard.set_brightness(80)
+
+@author: Raymundo Cassani
+"""
+import asyncio
+
+from keyboard_fusion_rgb import (KeyboardFusionRGB, CustomFrame, MODE_SETTERS, _STATUS_REQUEST,
+                                 _CLEAN_REQUEST, _CUSTOM_READ_1, _CUSTOM_READ_2)
+
+class AsyncKeyboardFusionRGB:
+  """
+  Awaitable counterpart of KeyboardFusionRGB
+  """
+
+  def __init__(self, *args, **kwargs):
+    '''
+    The parameters are the same as for KeyboardFusionRGB
+    '''
+
+    # the synchronous driver holds the transport, the requests and the shadow copy
+    self.keyboard = KeyboardFusionRGB(*args, **kwargs)
+    self.keyboard.pacer.mode = 'deadline'
+    self.lock = asyncio.Lock()
+
+  @property
+  def keys(self):
+    return self.keyboard.keys
+
+  @property
+  def layout(self):
+    return self.keyboard.layout
+
+  async def open(self):
+    async with self.lock:
+      self.keyboard.open()
+    return self
+
+  async def close(self):
+    async with self.lock:
+      self.keyboard.close()
+
+  async def __aenter__(self):
+    return await self.open()
+
+  async def __aexit__(self, exc_type, exc_value, traceback):
+    await self.close()
+
+
+  async def _wait(self):
+    delay = self.keyboard.pacer.remaining()
+    if delay > 0:
+      await asyncio.sleep(delay)
+      self.keyboard.pacer.slept_s += delay
+
+  async def _transfer(self, buf_req, has_rsp):
+    kb = self.keyboard
+    await self._wait()
+    kb.hid_kb.send_feature_report(buf_req)
+    kb.pacer.done()
+    kb.n_reports += 1
+    if not has_rsp:
+      return None
+    await self._wait()
+    buf_rsp = kb.hid_kb.get_feature_report(kb.data_size, kb.data_size)
+    kb.pacer.done()
+    kb.n_reports += 1
+    return buf_rsp
+
+  async def _write(self, buf_req, has_rsp = False):
+    '''
+    Same as KeyboardFusionRGB.write_keyboard_request(), the lock must be held
+    '''
+
+    kb = self.keyboard
+    if not kb.open_hid_comm():
+      return None
+    buf_rsp = None
+    for i_try in range(kb.max_retries + 1):
+      try:
+        buf_rsp = await self._transfer(buf_req, has_rsp)
+        kb._track_request(buf_req, buf_rsp)
+        break
+      except Exception as error:
+        if not kb._retry_after_error(error, i_try):
+          break
+    kb._end_request()
+    return buf_rsp
+
+  async def _clean(self):
+    buf_rsp = await self._write(_CLEAN_REQUEST, has_rsp=True)
+    if buf_rsp is None:
+      self.keyboard._error('clean', 'No Response for Cleaning command')
+    elif any(buf_rsp[1:]):
+      self.keyboard._error('clean', 'Error at Response for Cleaning command')
+
+  async def _apply(self, mode, brightness, buf_mode, force = False):
+    kb = self.keyboard
+    buf_req = kb.build_mode_request(mode, brightness, buf_mode)
+    if kb._mode_request_cached(buf_req, force):
+      # the status is read before skipping the request, as in the driver
+      await self._write(_STATUS_REQUEST, has_rsp=True)
+    is_needed, needs_clean = kb._mode_request_needed(buf_req, force, confirm=False)
+    if not is_needed:
+      return False
+    if needs_clean:
+      await self._clean()
+    await self._write(buf_req)
+    return True
+
+  async def _get_custom_frame(self):
+    buf_rsp_1 = await self._write(_CUSTOM_READ_1, has_rsp=True)
+    buf_rsp_2 = await self._write(_CUSTOM_READ_2, has_rsp=True)
+    return self.keyboard._caller_frame(CustomFrame.decode_reports(buf_rsp_1, buf_rsp_2))
+
+  async def _get_cached_custom_frame(self):
+    kb = self.keyboard
+    if all(kb._is_fresh(kb.custom_t[page]) for page in kb.custom_pages):
+      return kb.get_cached_custom_frame()
+    return await self._get_custom_frame()
+
+  async def _set_custom_frame(self, frame, force = False):
+    buf_reqs = self.keyboard._plan_custom_requests(frame, force)
+    for buf_req in buf_reqs:
+      await self._write(buf_req)
+    return len(buf_reqs)
+
+
+  async def write_keyboard_request(self, buf_req, has_rsp = False):
+    '''
+    Writes a request to the keyboard and reads the response if indicated
+    '''
+
+    async with self.lock:
+      return await self._write(buf_req, has_rsp)
+
+  async def get_current_status(self):
+    '''
+    Gets the current configuration of the keyboard
+    '''
+
+    async with self.lock:
+      return await self._write(_STATUS_REQUEST, has_rsp=True)
+
+  async def clean_configuration(self):
+    '''
+    Writes the cleaning configuration command and checks for error
+    '''
+
+    async with self.lock:
+      await self._clean()
+
+  async def apply_mode_configuration(self, mode, brightness, buf_mode, force = False):
+    '''
+    Sets a mode with its configuration, see KeyboardFusionRGB.apply_mode_configuration()
+    '''
+
+    async with self.lock:
+      return await self._apply(mode, brightness, buf_mode, force)
+
+  async def set_brightness(self, brightness):
+    '''
+    Changes the brightness of the current mode
+    '''
+
+    async with self.lock:
+      kb = self.keyboard
+      if kb._is_fresh(kb.status_t):
+        buf_req = list(kb.status)
+      else:
+        buf_req = await self._write(_STATUS_REQUEST, has_rsp=True)
+      buf_req[1] = 0x02         # change instruction
+      buf_req[12] = brightness  # change brightness
+      await self._write(buf_req)
+
+  async def get_custom_frame(self):
+    '''
+    Gets the stored light values in the Custom mode as CustomFrame
+    '''
+
+    async with self.lock:
+      return await self._get_custom_frame()
+
+  async def set_custom_frame(self, frame, force = False):
+    '''
+    Sets the stored light values in the Custom mode, only the changed requests are sent
+    '''
+
+    async with self.lock:
+      return await self._set_custom_frame(frame, force)
+
+  async def get_custom_configuration(self):
+    '''
+    Gets the stored light values in the Custom mode as dictionary
+    '''
+
+    frame = await self.get_custom_frame()
+    return frame.to_dict(self.layout)
+
+  async def set_custom_configuration(self, dict_keys, force = False):
+    '''
+    Sets the stored light values in the Custom mode from a dictionary, the
+    keys that are not in it keep their current color
+    '''
+
+    async with self.lock:
+      base = await self._get_cached_custom_frame()
+      return await self._set_custom_frame(CustomFrame.from_dict(dict_keys, self.layout, base), force)
+
+  async def set_custom_mode(self, dict_keys = [], brightness = 50):
+    '''
+    Sets the Custom mode, see KeyboardFusionRGB.set_custom_mode()
+    '''
+
+    async with self.lock:
+      await self._apply(0x12, brightness, [])
+      if dict_keys:
+        base = await self._get_cached_custom_frame()
+        await self._set_custom_frame(CustomFrame.from_dict(dict_keys, self.layout, base))
+      frame = await self._get_cached_custom_frame()
+      return frame.to_dict(self.layout)
+
+
+def _async_mode_setter(name):
+  '''
+  Awaitable version of a mode setter: the synchronous setter builds the mode
+  configuration, which is recorded and then sent with asyncio pacing
+  '''
+
+  sync_setter = getattr(KeyboardFusionRGB, name)
+
+  async def mode_setter(self, *args, **kwargs):
+    mode, brightness, buf_mode, force = self.keyboard.record_mode_call(name, *args, **kwargs)
+    return await self.apply_mode_configuration(mode, brightness, buf_mode, force)
+
+  mode_setter.__name__ = name
+  mode_setter.__qualname__ = 'AsyncKeyboardFusionRGB.' + name
+  mode_setter.__doc__ = sync_setter.__doc__
+  return mode_setter
+
+for _name in MODE_SETTERS:
+  setattr(AsyncKeyboardFusionRGB, _name, _async_mode_setter(_name))
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Command line interface for the Fusion RGB Keyboard
+
+The modules are imported only when they are needed: setting a mode or the
+brightness loads neither NumPy nor the optional modules, NumPy is only
+loaded for the Custom mode frames.
+
+Usage:
+  $ keyboard-fusion-rgb static --color ff0000 --brightness 80
+  $ keyboard-fusion-rgb wave --random --speed 90 --direction left
+  $ keyboard-fusion-rgb brightness 30
+  $ keyboard-fusion-rgb custom --brightness 100
+  $ keyboard-fusion-rgb frame-save typing.json
+  $ keyboard-fusion-rgb frame-load typing.json
+  $ keyboard-fusion-rgb status
+
+Frame files: '.json' files have the RGB color for each key name, other
+files have the 384 bytes of the frame as color planes (Red, Green and Blue
+for the 128 key slots), as get_custom_bytes() and CustomFrame.to_bytes().
+
+@author: Raymundo Cassani
+"""
+import sys
+
+def parse_color(text):
+  '''
+  Parses a color as 'ff0000', '#ff0000' or '255,0,0'
+
+  Returns
+  -------
+  color_rgb : List 3 Int (8-bit) RGB
+  '''
+
+  import argparse
+  text = text.strip().lstrip('#')
+  try:
+    if ',' in text:
+      color_rgb = [int(value) for value in text.split(',')]
+    else:
+      color_rgb = [int(text[ix:ix + 2], 16) for ix in (0, 2, 4)] if len(text) == 6 else []
+  except ValueError:
+    color_rgb = []
+  if len(color_rgb) != 3 or not all(0 <= value <= 255 for value in color_rgb):
+    raise argparse.ArgumentTypeError('invalid color: ' + text)
+  return color_rgb
+
+
+def _add_mode_parser(subparsers, setter):
+  '''
+  Adds the subcommand for a mode setter, with options from its parameters
+  '''
+
+  name = setter.__name__[len('set_'):-len('_mode')]
+  doc = setter.__doc__.strip().splitlines()[0]
+  parser = subparsers.add_parser(name, help=doc, description=doc)
+  code = setter.__code__
+  params = code.co_varnames[1:code.co_argcount]
+  for param, default in zip(params, setter.__defaults__):
+    option = '--' + param.replace('_rgb', '').replace('_', '-')
+    if param.startswith('color_rgb'):
+      parser.add_argument(option, dest=param, type=parse_color, default=default,
+                          help='RGB color, e.g. ff0000 (default: %(default)s)')
+    elif param == 'random':
+      parser.add_argument(option, dest=param, action='store_true', help='random colors')
+    elif param == 'direction':
+      parser.add_argument(option, dest=param, default=default, help='direction (default: %(default)s)')
+    else:
+      parser.add_argument(option, dest=param, type=int, default=default,
+                          help='0 to 100 (default: %(default)s)')
+  parser.set_defaults(command='mode', setter=setter.__name__, params=params)
+
+
+def build_parser():
+  import argparse
+  from keyboard_fusion_rgb import KeyboardFusionRGB, MODE_SETTERS
+
+  parser = argparse.ArgumentParser(prog='keyboard-fusion-rgb',
+                                   description='Control the lights of the Fusion RGB Keyboard')
+  parser.add_argument('--vendor-id', default='0x1044', help='default: %(default)s')
+  parser.add_argument('--product-id', default='0x7A3C', help='default: %(default)s')
+  parser.add_argument('--layout', default='eng_us', help='layout name or file, default: %(default)s')
+  parser.add_argument('--emulate', action='store_true', help='use the emulated keyboard (no hardware)')
+  parser.add_argument('--delay-ms', type=float, default=None,
+                      help='gap between feature reports in ms, default: 10')
+  subparsers = parser.add_subparsers(title='commands', dest='name', metavar='COMMAND')
+  subparsers.required = True
+
+  for name in MODE_SETTERS:
+    _add_mode_parser(subparsers, getattr(KeyboardFusionRGB, name))
+
+  sub = subparsers.add_parser('brightness', help='Changes the brightness of the current mode')
+  sub.add_argument('brightness', type=int, help='0 to 100')
+  sub.set_defaults(command='brightness')
+
+  sub = subparsers.add_parser('custom', help='Sets the keyboard lights to Custom mode')
+  sub.add_argument('--brightness', type=int, default=50, help='0 to 100 (default: %(default)s)')
+  sub.set_defaults(command='custom')
+
+  sub = subparsers.add_parser('frame-load', help='Sets the Custom mode frame from a file')
+  sub.add_argument('file', help='.json (key names) or raw 384 bytes')
+  sub.add_argument('--brightness', type=int, default=None, help='also sets the Custom mode')
+  sub.set_defaults(command='frame-load')
+
+  sub = subparsers.add_parser('frame-save', help='Saves the Custom mode frame to a file')
+  sub.add_argument('file', help='.json (key names) or raw 384 bytes')
+  sub.set_defaults(command='frame-save')
+
+  sub = subparsers.add_parser('status', help='Prints the current mode and brightness')
+  sub.set_defaults(command='status')
+  return parser
+
+
+def load_frame(keyboard, file_name):
+  '''
+  Reads a frame file (see the module description for the formats) and writes
+  it to the keyboard. The keys that are not in a '.json' file keep their
+  current color, KeyError for a key name that is not in the layout
+  '''
+
+  if file_name.endswith('.json'):
+    import json
+    with open(file_name) as f:
+      keyboard.set_custom_configuration(json.load(f))
+    return
+  with open(file_name, 'rb') as f:
+    keyboard.set_custom_bytes(f.read())
+
+
+def save_frame(keyboard, frame, file_name):
+  if file_name.endswith('.json'):
+    import json
+    dict_keys = frame.to_dict(keyboard.layout)
+    with open(file_name, 'w') as f:
+      json.dump(dict_keys, f, indent=1)
+  else:
+    with open(file_name, 'wb') as f:
+      f.write(frame.to_bytes())
+
+
+def main(argv = None):
+  args = build_parser().parse_args(argv)
+
+  from keyboard_fusion_rgb import KeyboardFusionRGB
+  transport = None
+  if args.emulate:
+    from keyboard_fusion_emulator import EmulatedKeyboard
+    transport = EmulatedKeyboard()
+  keyboard = KeyboardFusionRGB(args.vendor_id, args.product_id, args.layout, transport=transport)
+  if args.delay_ms is not None:
+    keyboard.delay_s = args.delay_ms / 1000
+
+  with keyboard:
+    if args.command == 'mode':
+      getattr(keyboard, args.setter)(**{param: getattr(args, param) for param in args.params})
+    elif args.command == 'brightness':
+      keyboard.set_brightness(args.brightness)
+    elif args.command == 'custom':
+      keyboard.apply_mode_configuration(0x12, args.brightness, [])
+    elif args.command == 'frame-load':
+      if args.brightness is not None:
+        keyboard.apply_mode_configuration(0x12, args.brightness, [])
+      try:
+        load_frame(keyboard, args.file)
+      except KeyError as error:
+        print('Unknown key name for layout {}: {}'.format(keyboard.layout.name, error), file=sys.stderr)
+        return 1
+    elif args.command == 'frame-save':
+      save_frame(keyboard, keyboard.get_custom_frame(), args.file)
+    elif args.command == 'status':
+      status = keyboard.get_current_status()
+      if status is None:
+        return 1
+      print('mode       : 0x{:02X}'.format(status[10]))
+      print('brightness : {:d}'.format(status[12]))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
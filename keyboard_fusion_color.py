@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Color processing for the Fusion RGB Keyboard
+
+ColorPipeline corrects the colors right before they are encoded in the
+feature reports, for the Custom mode frames and for the colors of the
+pre-programmed modes. It is a 256-entry lookup table per channel that
+combines gamma correction, white balance and software dimming, applied with
+one NumPy indexing operation to a frame or a stack of frames. The keyboard
+stores the corrected colors, the frames read from it are given back before
+the correction (see KeyboardFusionRGB.get_custom_frame()).
+
+The conversions hsv_to_rgb(), hsl_to_rgb() and rgb_to_hsv() work on whole
+frames or stacks of frames at once.
+
+Example:
+  keyboard.color_pipeline = ColorPipeline(gamma = 2.2, white_balance = [1.0, 0.85, 0.7])
+  keyboard.set_static_mode(color_rgb=[0xff, 0x80, 0x00])   # corrected color is sent
+  keyboard.color_pipeline.dimming = 0.3                     # applied to the next frames
+
+  # rainbow over the columns of the keyboard
+  geometry = keyboard.geometry
+  frame = to_uint8(hsv_to_rgb(geometry.x_norm, 1.0, 1.0))
+
+@author: Raymundo Cassani
+"""
+import hashlib
+
+import numpy as np
+
+_CHANNELS = np.arange(3)
+
+
+class ColorPipeline:
+  """
+  Per-channel 256-entry lookup table: gamma correction, white balance and dimming
+  """
+
+  def __init__(self, gamma = 1.0, white_balance = (1.0, 1.0, 1.0), dimming = 1.0):
+    '''
+    Parameters
+    ----------
+    gamma : Float or List 3 Float, optional
+      DESCRIPTION. Gamma of the correction, value_out = value_in ** gamma (in 0..1),
+      for all channels or for each of R, G, B. The default is 1.0 (no correction)
+    white_balance : List 3 Float, optional
+      DESCRIPTION. Gain 0 to 1 of R, G, B, the default is (1.0, 1.0, 1.0)
+    dimming : Float, optional
+      DESCRIPTION. Gain 0 to 1 of all the channels, used to dim the colors
+      without changing the brightness of the keyboard, the default is 1.0
+    '''
+
+    self._gamma = gamma
+    self._white_balance = white_balance
+    self._dimming = dimming
+    self._build()
+
+  def _build(self):
+    gamma = np.broadcast_to(np.asarray(self._gamma, np.float64), (3,))
+    gain = np.clip(np.asarray(self._white_balance, np.float64) * self._dimming, 0, 1)
+    values = np.arange(256) / 255
+    self.lut = np.rint(values[None, :] ** gamma[:, None] * gain[:, None] * 255).astype(np.uint8)
+    self.is_identity = bool((self.lut == np.arange(256, dtype=np.uint8)).all())
+    # changes when the tables change, e.g. to know if colors corrected before are stale
+    self.digest = hashlib.blake2b(self.lut.tobytes(), digest_size=16).digest()
+    # for each corrected value, the smallest value whose correction is the closest to it
+    error = np.abs(self.lut[:, None, :].astype(np.int16) - np.arange(256, dtype=np.int16)[None, :, None])
+    self.inverse_lut = error.argmin(axis=2).astype(np.uint8)
+
+  @property
+  def gamma(self):
+    return self._gamma
+
+  @gamma.setter
+  def gamma(self, gamma):
+    self._gamma = gamma
+    self._build()
+
+  @property
+  def white_balance(self):
+    return self._white_balance
+
+  @white_balance.setter
+  def white_balance(self, white_balance):
+    self._white_balance = white_balance
+    self._build()
+
+  @property
+  def dimming(self):
+    return self._dimming
+
+  @dimming.setter
+  def dimming(self, dimming):
+    self._dimming = dimming
+    self._build()
+
+  def apply(self, rgb):
+    '''
+    Corrects colors
+
+    Parameters
+    ----------
+    rgb : Array (..., 3) of Int (8-bit)
+      DESCRIPTION. Color, frame (128, 3) or stack of frames (T, 128, 3)
+
+    Returns
+    -------
+    rgb : Array (..., 3) of Int (8-bit)
+      DESCRIPTION. Corrected colors, a new array
+    '''
+
+    return self.lut[_CHANNELS, np.asarray(rgb, np.uint8)]
+
+  def invert(self, rgb):
+    '''
+    Undoes the correction: colors whose correction gives rgb (the closest
+    one for the values that are not a corrected value). Correcting them again
+    gives the same bytes, so a frame read from the keyboard can be written back
+
+    Parameters
+    ----------
+    rgb : Array (..., 3) of Int (8-bit)
+      DESCRIPTION. Corrected colors
+
+    Returns
+    -------
+    rgb : Array (..., 3) of Int (8-bit)
+    '''
+
+    return self.inverse_lut[_CHANNELS, np.asarray(rgb, np.uint8)]
+
+  def apply_colors(self, values):
+    '''
+    Corrects a flat list of colors [R, G, B, R, G, B, ...], as in the
+    configurations of the modes
+
+    Returns
+    -------
+    values : List of Int (8-bit)
+    '''
+
+    lut = self.lut
+    return [int(lut[ix % 3, value]) for ix, value in enumerate(values)]
+
+
+def to_uint8(rgb):
+  '''
+  Float RGB in 0..1 to 8-bit values
+  '''
+
+  return (np.clip(rgb, 0, 1) * 255 + 0.5).astype(np.uint8)
+
+
+def hsv_to_rgb(h, s, v):
+  '''
+  Vectorized HSV to RGB, all inputs in 0..1 and broadcast
+
+  Returns
+  -------
+  rgb : Array (..., 3) of Float
+    DESCRIPTION. RGB in 0..1
+  '''
+
+  h, s, v = np.broadcast_arrays(np.asarray(h, np.float64) % 1.0, s, v)
+  i = np.floor(h * 6).astype(np.int64) % 6
+  f = h * 6 - np.floor(h * 6)
+  p = v * (1 - s)
+  q = v * (1 - s * f)
+  u = v * (1 - s * (1 - f))
+  # sextant i: (R, G, B)
+  r = np.choose(i, [v, q, p, p, u, v])
+  g = np.choose(i, [u, v, v, q, p, p])
+  b = np.choose(i, [p, p, u, v, v, q])
+  return np.stack([r, g, b], axis=-1)
+
+
+def hsl_to_rgb(h, s, l):
+  '''
+  Vectorized HSL to RGB, all inputs in 0..1 and broadcast
+
+  Returns
+  -------
+  rgb : Array (..., 3) of Float
+    DESCRIPTION. RGB in 0..1
+  '''
+
+  h, s, l = np.broadcast_arrays(h, np.asarray(s, np.float64), np.asarray(l, np.float64))
+  v = l + s * np.minimum(l, 1 - l)
+  s_v = np.where(v > 0, 2 * (1 - l / np.where(v > 0, v, 1)), 0.0)
+  return hsv_to_rgb(h, s_v, v)
+
+
+def rgb_to_hsv(rgb):
+  '''
+  Vectorized RGB to HSV
+
+  Parameters
+  ----------
+  rgb : Array (..., 3)
+    DESCRIPTION. RGB in 0..1 (Float) or 0..255 (Int 8-bit)
+
+  Returns
+  -------
+  hsv : Array (..., 3) of Float
+    DESCRIPTION. Hue, saturation and value in 0..1
+  '''
+
+  rgb = np.asarray(rgb)
+  if rgb.dtype == np.uint8:
+    rgb = rgb / 255
+  r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+  v = rgb.max(axis=-1)
+  delta = v - rgb.min(axis=-1)
+  safe_delta = np.where(delta > 0, delta, 1)
+  h = np.select([delta == 0, v == r, v == g],
+                [0.0, ((g - b) / safe_delta) % 6, (b - r) / safe_delta + 2],
+                (r - g) / safe_delta + 4) / 6
+  s = np.where(v > 0, delta / np.where(v > 0, v, 1), 0.0)
+  return np.stack([h, s, v], axis=-1)
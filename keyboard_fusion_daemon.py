@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lighting daemon for the Fusion RGB Keyboard
+
+The daemon owns the keyboard and serves a compact binary protocol over a
+local Unix socket, so many clients share one HID handle. The requests of all
+the clients go through a BackgroundWriter: pending frames and brightness
+changes are coalesced into the minimum number of feature reports.
+
+Protocol, all integers are little endian:
+  Request  : opcode (1 byte), payload length (2 bytes), payload
+  Response : status (1 byte, 0 = OK), payload length (2 bytes), payload
+
+Code, Request,        Payload                                   Response payload
+0x01, Set mode,       mode, brightness, mode configuration      -
+0x02, Set brightness, brightness                                -
+0x03, Push frame,     384 bytes, Red, Green and Blue planes     -
+0x04, Read state,     -                                         264 bytes status + 384 bytes frame
+Write requests are answered when they are queued, add 0x80 to the opcode to
+be answered when they are sent to the keyboard. The frames are the color
+planes of the 128 key slots, as CustomFrame.to_bytes().
+
+Usage:
+  $ python keyboard_fusion_daemon.py [--socket PATH] [--layout eng_us]
+
+  client = KeyboardClient()
+  client.set_static_mode(color_rgb=[0xff, 0x00, 0x00])
+  client.push_frame(frame)
+
+@author: Raymundo Cassani
+"""
+import os
+import socket
+import stat
+import struct
+
+OP_SET_MODE       = 0x01
+OP_SET_BRIGHTNESS = 0x02
+OP_PUSH_FRAME     = 0x03
+OP_READ_STATE     = 0x04
+OP_WAIT           = 0x80   # flag, answer when the request was sent
+
+STATUS_OK    = 0x00
+STATUS_ERROR = 0x01
+
+_HEADER = struct.Struct('<BH')
+_FRAME_SIZE = 384
+
+
+def default_socket_path():
+  '''
+  Path of the socket: $XDG_RUNTIME_DIR/keyboard-fusion-rgb.sock, or in /tmp if not defined
+  '''
+
+  runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+  if runtime_dir:
+    return os.path.join(runtime_dir, 'keyboard-fusion-rgb.sock')
+  return '/tmp/keyboard-fusion-rgb-{:d}.sock'.format(os.getuid())
+
+
+def _recv_exact(sock, n_bytes):
+  buf = bytearray(n_bytes)
+  view = memoryview(buf)
+  n_read = 0
+  while n_read < n_bytes:
+    n = sock.recv_into(view[n_read:])
+    if n == 0:
+      raise ConnectionError('Connection closed')
+    n_read += n
+  return bytes(buf)
+
+
+def _recv_message(sock):
+  code, length = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+  return code, _recv_exact(sock, length) if length else b''
+
+
+def _send_message(sock, code, payload = b''):
+  sock.sendall(_HEADER.pack(code, len(payload)) + payload)
+
+
+def _remove_stale_socket(socket_path):
+  '''
+  Removes the socket left by a daemon that did not exit cleanly. RuntimeError
+  if a daemon answers on it, or if the path is not a socket
+  '''
+
+  try:
+    mode = os.stat(socket_path).st_mode
+  except FileNotFoundError:
+    return
+  if not stat.S_ISSOCK(mode):
+    raise RuntimeError('Not a socket: ' + socket_path)
+  probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    probe.connect(socket_path)
+  except (ConnectionRefusedError, FileNotFoundError):
+    os.unlink(socket_path)
+    return
+  finally:
+    probe.close()
+  raise RuntimeError('A daemon is already serving on ' + socket_path)
+
+
+class KeyboardDaemon:
+  """
+  Serves a KeyboardFusionRGB over a Unix socket
+  """
+
+  def __init__(self, keyboard, socket_path = None):
+    '''
+    Parameters
+    ----------
+    keyboard : KeyboardFusionRGB
+      DESCRIPTION. Keyboard owned by the daemon
+    socket_path : String, optional
+      DESCRIPTION. Path of the Unix socket, the default is default_socket_path().
+      RuntimeError if another daemon is serving on it
+    '''
+
+    import socketserver
+    from keyboard_fusion_writer import BackgroundWriter
+
+    self.keyboard = keyboard
+    self.socket_path = socket_path or default_socket_path()
+    daemon = self
+
+    class Handler(socketserver.BaseRequestHandler):
+      def handle(self):
+        while True:
+          try:
+            code, payload = _recv_message(self.request)
+          except (ConnectionError, OSError):
+            return
+          try:
+            response = daemon.handle_request(code, payload)
+            _send_message(self.request, STATUS_OK, response)
+          except Exception as error:
+            _send_message(self.request, STATUS_ERROR, str(error).encode('utf-8'))
+
+    _remove_stale_socket(self.socket_path)
+    # created without access for other users, there is no window before a chmod
+    umask = os.umask(0o077)
+    try:
+      self.server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+    finally:
+      os.umask(umask)
+    self.server.daemon_threads = True
+    self.writer = BackgroundWriter(keyboard)
+
+  def handle_request(self, code, payload):
+    '''
+    Queues a request in the writer
+
+    Returns
+    -------
+    payload : bytes
+      DESCRIPTION. Payload of the response
+    '''
+
+    opcode, wait = code & ~OP_WAIT, code & OP_WAIT
+    if opcode == OP_SET_MODE:
+      if len(payload) < 2:
+        raise ValueError('Set mode needs mode and brightness')
+      # checked here, an error in the writer thread does not reach the client
+      mode_offsets = self.writer.keyboard.mode_offsets
+      if payload[0] not in mode_offsets:
+        raise ValueError('Unknown mode 0x{:02X}'.format(payload[0]))
+      if 13 + mode_offsets[payload[0]] + len(payload) - 2 > self.writer.keyboard.data_size:
+        raise ValueError('Configuration too long for mode 0x{:02X}'.format(payload[0]))
+      future = self.writer.apply_mode_configuration(payload[0], payload[1], list(payload[2:]))
+    elif opcode == OP_SET_BRIGHTNESS:
+      if len(payload) != 1:
+        raise ValueError('Set brightness needs 1 byte')
+      future = self.writer.set_brightness(payload[0])
+    elif opcode == OP_PUSH_FRAME:
+      if len(payload) != _FRAME_SIZE:
+        raise ValueError('Frame needs {:d} bytes'.format(_FRAME_SIZE))
+      from keyboard_fusion_rgb import CustomFrame
+      future = self.writer.set_custom_frame(CustomFrame.from_bytes(payload))
+    elif opcode == OP_READ_STATE:
+      # queued after the pending requests, so the state includes them
+      status = self.writer.get_cached_status().result()
+      frame = self.writer.get_cached_custom_frame().result()
+      return bytes(status) + frame.to_bytes()
+    else:
+      raise ValueError('Unknown request 0x{:02X}'.format(code))
+    if wait:
+      future.result()
+    return b''
+
+  def serve_forever(self):
+    try:
+      self.server.serve_forever()
+    finally:
+      self.close()
+
+  def close(self):
+    self.server.server_close()
+    self.writer.close()
+    if os.path.exists(self.socket_path):
+      os.unlink(self.socket_path)
+
+
+_encoder = None
+
+def _mode_encoder():
+  '''
+  KeyboardFusionRGB used only to build the mode configurations, it is not connected
+  '''
+
+  global _encoder
+  if _encoder is None:
+    from keyboard_fusion_rgb import KeyboardFusionRGB
+    from keyboard_fusion_emulator import EmulatedKeyboard
+    _encoder = KeyboardFusionRGB(transport=EmulatedKeyboard())
+  return _encoder
+
+
+class KeyboardClient:
+  """
+  Client for KeyboardDaemon, it does not use HID nor NumPy
+  """
+
+  def __init__(self, socket_path = None, wait = False):
+    '''
+    Parameters
+    ----------
+    socket_path : String, optional
+      DESCRIPTION. Path of the Unix socket, the default is default_socket_path()
+    wait : Boolean, optional
+      DESCRIPTION. The write requests return when they are sent to the keyboard,
+      otherwise they return when they are queued, the default is False
+    '''
+
+    self.wait = wait
+    self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.sock.connect(socket_path or default_socket_path())
+
+  def close(self):
+    self.sock.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def request(self, opcode, payload = b''):
+    '''
+    Sends a request to the daemon and returns the payload of the response
+    '''
+
+    if self.wait and opcode != OP_READ_STATE:
+      opcode |= OP_WAIT
+    _send_message(self.sock, opcode, payload)
+    status, response = _recv_message(self.sock)
+    if status != STATUS_OK:
+      raise IOError(response.decode('utf-8'))
+    return response
+
+  def set_mode(self, mode, brightness, buf_mode = b''):
+    '''
+    Sets a mode with its configuration, as KeyboardFusionRGB.apply_mode_configuration()
+    '''
+
+    self.request(OP_SET_MODE, bytes([mode, brightness]) + bytes(buf_mode))
+
+  def set_brightness(self, brightness):
+    self.request(OP_SET_BRIGHTNESS, bytes([brightness]))
+
+  def set_custom_mode(self, brightness = 50):
+    self.set_mode(0x12, brightness)
+
+  def __getattr__(self, name):
+    '''
+    Mode setters with the same parameters as in KeyboardFusionRGB (e.g. set_static_mode)
+    '''
+
+    from keyboard_fusion_rgb import MODE_SETTERS
+    if name not in MODE_SETTERS:
+      raise AttributeError(name)
+    def mode_setter(*args, **kwargs):
+      mode, brightness, buf_mode, force = _mode_encoder().record_mode_call(name, *args, **kwargs)
+      self.set_mode(mode, brightness, buf_mode)
+    return mode_setter
+
+  def push_frame(self, frame):
+    '''
+    Sets the Custom mode frame
+
+    Parameters
+    ----------
+    frame : bytes, CustomFrame or Array (128, 3)
+      DESCRIPTION. RGB color for each key slot, the bytes are the color planes
+      (Red, Green, Blue) as CustomFrame.to_bytes(). Arrays are converted to
+      8-bit values, ValueError if they do not have the shape (128, 3)
+    '''
+
+    if hasattr(frame, 'to_bytes'):
+      frame = frame.to_bytes()
+    elif hasattr(frame, 'tobytes'):
+      # only with an array from the caller, so NumPy is already imported
+      import numpy as np
+      frame = np.asarray(frame, np.uint8)
+      if frame.shape != (128, 3):
+        raise ValueError('Frame must have the shape (128, 3), not {}'.format(frame.shape))
+      frame = frame.T.tobytes()
+    self.request(OP_PUSH_FRAME, bytes(frame))
+
+  def read_state(self):
+    '''
+    Returns
+    -------
+    status : bytes
+      DESCRIPTION. Current status of the keyboard (264 bytes), mode in byte 10
+      and brightness in byte 12
+    frame : bytes
+      DESCRIPTION. Custom mode frame, Red, Green and Blue planes (384 bytes),
+      CustomFrame.from_bytes() reads it
+    '''
+
+    response = self.request(OP_READ_STATE)
+    return response[:264], response[264:]
+
+
+def main(argv = None):
+  import argparse
+  from keyboard_fusion_rgb import KeyboardFusionRGB
+
+  parser = argparse.ArgumentParser(description='Lighting daemon for the Fusion RGB Keyboard')
+  parser.add_argument('--socket', default=None, help='path of the Unix socket')
+  parser.add_argument('--vendor-id', default='0x1044')
+  parser.add_argument('--product-id', default='0x7A3C')
+  parser.add_argument('--layout', default='eng_us')
+  args = parser.parse_args(argv)
+
+  keyboard = KeyboardFusionRGB(args.vendor_id, args.product_id, args.layout)
+  daemon = KeyboardDaemon(keyboard, args.socket)
+  print('Serving on ' + daemon.socket_path)
+  try:
+    daemon.serve_forever()
+  except KeyboardInterrupt:
+    pass
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Software-rendered effects for the Custom mode of the Fusion RGB Keyboard
+
+The effects are computed on the host, with the key positions of
+keyboard.geometry, as NumPy expressions over all the key slots and over a
+batch of frame times at once: render(t) returns a (T, 128, 3) uint8 array
+for the T times in t. Rendering in batches amortizes the Python overhead,
+so the effects are computed far faster than the keyboard can show them.
+
+Effects: Gradient, Wave, Ripple, Plasma, Fire, Starfield, Noise
+
+Example:
+  keyboard.set_custom_mode(brightness = 100)
+  effect = Plasma(keyboard.geometry, speed = 0.5)
+  # static frame with the dictionary API
+  keyboard.set_custom_configuration(effect.configuration(t = 0))
+  # animation, the frames are rendered 64 at a time
+  Animation(keyboard, effect.frame_fn(fps = 30), fps = 30).run(duration_s = 10)
+
+@author: Raymundo Cassani
+"""
+import numpy as np
+
+from keyboard_fusion_color import hsv_to_rgb
+
+def _as_color(color_rgb):
+  return np.asarray(color_rgb, dtype=np.float64) / 255
+
+
+def _hash_uniform(*ints, seed = 0):
+  '''
+  Deterministic pseudo-random values in [0, 1) for integer arrays (broadcast),
+  the same integers always give the same value
+  '''
+
+  h = np.uint32(seed * 0x9E3779B9 & 0xFFFFFFFF)
+  for values in ints:
+    h = h ^ np.asarray(values).astype(np.uint32)
+    h = (h ^ (h >> np.uint32(16))) * np.uint32(0x7FEB352D)
+    h = (h ^ (h >> np.uint32(15))) * np.uint32(0x846CA68B)
+    h = h ^ (h >> np.uint32(16))
+  return h.astype(np.float64) / 2.0 ** 32
+
+
+def _value_noise(t, slots, seed = 0):
+  '''
+  Smooth noise in [0, 1) for each time (T, 1) and slot (1, n): random values
+  at integer times, interpolated with smoothstep
+  '''
+
+  with np.errstate(over='ignore'):
+    t_int = np.floor(t).astype(np.int64)
+    frac = t - t_int
+    v_0 = _hash_uniform(slots, t_int, seed=seed)
+    v_1 = _hash_uniform(slots, t_int + 1, seed=seed)
+  frac = frac * frac * (3 - 2 * frac)
+  return v_0 + (v_1 - v_0) * frac
+
+
+class Effect:
+  """
+  Base class of the effects, subclasses implement _render(t)
+  """
+
+  def __init__(self, geometry):
+    '''
+    Parameters
+    ----------
+    geometry : Geometry
+      DESCRIPTION. Key positions of the layout (keyboard.geometry)
+    '''
+
+    self.geometry = geometry
+
+  def _render(self, t):
+    '''
+    Returns the RGB (T, n_keys, 3) in [0, 1] for the times t (T, 1)
+    '''
+
+    raise NotImplementedError
+
+  def render(self, t):
+    '''
+    Renders the frames for the times t
+
+    Parameters
+    ----------
+    t : Float or Array (T,) of Float
+      DESCRIPTION. Time of each frame in seconds
+
+    Returns
+    -------
+    frames : Array (T, 128, 3) of Int (8-bit)
+      DESCRIPTION. RGB for each key slot of each frame, unused slots are OFF
+    '''
+
+    t = np.atleast_1d(np.asarray(t, dtype=np.float64))[:, None]
+    frames = np.empty((t.shape[0], len(self.geometry.keys), 3), np.uint8)
+    # rounded to the nearest integer, the assignment truncates
+    frames[...] = np.clip(self._render(t), 0, 1) * 255 + 0.5
+    frames[:, ~self.geometry.used] = 0
+    return frames
+
+  def frames(self, fps, duration_s, t_start = 0.0):
+    '''
+    Renders all the frames of duration_s at fps
+
+    Returns
+    -------
+    frames : Array (T, 128, 3) of Int (8-bit)
+    '''
+
+    return self.render(t_start + np.arange(int(round(duration_s * fps))) / fps)
+
+  def frame_fn(self, fps, batch = 64):
+    '''
+    Frame generator for Animation, frame_fn(ix, t): the frames are rendered
+    batch at a time, at the times ix / fps
+
+    Parameters
+    ----------
+    fps : Float
+      DESCRIPTION. Frame rate of the Animation
+    batch : Int, optional
+      DESCRIPTION. Frames rendered at once, the default is 64
+    '''
+
+    cache = {'start': None, 'frames': None}
+
+    def frame_fn(ix, t):
+      start = cache['start']
+      if start is None or not start <= ix < start + batch:
+        cache['start'] = start = ix
+        cache['frames'] = self.render((ix + np.arange(batch)) / fps)
+      return cache['frames'][ix - start]
+
+    return frame_fn
+
+  def configuration(self, t = 0.0):
+    '''
+    Frame at time t as dictionary, for set_custom_configuration()
+
+    Returns
+    -------
+    dict_keys : Dictionary
+      DESCRIPTION. RGB color for each key name
+    '''
+
+    # same keys as get_custom_configuration()
+    rgb = self.render(t)[0].tolist()
+    return {key: rgb[slot] for key, slot in self.geometry.layout.index.items()}
+
+
+class Gradient(Effect):
+  """
+  Linear gradient between colors along a direction, scrolling with speed
+  """
+
+  def __init__(self, geometry, colors_rgb = ([0xFF, 0x00, 0x00], [0x00, 0x00, 0xFF]),
+               angle_deg = 0.0, speed = 0.0):
+    '''
+    Parameters
+    ----------
+    colors_rgb : List of List 3 Int (8-bit) RGB, optional
+      DESCRIPTION. Colors evenly spaced along the gradient, the default is red to blue
+    angle_deg : Float, optional
+      DESCRIPTION. Direction, 0 is left to right, 90 top to bottom, the default is 0
+    speed : Float, optional
+      DESCRIPTION. Scrolling in gradients per second (it wraps around), the default is 0
+    '''
+
+    super().__init__(geometry)
+    self.colors = np.array([_as_color(color) for color in colors_rgb])
+    if len(self.colors) == 1:
+      self.colors = np.repeat(self.colors, 2, axis=0)
+    angle = np.deg2rad(angle_deg)
+    position = (np.cos(angle) * geometry.x_norm + np.sin(angle) * geometry.y_norm)
+    span = np.ptp(position[geometry.used])
+    self.position = (position - position[geometry.used].min()) / (span if span > 0 else 1)
+    self.speed = speed
+
+  def _render(self, t):
+    position = self.position[None, :] - self.speed * t
+    if self.speed:
+      # wraps around without a jump: the gradient goes back to the first color
+      position = 1 - np.abs(1 - 2 * (position % 1.0))
+    scaled = np.clip(position, 0, 1) * (len(self.colors) - 1)
+    ix = np.minimum(scaled.astype(np.int64), len(self.colors) - 2)
+    frac = (scaled - ix)[..., None]
+    return self.colors[ix] * (1 - frac) + self.colors[ix + 1] * frac
+
+
+class Wave(Effect):
+  """
+  Sine wave of a color travelling along a direction
+  """
+
+  def __init__(self, geometry, color_rgb = [0x00, 0xFF, 0xFF], wavelength = 6.0, speed = 4.0,
+               angle_deg = 0.0, floor = 0.0):
+    '''
+    Parameters
+    ----------
+    color_rgb : List 3 Int (8-bit) RGB, optional
+      DESCRIPTION. Color at the crests, the default is [0x00, 0xFF, 0xFF]
+    wavelength : Float, optional
+      DESCRIPTION. Wavelength in key units, the default is 6
+    speed : Float, optional
+      DESCRIPTION. Speed in keys per second, the default is 4
+    angle_deg : Float, optional
+      DESCRIPTION. Direction of travel, 0 is to the right, the default is 0
+    floor : Float, optional
+      DESCRIPTION. Minimum intensity 0 to 1, the default is 0
+    '''
+
+    super().__init__(geometry)
+    self.color = _as_color(color_rgb)
+    angle = np.deg2rad(angle_deg)
+    self.position = np.nan_to_num(np.cos(angle) * geometry.x + np.sin(angle) * geometry.y)
+    self.wavelength = wavelength
+    self.speed = speed
+    self.floor = floor
+
+  def _render(self, t):
+    phase = 2 * np.pi * (self.position[None, :] - self.speed * t) / self.wavelength
+    intensity = self.floor + (1 - self.floor) * (0.5 + 0.5 * np.cos(phase))
+    return intensity[..., None] * self.color
+
+
+class Ripple(Effect):
+  """
+  Rings of a color expanding from a key and fading with the distance
+  """
+
+  def __init__(self, geometry, key, color_rgb = [0xFF, 0xFF, 0xFF], speed = 6.0,
+               wavelength = 3.0, decay = 6.0):
+    '''
+    Parameters
+    ----------
+    key : String
+      DESCRIPTION. Key name at the center of the ripple
+    color_rgb : List 3 Int (8-bit) RGB, optional
+      DESCRIPTION. Color of the rings, the default is white
+    speed : Float, optional
+      DESCRIPTION. Speed of the rings in keys per second, the default is 6
+    wavelength : Float, optional
+      DESCRIPTION. Distance between rings in key units, the default is 3
+    decay : Float, optional
+      DESCRIPTION. Distance in key units where the intensity falls to 1/e, the default is 6
+    '''
+
+    super().__init__(geometry)
+    self.color = _as_color(color_rgb)
+    self.distance = np.nan_to_num(geometry.distance_from(key), posinf=0.0)
+    self.speed = speed
+    self.wavelength = wavelength
+    self.decay = decay
+
+  def _render(self, t):
+    front = self.speed * t
+    distance = self.distance[None, :]
+    rings = 0.5 + 0.5 * np.cos(2 * np.pi * (distance - front) / self.wavelength)
+    intensity = rings * np.exp(-distance / self.decay) * (distance <= front)
+    return intensity[..., None] * self.color
+
+
+class Plasma(Effect):
+  """
+  Colorful plasma: the hue is a sum of sines of the position and the time
+  """
+
+  def __init__(self, geometry, speed = 0.5, scale = 0.35, saturation = 1.0):
+    '''
+    Parameters
+    ----------
+    speed : Float, optional
+      DESCRIPTION. Speed of the changes, the default is 0.5
+    scale : Float, optional
+      DESCRIPTION. Spatial frequency, the default is 0.35 (per key unit)
+    saturation : Float, optional
+      DESCRIPTION. Color saturation 0 to 1, the default is 1
+    '''
+
+    super().__init__(geometry)
+    self.x = np.nan_to_num(geometry.x) * scale
+    self.y = np.nan_to_num(geometry.y) * scale
+    self.speed = speed
+    self.saturation = saturation
+
+  def _render(self, t):
+    t = t * self.speed
+    x, y = self.x[None, :], self.y[None, :]
+    value = (np.sin(x + t) + np.sin(y + 1.3 * t) + np.sin(x + y + 0.7 * t) +
+             np.sin(np.sqrt(x * x + y * y) - 1.1 * t))
+    return hsv_to_rgb(value / 8 + 0.5, self.saturation, 1.0)
+
+
+class Fire(Effect):
+  """
+  Flames rising from the bottom row, with a black-red-yellow-white palette
+  """
+
+  palette = np.array([[0.0, 0.0, 0.0], [0.8, 0.0, 0.0], [1.0, 0.45, 0.0], [1.0, 0.9, 0.2], [1.0, 1.0, 0.8]])
+
+  def __init__(self, geometry, speed = 8.0, height = 1.0, seed = 0):
+    '''
+    Parameters
+    ----------
+    speed : Float, optional
+      DESCRIPTION. Flickering speed, changes per second, the default is 8
+    height : Float, optional
+      DESCRIPTION. Height of the flames, 1 reaches the top row, the default is 1
+    seed : Int, optional
+      DESCRIPTION. Seed of the noise, the default is 0
+    '''
+
+    super().__init__(geometry)
+    self.heat = np.clip(geometry.y_norm, 0, 1)   # 1 at the bottom row
+    self.slots = np.arange(len(geometry.keys))
+    self.speed = speed
+    self.height = height
+    self.seed = seed
+
+  def _render(self, t):
+    noise = _value_noise(t * self.speed, self.slots[None, :], self.seed)
+    heat = np.clip(self.heat[None, :] * self.height + 0.6 * (noise - 0.5) + 0.1, 0, 1)
+    scaled = heat * (len(self.palette) - 1)
+    ix = np.minimum(scaled.astype(np.int64), len(self.palette) - 2)
+    frac = (scaled - ix)[..., None]
+    return self.palette[ix] * (1 - frac) + self.palette[ix + 1] * frac
+
+
+class Starfield(Effect):
+  """
+  Stars that light up on random keys and fade out
+  """
+
+  def __init__(self, geometry, color_rgb = [0xFF, 0xFF, 0xFF], density = 0.15, twinkle_s = 1.0,
+               background_rgb = [0x00, 0x00, 0x10], seed = 0):
+    '''
+    Parameters
+    ----------
+    color_rgb : List 3 Int (8-bit) RGB, optional
+      DESCRIPTION. Color of the stars, the default is white
+    density : Float, optional
+      DESCRIPTION. Fraction of the keys with a star in each cycle, the default is 0.15
+    twinkle_s : Float, optional
+      DESCRIPTION. Duration in seconds of a star, the default is 1
+    background_rgb : List 3 Int (8-bit) RGB, optional
+      DESCRIPTION. Color of the sky, the default is dark blue
+    seed : Int, optional
+      DESCRIPTION. Seed of the random stars, the default is 0
+    '''
+
+    super().__init__(geometry)
+    self.color = _as_color(color_rgb)
+    self.background = _as_color(background_rgb)
+    self.slots = np.arange(len(geometry.keys))
+    # each key has its own phase, so the stars do not change all at once
+    self.phase = _hash_uniform(self.slots, seed=seed + 1)
+    self.density = density
+    self.twinkle_s = twinkle_s
+    self.seed = seed
+
+  def _render(self, t):
+    cycle_t = t / self.twinkle_s + self.phase[None, :]
+    cycle = np.floor(cycle_t).astype(np.int64)
+    frac = cycle_t - cycle
+    is_star = _hash_uniform(self.slots[None, :], cycle, seed=self.seed) < self.density
+    intensity = (is_star * np.sin(np.pi * frac) ** 2)[..., None]
+    return self.background * (1 - intensity) + self.color * intensity
+
+
+class Noise(Effect):
+  """
+  Independent smooth random brightness for each key
+  """
+
+  def __init__(self, geometry, color_rgb = [0xFF, 0x00, 0xFF], speed = 2.0, floor = 0.0, seed = 0):
+    '''
+    Parameters
+    ----------
+    color_rgb : List 3 Int (8-bit) RGB, optional
+      DESCRIPTION. Color at full brightness, the default is [0xFF, 0x00, 0xFF]
+    speed : Float, optional
+      DESCRIPTION. Changes per second, the default is 2
+    floor : Float, optional
+      DESCRIPTION. Minimum intensity 0 to 1, the default is 0
+    seed : Int, optional
+      DESCRIPTION. Seed of the noise, the default is 0
+    '''
+
+    super().__init__(geometry)
+    self.color = _as_color(color_rgb)
+    self.slots = np.arange(len(geometry.keys))
+    self.speed = speed
+    self.floor = floor
+    self.seed = seed
+
+  def _render(self, t):
+    noise = _value_noise(t * self.speed, self.slots[None, :], self.seed)
+    intensity = self.floor + (1 - self.floor) * noise
+    return intensity[..., None] * self.color
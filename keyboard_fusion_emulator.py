@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Software emulator of the Fusion RGB Keyboard, to be used as transport for
+KeyboardFusionRGB in machines without the physical keyboard
+
+It understands the 264-byte feature reports used by the driver:
+
+Code, Request
+0x02, Set mode
+0x82, Read current status (mode, brightness and mode configuration)
+0x8A, Clean configuration
+0x06, Write custom frame (page 1: Red and Green, page 2: Blue)
+0x86, Read custom frame
+
+@author: Raymundo Cassani
+"""
+import time
+
+class EmulatedKeyboard:
+  """
+  In-memory Fusion RGB keyboard with the same interface as the HID transport
+  """
+
+  def __init__(self, latency_s = 0.0, min_gap_s = 0.0):
+    '''
+    Parameters
+    ----------
+    latency_s : Float, optional
+      DESCRIPTION. Time in seconds that each feature report takes, the default is 0
+    min_gap_s : Float, optional
+      DESCRIPTION. Minimum time in seconds between feature reports, a report
+      that arrives earlier is rejected with IOError, the default is 0
+    '''
+
+    self.latency_s = latency_s
+    self.min_gap_s = min_gap_s
+    self.data_size = 264
+
+    # status after power on: Static mode, white, brightness 50
+    self.status = bytearray(self.data_size)
+    self.status[0:2]   = [0x07, 0x82]
+    self.status[10]    = 0x00
+    self.status[12]    = 50
+    self.status[13:17] = [0x00, 0xFF, 0xFF, 0xFF]
+
+    # custom frame, page 1: Red and Green planes, page 2: Blue plane + padding
+    self.custom_pages = {0x01: bytearray(256), 0x02: bytearray(256)}
+
+    self.response  = None
+    self.is_open   = False
+    self.last_t    = None
+    self.n_sent     = 0
+    self.n_received = 0
+    self.n_rejected = 0
+    self.n_opcodes  = {}
+
+
+  def open(self, vendor_id = None, product_id = None):
+    self.is_open = True
+
+
+  def close(self):
+    self.is_open = False
+    self.response = None
+
+
+  def disconnect(self):
+    '''
+    Emulates that the keyboard was disconnected, the open handle becomes stale
+    '''
+
+    self.is_open = False
+
+
+  def _start_report(self):
+    '''
+    Checks the handle and the time since the previous report, and waits the latency
+    '''
+
+    if not self.is_open:
+      raise IOError('Emulated keyboard is not open')
+    now = time.perf_counter()
+    if self.last_t is not None and now - self.last_t < self.min_gap_s:
+      self.n_rejected += 1
+      self.last_t = now
+      raise IOError('Report received before the minimum gap')
+    if self.latency_s > 0:
+      time.sleep(self.latency_s)
+    self.last_t = time.perf_counter()
+
+
+  def send_feature_report(self, buf_req):
+    '''
+    Receives a request and updates the state of the emulated keyboard
+
+    Returns
+    -------
+    n_bytes : Int
+      DESCRIPTION. Number of bytes written
+    '''
+
+    self._start_report()
+    buf_req = bytes(buf_req)
+    if len(buf_req) != self.data_size or buf_req[0] != 0x07:
+      raise ValueError('Invalid feature report')
+    opcode = buf_req[1]
+    page = buf_req[3]
+    self.response = None
+    if opcode == 0x02:
+      self.status[:] = buf_req
+      self.status[1] = 0x82
+    elif opcode == 0x82:
+      self.response = bytes(self.status)
+    elif opcode == 0x8A:
+      self.response = bytes([0x07]) + bytes(self.data_size - 1)
+    elif opcode == 0x06 and page in self.custom_pages:
+      self.custom_pages[page][:] = buf_req[8:]
+    elif opcode == 0x86 and page in self.custom_pages:
+      self.response = buf_req[:8] + bytes(self.custom_pages[page])
+    else:
+      raise ValueError('Unknown request 0x{:02X}'.format(opcode))
+    self.n_sent += 1
+    self.n_opcodes[opcode] = self.n_opcodes.get(opcode, 0) + 1
+    return len(buf_req)
+
+
+  def get_feature_report(self, report_num, max_length):
+    '''
+    Returns the response to the previous request
+
+    Returns
+    -------
+    buf_rsp : List of Int (8-bits)
+      DESCRIPTION. Response of the emulated keyboard
+    '''
+
+    self._start_report()
+    if self.response is None:
+      raise IOError('No response available')
+    buf_rsp = list(self.response[:max_length])
+    self.response = None
+    self.n_received += 1
+    return buf_rsp
+
+
+  def get_custom_bytes(self):
+    '''
+    Returns the 384 bytes of the custom frame: Red, Green and Blue planes
+    '''
+
+    return bytes(self.custom_pages[0x01] + self.custom_pages[0x02][:128])
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Physical geometry of the keys of the Fusion RGB Keyboard
+
+Each key has an (x, y) position (center of the key, in key units: 1 = width
+of a letter key, y grows downwards) and a row and column. The positions are
+approximate, taken from the ENG-US keyboard of the AORUS 15G. A Geometry
+maps them to the 128 key slots of a layout and precomputes the structures
+for vectorized effects: distance matrix, row and column masks, and neighbor
+index. Unused slots have no position (NaN) and an infinite distance.
+
+Example:
+  geometry = keyboard.geometry
+  # red ripple with radius 3 around 'G'
+  intensity = np.clip(1 - geometry.distance_from('G') / 3, 0, 1)
+  frame = CustomFrame((intensity[:, None] * [255, 0, 0]).astype(np.uint8))
+  # horizontal gradient
+  frame = CustomFrame((geometry.x_norm[:, None] * [0, 0, 255]).astype(np.uint8))
+
+@author: Raymundo Cassani
+"""
+import numpy as np
+
+from keyboard_fusion_layouts import get_layout
+
+# Rows of the keyboard from the top, as (key name, width in key units).
+# None is a gap. The numeric keypad starts at x = 15
+_MAIN_ROWS = [
+  [('ESC', 1), ('F1', 1), ('F2', 1), ('F3', 1), ('F4', 1), ('F5', 1), ('F6', 1), ('F7', 1),
+   ('F8', 1), ('F9', 1), ('F10', 1), ('F11', 1), ('F12', 1), ('Pause', 1), ('Del', 1)],
+  [('~', 1), ('1', 1), ('2', 1), ('3', 1), ('4', 1), ('5', 1), ('6', 1), ('7', 1),
+   ('8', 1), ('9', 1), ('0', 1), ('-', 1), ('=', 1), ('Backspace', 2)],
+  [('Tab', 1.5), ('Q', 1), ('W', 1), ('E', 1), ('R', 1), ('T', 1), ('Y', 1), ('U', 1),
+   ('I', 1), ('O', 1), ('P', 1), ('[', 1), (']', 1), ('\\', 1.5)],
+  [('Caps', 1.75), ('A', 1), ('S', 1), ('D', 1), ('F', 1), ('G', 1), ('H', 1), ('J', 1),
+   ('K', 1), ('L', 1), (';', 1), ("'", 1), ('#', 1), ('Enter', 1.25)],
+  [('Shift-L', 2.25), ('Z', 1), ('X', 1), ('C', 1), ('V', 1), ('B', 1), ('N', 1), ('M', 1),
+   (',', 1), ('.', 1), ('/', 1), ('Shift-R', 1.75), ('Up', 1)],
+  [('Ctrl-L', 1.25), ('Fn', 1), ('WinKey', 1), ('Alt-L', 1.25), ('Space', 5.5), ('Alt-R', 1),
+   ('Menu', 1), ('Ctrl-R', 1), ('Left', 1), ('Down', 1), ('Right', 1)],
+]
+
+_KEYPAD_ROWS = [
+  [('Home', 1), ('PgUp', 1), ('PgDn', 1), ('End', 1)],
+  [('NumLk', 1), ('Num-/', 1), ('Num-*', 1), ('Num--', 1)],
+  [('Num-7', 1), ('Num-8', 1), ('Num-9', 1), ('Num-+', 1)],
+  [('Num-4', 1), ('Num-5', 1), ('Num-6', 1), None],
+  [('Num-1', 1), ('Num-2', 1), ('Num-3', 1), ('Num-Enter', 1)],
+  [('Num-0', 2), ('Num-.', 1), None],
+]
+
+# keys that are two rows tall, their center is between both rows
+_TALL_KEYS = ('Num-+', 'Num-Enter')
+
+_KEYPAD_X = 15.0
+
+
+def _key_table():
+  '''
+  Position of each key name
+
+  Returns
+  -------
+  table : Dictionary
+    DESCRIPTION. key name: (x, y, row, col)
+  '''
+
+  table = {}
+  for x_start, rows in ((0.0, _MAIN_ROWS), (_KEYPAD_X, _KEYPAD_ROWS)):
+    for row, keys in enumerate(rows):
+      x = x_start
+      for key in keys:
+        if key is None:
+          x += 1
+          continue
+        name, width = key
+        y = row + 0.5 if name in _TALL_KEYS else row
+        table[name] = (x + width / 2, y, row, int(x + width / 2))
+        x += width
+  return table
+
+KEY_TABLE = _key_table()
+
+
+class Geometry:
+  """
+  Positions and spatial indices for the 128 key slots of a layout
+  """
+
+  def __init__(self, layout, neighbor_radius = 1.3):
+    '''
+    Parameters
+    ----------
+    layout : Layout or String
+      DESCRIPTION. Layout of the 128 slots (KeyboardFusionRGB.layout), or its name
+    neighbor_radius : Float, optional
+      DESCRIPTION. Maximum distance in key units between neighbors, the default
+      is 1.3 (adjacent keys, including diagonals of keys in the same column)
+    '''
+
+    self.layout = get_layout(layout)
+    self.keys = self.layout.keys
+    n_keys = len(self.keys)
+    self.used = np.array([key in KEY_TABLE for key in self.keys])
+    self.xy   = np.full((n_keys, 2), np.nan)
+    self.rows = np.full(n_keys, -1)
+    self.cols = np.full(n_keys, -1)
+    for ix_key, key in enumerate(self.keys):
+      if key in KEY_TABLE:
+        x, y, row, col = KEY_TABLE[key]
+        self.xy[ix_key] = (x, y)
+        self.rows[ix_key] = row
+        self.cols[ix_key] = col
+    self.x = self.xy[:, 0]
+    self.y = self.xy[:, 1]
+
+    # positions normalized to 0..1, 0 for the unused slots
+    x_min, x_max = np.nanmin(self.x), np.nanmax(self.x)
+    y_min, y_max = np.nanmin(self.y), np.nanmax(self.y)
+    self.x_norm = np.nan_to_num((self.x - x_min) / (x_max - x_min))
+    self.y_norm = np.nan_to_num((self.y - y_min) / (y_max - y_min))
+
+    # pairwise distances in key units, inf for the unused slots
+    delta = self.xy[:, None, :] - self.xy[None, :, :]
+    self.distances = np.nan_to_num(np.sqrt((delta ** 2).sum(axis=2)), nan=np.inf)
+
+    # masks (n_rows, 128) and (n_cols, 128), row 0 is the function keys row
+    self.n_rows = int(self.rows.max()) + 1
+    self.n_cols = int(self.cols.max()) + 1
+    self.row_masks = self.rows[None, :] == np.arange(self.n_rows)[:, None]
+    self.col_masks = self.cols[None, :] == np.arange(self.n_cols)[:, None]
+
+    # neighbors of each slot, padded with -1: (128, max number of neighbors)
+    self.neighbor_radius = neighbor_radius
+    is_neighbor = (self.distances <= neighbor_radius) & ~np.eye(n_keys, dtype=bool)
+    self.n_neighbors = is_neighbor.sum(axis=1)
+    self.neighbor_index = np.full((n_keys, max(1, self.n_neighbors.max())), -1)
+    for ix_key in np.flatnonzero(self.n_neighbors):
+      ix_neighbors = np.flatnonzero(is_neighbor[ix_key])
+      self.neighbor_index[ix_key, :len(ix_neighbors)] = ix_neighbors
+
+  def slot(self, key):
+    '''
+    Slot of a key name, KeyError if it is not in the layout
+    '''
+
+    return self.layout.index[key]
+
+  def mask(self, keys):
+    '''
+    Boolean mask (128,) with the slots of the key names
+    '''
+
+    keys = set(keys)
+    return np.array([key in keys for key in self.keys])
+
+  def distance_from(self, key):
+    '''
+    Distance (128,) in key units from a key (name or slot) to all the slots
+    '''
+
+    if not isinstance(key, (int, np.integer)):
+      key = self.slot(key)
+    return self.distances[key]
+
+  def neighbors(self, key):
+    '''
+    Slots of the neighbors of a key (name or slot)
+    '''
+
+    if not isinstance(key, (int, np.integer)):
+      key = self.slot(key)
+    return self.neighbor_index[key, :self.n_neighbors[key]]
+
+
+_geometries = {}
+
+def get_geometry(layout):
+  '''
+  Geometry of a layout (Layout or name), built once for each layout
+  '''
+
+  layout = get_layout(layout)
+  if layout not in _geometries:
+    _geometries[layout] = Geometry(layout)
+  return _geometries[layout]
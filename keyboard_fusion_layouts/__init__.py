@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Keyboard layouts of the Fusion RGB Keyboard
+
+A layout is the key name of each of the 128 key slots, defined in a text
+file (see eng_us.txt): a [slots] section with the key names, 8 slots per
+line ('N/A' for the slots not used), and a [groups] section with named
+groups of keys ('numpad = NumLk Num-/ ...'). Lines starting with '//' are
+comments.
+
+Each layout is read once per process, the first time it is used. Other
+layouts are added by dropping a file in this directory, or by giving the
+path of a file as layout.
+
+Example:
+  layout = get_layout('eng_us')
+  frame.rgb[layout.slot('A')] = [0xFF, 0x00, 0x00]
+  frame.rgb[layout.group_masks['numpad']] = [0x00, 0x00, 0xFF]
+
+@author: Raymundo Cassani
+"""
+import os
+
+LAYOUTS_DIR = os.path.dirname(os.path.abspath(__file__))
+N_SLOTS = 128
+
+
+class Layout:
+  """
+  Key names of the slots, with the name to slot index and the masks
+  """
+
+  def __init__(self, name, keys, groups = None):
+    '''
+    Parameters
+    ----------
+    name : String
+      DESCRIPTION. Name of the layout
+    keys : List of String
+      DESCRIPTION. Key name of each slot, 'N/A' for the slots not used
+    groups : Dictionary, optional
+      DESCRIPTION. Group name: list of key names, the default is None
+    '''
+
+    if len(keys) != N_SLOTS:
+      raise ValueError('Layout {} has {:d} slots, {:d} expected'.format(name, len(keys), N_SLOTS))
+    self.name = name
+    self.keys = list(keys)
+    # name: slot, 'N/A' is not included
+    self.index = {key: slot for slot, key in enumerate(self.keys) if key != 'N/A'}
+    if len(self.index) != sum(key != 'N/A' for key in self.keys):
+      raise ValueError('Layout {} has repeated key names'.format(name))
+    self.groups = dict(groups or {})
+    for group, members in self.groups.items():
+      unknown = [key for key in members if key not in self.index]
+      if unknown:
+        raise ValueError('Group {} of layout {} has unknown keys: {}'.format(group, name, unknown))
+    self._used = None
+    self._group_masks = None
+
+  def __repr__(self):
+    return 'Layout({!r}, {:d} keys)'.format(self.name, len(self.index))
+
+  def slot(self, key):
+    '''
+    Slot of a key name, KeyError if it is not in the layout
+    '''
+
+    return self.index[key]
+
+  def slots(self, keys):
+    '''
+    Slots of the key names, as Array of Int (for indexing a frame)
+    '''
+
+    import numpy as np
+    index = self.index
+    return np.fromiter((index[key] for key in keys), np.intp)
+
+  @property
+  def used(self):
+    '''
+    Boolean mask (128,) of the slots with a key
+    '''
+
+    if self._used is None:
+      import numpy as np
+      self._used = np.array([key != 'N/A' for key in self.keys])
+    return self._used
+
+  @property
+  def group_masks(self):
+    '''
+    Boolean mask (128,) of the slots of each group (e.g. 'numpad', 'f_row', 'arrows')
+    '''
+
+    if self._group_masks is None:
+      import numpy as np
+      self._group_masks = {}
+      for group, members in self.groups.items():
+        mask = np.zeros(N_SLOTS, bool)
+        mask[self.slots(members)] = True
+        self._group_masks[group] = mask
+    return self._group_masks
+
+
+def parse_layout(text, name = 'layout'):
+  '''
+  Parses the text of a layout file
+
+  Returns
+  -------
+  layout : Layout
+  '''
+
+  keys, groups = [], {}
+  section = None
+  for n_line, line in enumerate(text.splitlines(), 1):
+    line = line.strip()
+    if not line or line.startswith('//'):
+      continue
+    if line in ('[slots]', '[groups]'):
+      section = line
+    elif section == '[slots]':
+      keys.extend(line.split())
+    elif section == '[groups]':
+      tokens = line.split()
+      if len(tokens) < 2 or tokens[1] != '=':
+        raise ValueError('{}:{:d}: expected "group = key names"'.format(name, n_line))
+      groups[tokens[0]] = tokens[2:]
+    else:
+      raise ValueError('{}:{:d}: line outside of [slots] and [groups]'.format(name, n_line))
+  return Layout(name, keys, groups)
+
+
+def available_layouts():
+  '''
+  Names of the layouts in this directory
+  '''
+
+  return sorted(file_name[:-4] for file_name in os.listdir(LAYOUTS_DIR) if file_name.endswith('.txt'))
+
+
+_layouts = {}
+
+def get_layout(layout):
+  '''
+  Layout by name (e.g. 'eng_us') or path of a layout file, read once per process
+
+  Returns
+  -------
+  layout : Layout
+  '''
+
+  if isinstance(layout, Layout):
+    return layout
+  if layout not in _layouts:
+    if os.path.sep in layout or layout.endswith('.txt'):
+      path, name = layout, os.path.splitext(os.path.basename(layout))[0]
+    else:
+      path, name = os.path.join(LAYOUTS_DIR, layout + '.txt'), layout
+      if not os.path.isfile(path):
+        raise ValueError('Unknown layout {!r}, available layouts: {}'.format(
+                         layout, ', '.join(available_layouts())))
+    with open(path, encoding='utf-8') as f:
+      _layouts[layout] = parse_layout(f.read(), name)
+  return _layouts[layout]
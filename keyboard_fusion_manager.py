@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Manager for several Fusion RGB Keyboards attached to the same host
+
+All the keyboards with the vendor and product IDs are found by their HID
+path, and one KeyboardFusionRGB session is opened for each of them. The
+calls are sent to all the keyboards in parallel with a thread pool, so
+updating N keyboards takes about the time of one.
+
+Example:
+  with KeyboardManager(layout = 'eng_us') as manager:
+    manager.set_static_mode(color_rgb=[0xff, 0x00, 0x00])
+    manager.set_custom_mode(brightness = 100)
+    manager.set_custom_frame(frame, synchronized=True)
+    manager.call_each('set_custom_frame', [(frame_1,), (frame_2,)])
+
+@author: Raymundo Cassani
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from keyboard_fusion_rgb import KeyboardFusionRGB
+
+def enumerate_keyboards(vendor_id = '0x1044', product_id = '0x7A3C', interface_number = None):
+  '''
+  Finds the HID paths of the keyboards with the vendor and product IDs
+
+  Parameters
+  ----------
+  vendor_id : String, optional
+    DESCRIPTION. Vendor ID in hexadecimal, the default is '0x1044'
+  product_id : String, optional
+    DESCRIPTION. Product ID in hexadecimal, the default is '0x7A3C'
+  interface_number : Int, optional
+    DESCRIPTION. HID interface of the keyboard that receives the feature reports.
+    The default is None, the lowest interface number found is used
+
+  Returns
+  -------
+  paths : List of bytes
+    DESCRIPTION. HID path for each keyboard
+  '''
+
+  import hid
+  devices = hid.enumerate(int(vendor_id, 16), int(product_id, 16))
+  if not devices:
+    return []
+  if interface_number is None:
+    interface_number = min(device['interface_number'] for device in devices)
+  return sorted({device['path'] for device in devices
+                 if device['interface_number'] == interface_number})
+
+
+class KeyboardManager:
+  """
+  Sends the KeyboardFusionRGB calls to several keyboards in parallel
+  """
+
+  def __init__(self, keyboards = None, vendor_id = '0x1044', product_id = '0x7A3C',
+               layout = 'eng_us', **kwargs):
+    '''
+    Parameters
+    ----------
+    keyboards : List of KeyboardFusionRGB, optional
+      DESCRIPTION. Keyboards to manage. The default is None, a KeyboardFusionRGB
+      is created for each path found by enumerate_keyboards()
+    vendor_id, product_id, layout :
+      DESCRIPTION. Same as for KeyboardFusionRGB
+    kwargs :
+      DESCRIPTION. Other parameters for KeyboardFusionRGB
+    '''
+
+    if keyboards is None:
+      keyboards = [KeyboardFusionRGB(vendor_id, product_id, layout, path=path, **kwargs)
+                   for path in enumerate_keyboards(vendor_id, product_id)]
+    self.keyboards = list(keyboards)
+    self.executor = ThreadPoolExecutor(max_workers=max(1, len(self.keyboards)),
+                                       thread_name_prefix='KeyboardManager')
+
+  def __len__(self):
+    return len(self.keyboards)
+
+  def call_each(self, name, args_list, kwargs_list = None, synchronized = False):
+    '''
+    Calls the method name of each keyboard with its own arguments, in parallel
+
+    Parameters
+    ----------
+    name : String
+      DESCRIPTION. Method of KeyboardFusionRGB
+    args_list : List of Tuple
+      DESCRIPTION. Positional arguments for each keyboard
+    kwargs_list : List of Dictionary, optional
+      DESCRIPTION. Keyword arguments for each keyboard, the default is None
+    synchronized : Boolean, optional
+      DESCRIPTION. All the keyboards start the call at the same time, the default is False
+
+    Returns
+    -------
+    results : List
+      DESCRIPTION. Return value for each keyboard
+    '''
+
+    n = len(self.keyboards)
+    if kwargs_list is None:
+      kwargs_list = [{}] * n
+    if len(args_list) != n or len(kwargs_list) != n:
+      raise ValueError('One set of arguments is needed for each keyboard')
+    barrier = threading.Barrier(n, timeout=10) if synchronized and n > 1 else None
+
+    def run(keyboard, args, kwargs):
+      if barrier is not None:
+        barrier.wait()
+      return getattr(keyboard, name)(*args, **kwargs)
+
+    futures = [self.executor.submit(run, keyboard, args, kwargs)
+               for keyboard, args, kwargs in zip(self.keyboards, args_list, kwargs_list)]
+    return [future.result() for future in futures]
+
+  def call(self, name, *args, synchronized = False, **kwargs):
+    '''
+    Calls the method name with the same arguments in all the keyboards, in parallel
+    '''
+
+    n = len(self.keyboards)
+    return self.call_each(name, [args] * n, [kwargs] * n, synchronized)
+
+  def __getattr__(self, name):
+    '''
+    KeyboardFusionRGB methods sent to all the keyboards, they return a list
+    with the result for each keyboard. The keyword synchronized=True makes
+    all the keyboards start the call at the same time
+    '''
+
+    if name.startswith('_') or not callable(getattr(KeyboardFusionRGB, name, None)):
+      raise AttributeError(name)
+    def method(*args, synchronized = False, **kwargs):
+      return self.call(name, *args, synchronized=synchronized, **kwargs)
+    return method
+
+  def open(self):
+    self.call('open')
+    return self
+
+  def close(self):
+    self.call('close')
+    self.executor.shutdown()
+
+  def __enter__(self):
+    return self.open()
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
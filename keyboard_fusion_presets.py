@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compiled preset store for the Fusion RGB Keyboard
+
+A preset is a named profile, a mode with its parameters or a Custom mode
+frame with its brightness, compiled once into the feature reports that set
+it. The store keeps the reports in a compact binary file, and applying a
+preset only sends the cached reports (the ones the shadow copy shows are
+not already in the keyboard): no mode logic, NumPy or dictionaries.
+
+Each preset also keeps its source, so it is compiled again when the store
+is opened for a different layout (the layout hash does not match), or when
+keyboard.color_pipeline (applied when compiling) changed: the content hash
+includes the digest of its tables, and apply() compiles all the presets
+again if the pipeline is not the one they were compiled with.
+
+File format, all integers are little endian:
+  Header : magic b'KFPRESET' (8 bytes), version (2 bytes), number of presets (4 bytes)
+  Preset : name length (2 bytes), name (UTF-8), layout hash (16 bytes),
+           content hash (16 bytes), source length (4 bytes), source (JSON, UTF-8),
+           number of reports (1 byte), reports (264 bytes each)
+
+Example:
+  store = PresetStore('presets.kfp', keyboard)
+  store.add_mode('alert', 'set_static_mode', color_rgb=[0xff, 0x00, 0x00], brightness = 100)
+  store.add_custom('typing', dict_keys, brightness = 80)
+  store.apply('typing')
+
+@author: Raymundo Cassani
+"""
+import hashlib
+import json
+import os
+import struct
+
+from keyboard_fusion_rgb import CustomFrame, MODE_SETTERS, _CLEAN_REQUEST, _CUSTOM_WRITE_1, _CUSTOM_WRITE_2
+
+MAGIC   = b'KFPRESET'
+VERSION = 1
+
+_HEADER = struct.Struct('<8sHI')
+_REPORT_SIZE = 264
+
+
+def layout_hash(keys):
+  '''
+  Hash (16 bytes) of the key name of each slot
+  '''
+
+  return hashlib.blake2b('\n'.join(keys).encode('utf-8'), digest_size=16).digest()
+
+
+def _pipeline_digest(keyboard):
+  '''
+  Digest of the tables of keyboard.color_pipeline, zeros if there is no correction
+  '''
+
+  pipeline = keyboard._active_pipeline()
+  return bytes(16) if pipeline is None else pipeline.digest
+
+
+def _content_hash(source, pipeline_digest):
+  source_bytes = json.dumps(source, sort_keys=True).encode('utf-8')
+  return hashlib.blake2b(source_bytes + pipeline_digest, digest_size=16).digest()
+
+
+def _mode_report(keyboard, mode, brightness, buf_mode):
+  '''
+  Set mode request as built by keyboard.build_mode_request(), without using
+  its buffers
+  '''
+
+  buf_mode = keyboard._corrected_mode_config(mode, buf_mode)
+  buf_req = bytearray(keyboard.data_size)
+  buf_req[0:2] = [0x07, 0x02]  # instructions to set mode
+  buf_req[10]  = mode          # mode code
+  buf_req[12]  = brightness    # brightness
+  start = 13 + keyboard.mode_offsets[mode]
+  buf_req[start:start + len(buf_mode)] = bytes(buf_mode)
+  return bytes(buf_req)
+
+
+def _frame_reports(keyboard, frame):
+  '''
+  Custom mode frame requests (page 1 and 2) with keyboard.color_pipeline applied
+  '''
+
+  pipeline = keyboard._active_pipeline()
+  if pipeline is not None:
+    frame = CustomFrame(pipeline.apply(frame.rgb))
+  planes = frame.to_bytes()
+  return [_CUSTOM_WRITE_1 + planes[:256],
+          _CUSTOM_WRITE_2 + planes[256:] + bytes(128)]
+
+
+class PresetStore:
+  """
+  Named presets compiled to feature reports, saved in a file
+  """
+
+  def __init__(self, path, keyboard):
+    '''
+    Parameters
+    ----------
+    path : String
+      DESCRIPTION. Preset file, it is read if it exists
+    keyboard : KeyboardFusionRGB
+      DESCRIPTION. Keyboard used to compile and apply the presets
+    '''
+
+    self.path = path
+    self.keyboard = keyboard
+    self.layout_hash = layout_hash(keyboard.keys)
+    self.pipeline_digest = _pipeline_digest(keyboard)   # pipeline of the compiled reports
+    self.presets = {}   # name: [source, content hash, reports]
+    self.n_recompiled = 0
+    if os.path.exists(path):
+      self.load()
+
+  def names(self):
+    return list(self.presets)
+
+  def __contains__(self, name):
+    return name in self.presets
+
+  def compile(self, source):
+    '''
+    Compiles a preset source into its feature reports
+
+    Parameters
+    ----------
+    source : Dictionary
+      DESCRIPTION. {'setter': 'set_static_mode', 'params': {...}} for a mode, or
+      {'brightness': 80, 'keys': {key name: RGB}} or {'brightness': 80, 'slots': [RGB] * 128}
+      for a Custom mode frame
+
+    Returns
+    -------
+    reports : List of bytes
+      DESCRIPTION. Cleaning, set mode, and frame (page 1 and 2) requests. The
+      keyboard and its shadow copy are not changed
+    '''
+
+    kb = self.keyboard
+    if 'setter' in source:
+      if source['setter'] not in MODE_SETTERS:
+        raise ValueError('Unknown mode setter: ' + source['setter'])
+      mode, brightness, buf_mode, _ = kb.record_mode_call(source['setter'], **source['params'])
+      return [_CLEAN_REQUEST, _mode_report(kb, mode, brightness, buf_mode)]
+    if 'keys' in source:
+      # keys that are not in the dictionary are OFF
+      frame = CustomFrame.from_dict(source['keys'], kb.layout)
+    else:
+      frame = CustomFrame(source['slots'])
+    return [_CLEAN_REQUEST, _mode_report(kb, 0x12, source['brightness'], [])] + _frame_reports(kb, frame)
+
+  def _add(self, name, source, save):
+    self._check_pipeline(save)
+    self.presets[name] = [source, _content_hash(source, self.pipeline_digest), self.compile(source)]
+    if save:
+      self.save()
+
+  def add_mode(self, name, setter, save = True, **params):
+    '''
+    Adds a mode preset
+
+    Parameters
+    ----------
+    name : String
+      DESCRIPTION. Name of the preset
+    setter : String
+      DESCRIPTION. Mode setter, e.g. 'set_static_mode'
+    save : Boolean, optional
+      DESCRIPTION. Saves the store, the default is True
+    params :
+      DESCRIPTION. Parameters of the setter
+    '''
+
+    self._add(name, {'setter': setter, 'params': params}, save)
+
+  def add_custom(self, name, frame, brightness = 50, save = True):
+    '''
+    Adds a Custom mode preset
+
+    Parameters
+    ----------
+    name : String
+      DESCRIPTION. Name of the preset
+    frame : Dictionary, CustomFrame or Array (128, 3) of Int (8-bit)
+      DESCRIPTION. RGB color for each key name, or for each key slot
+    brightness : Int (8-bit), optional
+      DESCRIPTION. Brightness level 0 to 100, the default is 50
+    save : Boolean, optional
+      DESCRIPTION. Saves the store, the default is True
+    '''
+
+    if isinstance(frame, dict):
+      source = {'brightness': brightness, 'keys': {key: list(map(int, rgb)) for key, rgb in frame.items()
+                                                    if key != 'N/A'}}
+    else:
+      if not isinstance(frame, CustomFrame):
+        frame = CustomFrame(frame)
+      source = {'brightness': brightness, 'slots': frame.rgb.tolist()}
+    self._add(name, source, save)
+
+  def remove(self, name, save = True):
+    del self.presets[name]
+    if save:
+      self.save()
+
+  def recompile(self):
+    '''
+    Compiles all the presets again from their sources
+    '''
+
+    self.pipeline_digest = _pipeline_digest(self.keyboard)
+    for preset in self.presets.values():
+      preset[1] = _content_hash(preset[0], self.pipeline_digest)
+      preset[2] = self.compile(preset[0])
+    self.n_recompiled += len(self.presets)
+
+  def _check_pipeline(self, save = True):
+    '''
+    Compiles all the presets again if keyboard.color_pipeline changed since
+    they were compiled (e.g. it was replaced, or its dimming changed)
+    '''
+
+    if _pipeline_digest(self.keyboard) != self.pipeline_digest:
+      self.recompile()
+      if save:
+        self.save()
+
+  def apply(self, name, force = False):
+    '''
+    Sets a preset by sending its compiled reports, the ones already in the
+    keyboard (according to the shadow copy) are skipped
+
+    Parameters
+    ----------
+    name : String
+      DESCRIPTION. Name of the preset
+    force : Boolean, optional
+      DESCRIPTION. Sends all the reports, the default is False
+
+    Returns
+    -------
+    n_sent : Int
+      DESCRIPTION. Number of requests sent
+    '''
+
+    kb = self.keyboard
+    self._check_pipeline()
+    clean, mode_request, *frame_requests = self.presets[name][2]
+    n_sent = 0
+    # same rules as for the requests built by the driver
+    is_needed, needs_clean = kb._mode_request_needed(mode_request, force)
+    if is_needed:
+      if needs_clean:
+        kb.write_keyboard_request(clean, has_rsp=True)
+        n_sent += 1
+      kb.write_keyboard_request(mode_request)
+      n_sent += 1
+    for buf_req in frame_requests:
+      if kb._custom_request_needed(buf_req, force):
+        kb.write_keyboard_request(buf_req)
+        n_sent += 1
+    return n_sent
+
+  def save(self):
+    '''
+    Writes the store to its file, the previous file is replaced at the end
+    '''
+
+    tmp_path = self.path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+      f.write(_HEADER.pack(MAGIC, VERSION, len(self.presets)))
+      for name, (source, content_hash, reports) in self.presets.items():
+        name_bytes = name.encode('utf-8')
+        source_bytes = json.dumps(source, sort_keys=True).encode('utf-8')
+        f.write(struct.pack('<H', len(name_bytes)) + name_bytes)
+        f.write(self.layout_hash + content_hash)
+        f.write(struct.pack('<I', len(source_bytes)) + source_bytes)
+        f.write(struct.pack('<B', len(reports)) + b''.join(reports))
+    os.replace(tmp_path, self.path)
+
+  def load(self):
+    '''
+    Reads the store from its file. The presets compiled for another layout,
+    or whose content hash does not match (e.g. another color pipeline), are
+    compiled again (and saved)
+    '''
+
+    with open(self.path, 'rb') as f:
+      data = f.read()
+    magic, version, n_presets = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+      raise ValueError('Not a preset file: ' + self.path)
+    offset = _HEADER.size
+    n_stale = 0
+    self.presets = {}
+    self.pipeline_digest = _pipeline_digest(self.keyboard)
+    for _ in range(n_presets):
+      n_name, = struct.unpack_from('<H', data, offset)
+      offset += 2
+      name = data[offset:offset + n_name].decode('utf-8')
+      offset += n_name
+      stored_layout_hash, content_hash = data[offset:offset + 16], data[offset + 16:offset + 32]
+      offset += 32
+      n_source, = struct.unpack_from('<I', data, offset)
+      offset += 4
+      source = json.loads(data[offset:offset + n_source].decode('utf-8'))
+      offset += n_source
+      n_reports = data[offset]
+      offset += 1
+      reports = [data[offset + ix * _REPORT_SIZE:offset + (ix + 1) * _REPORT_SIZE] for ix in range(n_reports)]
+      offset += n_reports * _REPORT_SIZE
+      if stored_layout_hash != self.layout_hash or content_hash != _content_hash(source, self.pipeline_digest):
+        content_hash, reports = _content_hash(source, self.pipeline_digest), self.compile(source)
+        n_stale += 1
+      self.presets[name] = [source, content_hash, reports]
+    self.n_recompiled += n_stale
+    if n_stale:
+      self.save()
@@ -11,21 +11,360 @@ PRODUCT ID = 0x7A3C
 
 @author: Raymundo Cassani
 """
-import hid
+import importlib
 import time
-import numpy as np
+
+from keyboard_fusion_layouts import get_layout
+
+class _LazyModule:
+  '''
+  Module imported on its first use. NumPy is only needed for the Custom mode
+  frames, so it is not loaded to set the other modes (e.g. from the command line)
+  '''
+
+  def __init__(self, name, alias):
+    self._name  = name
+    self._alias = alias
+
+  def __getattr__(self, attr):
+    module = importlib.import_module(self._name)
+    globals()[self._alias] = module   # next uses go directly to the module
+    return getattr(module, attr)
+
+np = _LazyModule('numpy', 'np')
+
+class HIDTransport:
+  '''
+  Transport for the physical keyboard through cython-hidapi.
+
+  Any object with the methods open(), close(), send_feature_report() and
+  get_feature_report() can be used as transport by KeyboardFusionRGB,
+  see keyboard_fusion_emulator.EmulatedKeyboard for a software keyboard
+  '''
+
+  def __init__(self, path = None):
+    '''
+    Parameters
+    ----------
+    path : bytes, optional
+      DESCRIPTION. HID path of the keyboard (see hid.enumerate()), used to
+      select one of several identical keyboards. The default is None, the
+      first keyboard with the vendor and product IDs is used
+    '''
+
+    import hid # imported here so other transports do not require hidapi
+    self.device = hid.device()
+    self.path = path
+
+  def open(self, vendor_id, product_id):
+    if self.path is not None:
+      return self.device.open_path(self.path)
+    return self.device.open(vendor_id, product_id)
+
+  def close(self):
+    self.device.close()
+
+  def send_feature_report(self, buf_req):
+    return self.device.send_feature_report(buf_req)
+
+  def get_feature_report(self, report_num, max_length):
+    return self.device.get_feature_report(report_num, max_length)
+
+
+class Pacer:
+  '''
+  Paces the feature reports sent to the keyboard.
+
+  Modes:
+    'deadline' : the next report waits only for the time left until the gap
+                 after the previous report is completed (default)
+    'sleep'    : sleeps the full gap after every report
+  After an error the gap is increased (back-off) and it goes back to the
+  base gap after a number of consecutive successful reports
+  '''
+
+  def __init__(self, gap_s = 0.01, mode = 'deadline', max_gap_s = 0.2, backoff = 2.0, recover_after = 20):
+    self.gap_s         = gap_s   # base gap in seconds
+    self.current_gap_s = gap_s   # gap in use, >= gap_s after errors
+    self.mode          = mode
+    self.max_gap_s     = max_gap_s
+    self.backoff       = backoff
+    self.recover_after = recover_after
+    self.next_t        = 0.0     # earliest time for the next report
+    self.n_success     = 0
+    self.slept_s       = 0.0     # total time sleeping between reports
+
+  def set_gap(self, gap_s):
+    self.gap_s = gap_s
+    self.current_gap_s = gap_s
+
+  def remaining(self):
+    '''
+    Time in seconds until the gap from the previous report is completed
+    '''
+
+    return self.next_t - time.perf_counter()
+
+  def wait(self):
+    '''
+    Called before a report, waits until the gap from the previous report is completed
+    '''
+
+    delay = self.remaining()
+    if delay > 0:
+      time.sleep(delay)
+      self.slept_s += delay
+
+  def done(self):
+    '''
+    Called after a successful report
+    '''
+
+    if self.current_gap_s > self.gap_s:
+      self.n_success += 1
+      if self.n_success >= self.recover_after:
+        self.current_gap_s = max(self.gap_s, self.current_gap_s / self.backoff)
+        self.n_success = 0
+    if self.mode == 'sleep':
+      time.sleep(self.current_gap_s)
+      self.slept_s += self.current_gap_s
+    else:
+      self.next_t = time.perf_counter() + self.current_gap_s
+
+  def error(self):
+    '''
+    Called after a failed report, increases the gap
+    '''
+
+    self.current_gap_s = min(self.max_gap_s, max(self.current_gap_s, 0.001) * self.backoff)
+    self.n_success = 0
+    self.next_t = time.perf_counter() + self.current_gap_s
+
+
+# methods that set the modes 0x00 to 0x11
+MODE_SETTERS = ('set_static_mode', 'set_breathing_mode', 'set_flow_mode', 'set_firework_mode',
+                'set_ripple_mode', 'set_rain_mode', 'set_cycling_mode', 'set_trigger_mode',
+                'set_pulse_mode', 'set_radar_mode', 'set_star_mode', 'set_wave_mode',
+                'set_cross_mode', 'set_dragonstrike_mode', 'set_bloom_mode', 'set_spiral_mode',
+                'set_merge_mode', 'set_crash_mode')
+
+# headers of the requests for the Custom mode frames (page 1 and 2)
+_CUSTOM_WRITE_1 = bytes([0x07, 0x06, 0x00, 0x01, 0x00, 0x00, 0x00, 0x00])
+_CUSTOM_WRITE_2 = bytes([0x07, 0x06, 0x00, 0x02, 0x00, 0x00, 0x00, 0x00])
+
+# requests without variable bytes (264 bytes), built once
+_STATUS_REQUEST = bytes([0x07, 0x82]) + bytes(262)
+_CLEAN_REQUEST  = bytes([0x07, 0x8A]) + bytes(262)
+_CUSTOM_READ_1  = bytes([0x07, 0x86, 0x00, 0x01]) + bytes(260)
+_CUSTOM_READ_2  = bytes([0x07, 0x86, 0x00, 0x02]) + bytes(260)
+
+
+class CustomFrame:
+  '''
+  Light configuration for the Custom mode: RGB color of the 128 key slots,
+  stored in a contiguous (128, 3) uint8 array.
+
+  In the feature reports the colors are sent as planes: the 128 Red values,
+  the 128 Green values and then the 128 Blue values. Report 1 carries the
+  Red and Green planes, and report 2 the Blue plane.
+  '''
+
+  n_keys = 128
+
+  def __init__(self, rgb = None):
+    '''
+    Parameters
+    ----------
+    rgb : Array (128, 3) or (384,) of Int (8-bit), optional
+      DESCRIPTION. RGB color for each key slot, the default is all keys OFF
+    '''
+
+    if rgb is None:
+      self.rgb = np.zeros((self.n_keys, 3), np.uint8)
+    else:
+      self.rgb = np.ascontiguousarray(rgb, dtype=np.uint8).reshape(self.n_keys, 3)
+
+  @classmethod
+  def from_dict(cls, dict_keys, layout, base = None):
+    '''
+    Creates a frame from a dictionary with the RGB color for each key name,
+    layout is the Layout of the key names (e.g. KeyboardFusionRGB.layout).
+    The slots not in the dictionary, including the unused 'N/A' slots, keep
+    their color in base (CustomFrame), or are OFF if base is None.
+    KeyError for a key name that is not in the layout
+    '''
+
+    frame = cls() if base is None else base.copy()
+    index = layout.index
+    for key, color_rgb in dict_keys.items():
+      if key != 'N/A':
+        frame.rgb[index[key]] = color_rgb
+    return frame
+
+  def to_dict(self, layout):
+    '''
+    Returns a dictionary with the RGB color (List 3 Int) for each key name of
+    the layout, the unused 'N/A' slots are not included (see to_bytes() for all the slots)
+    '''
+
+    rgb = self.rgb.tolist()
+    return {key: rgb[slot] for key, slot in layout.index.items()}
+
+  @classmethod
+  def from_bytes(cls, buf):
+    '''
+    Creates a frame from the 384 bytes of the color planes (Red, Green, Blue)
+    '''
+
+    planes = np.frombuffer(buf, np.uint8, 3 * cls.n_keys).reshape(3, cls.n_keys)
+    return cls(planes.T)
+
+  def to_bytes(self):
+    '''
+    Returns the 384 bytes of the color planes (Red, Green, Blue)
+    '''
+
+    return self.rgb.T.tobytes()
+
+  @classmethod
+  def decode_reports(cls, buf_rsp_1, buf_rsp_2):
+    '''
+    Creates a frame from the two responses to the 0x86 requests
+    '''
+
+    return cls.from_bytes(bytes(buf_rsp_1[8:264]) + bytes(buf_rsp_2[8:136]))
+
+  def copy(self):
+    return CustomFrame(self.rgb.copy())
+
+  def __eq__(self, other):
+    return isinstance(other, CustomFrame) and np.array_equal(self.rgb, other.rgb)
+
+
+class Batch:
+  '''
+  Transaction created with KeyboardFusionRGB.batch()
+  '''
+
+  def __init__(self, keyboard):
+    self.keyboard  = keyboard
+    self.calls     = []   # recorded calls
+    self.n_reports = 0    # feature reports sent at commit
+    self.n_saved   = 0    # feature reports saved with respect to sending each call
+
+  def __enter__(self):
+    if self.keyboard._capture is not None:
+      raise RuntimeError('Nested batch() is not supported')
+    self.keyboard._capture = self.calls
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.keyboard._capture = None
+    if exc_type is None:
+      self.commit()
+
+  def _send(self, calls):
+    '''
+    Sends the calls to the keyboard, merging them into their final state
+
+    Returns
+    -------
+    n_reports : Int
+      DESCRIPTION. Number of feature reports sent and received
+    '''
+
+    kb = self.keyboard
+    n_start = kb.n_reports
+    mode_call, brightness = None, None
+    frame, updates, force = None, [], False   # last frame and the dictionaries after it
+    for call in calls:
+      if call[0] == 'mode':
+        mode_call, brightness = list(call[1:]), None
+      elif call[0] == 'brightness':
+        brightness = call[1]
+      elif call[0] == 'frame':
+        frame, updates, force = call[1], [], call[2]
+      else:
+        updates.append(call[1])
+        force = force or call[2]
+    if mode_call is not None:
+      if brightness is not None:
+        mode_call[1] = brightness
+      kb.apply_mode_configuration(*mode_call)
+    elif brightness is not None:
+      kb.set_brightness(brightness)
+    if updates:
+      # the current frame is read now (if unknown), and counted in the reports of the batch
+      if frame is None:
+        frame = kb.get_cached_custom_frame()
+      for dict_keys in updates:
+        frame = CustomFrame.from_dict(dict_keys, kb.layout, base=frame)
+    if frame is not None:
+      kb.set_custom_frame(frame, force)
+    return kb.n_reports - n_start
+
+  def _count_unbatched(self):
+    '''
+    Number of feature reports that the calls would send one by one,
+    obtained with a dry run on the shadow copy
+    '''
+
+    kb = self.keyboard
+    state = (kb.status, kb.status_t, kb.mode_request, dict(kb.custom_pages),
+             dict(kb.custom_t), kb._custom_source, kb.n_reports)
+    kb._dry_run = True
+    try:
+      for call in self.calls:
+        if call[0] == 'mode':
+          kb.apply_mode_configuration(*call[1:])
+        elif call[0] == 'brightness':
+          kb.set_brightness(call[1])
+        elif call[0] == 'frame':
+          kb.set_custom_frame(*call[1:])
+        else:
+          kb.set_custom_configuration(*call[1:])
+      return kb.n_reports - state[-1]
+    finally:
+      kb._dry_run = False
+      (kb.status, kb.status_t, kb.mode_request, kb.custom_pages,
+       kb.custom_t, kb._custom_source, kb.n_reports) = state
+
+  def commit(self):
+    '''
+    Sends the recorded calls, it is called at the end of the with block
+
+    Returns
+    -------
+    n_saved : Int
+      DESCRIPTION. Feature reports saved with respect to sending each call
+    '''
+
+    n_unbatched = self._count_unbatched()
+    self.n_reports = self._send(self.calls)
+    self.n_saved = max(0, n_unbatched - self.n_reports)
+    self.calls.clear()
+    return self.n_saved
+
 
 class KeyboardFusionRGB:
   """
   Class to control the RGB lights of the AOURS Fusion RGB Keyboard
   """
 
-  def __init__(self, vendor_id = '0x1044', product_id = '0x7A3C', layout = 'eng_us'):
+  def __init__(self, vendor_id = '0x1044', product_id = '0x7A3C', layout = 'eng_us', persistent = True,
+               transport = None, pacing = 'deadline', cache_ttl_s = 1.0, always_clean = False,
+               path = None):
 
     self.vendor_id  = int(vendor_id,  16)
     self.product_id = int(product_id, 16)
 
-    self.delay_s   = 0.01   # delay in seconds
+    # if True the HID handle is kept open across requests (session mode),
+    # if False it is opened and closed around every feature report
+    self.persistent = persistent
+    self.is_open    = False
+
+    self.pacer     = Pacer(0.01, pacing)  # gap of 10 ms between reports
+    self.max_retries = 2    # retries for a failed report
     self.data_size = 264    # number of bytes of the feature report
     self.n_keys    = 128    # number of keys for the custom lights
 
@@ -56,64 +395,83 @@ class KeyboardFusionRGB:
                          0x0B:48, 0x0C:54, 0x0D:59, 0x0E:68, 0x0F:76,
                          0x10:78, 0x11:86, 0x12:0}
 
-    # Key order for the ENG-US keyboard, only 101 keys are used
-    # the key order may change for other keyboard layouts
-    eng_us_keys = ['N/A', 'N/A', 'N/A', 'N/A', 'Ctrl-R', 'PgUp', 'Ctrl-L', 'F5',
-                   'Q', 'Tab', 'A', 'ESC', 'Z', 'N/A', '~', '1',
-                   'W', 'Caps', 'S', 'N/A', 'X', 'N/A', 'F1', '2',
-                   'E', 'F3', 'D', 'F4', 'C', 'N/A', 'F2', '3',
-                   'R', 'T', 'F', 'G', 'V', 'B', '5', '4',
-                   'U', 'Y', 'J', 'H', 'M', 'N', '6', '7',
-                   'I', ']', 'K', 'F6', ',', 'N/A', '=', '8',
-                   'O', 'F7', 'L', 'N/A', '.', 'Menu', 'F8', '9',
-                   'P', '[', ';', "'", 'N/A', '/', '-', '0',
-                   'N/A', 'N/A', 'N/A', 'Alt-L', 'N/A', 'Alt-R', 'N/A', 'Pause',
-                   'N/A', 'Backspace', '\\', 'F11', 'Enter', 'F12', 'F9', 'F10',
-                   'Num-7', 'Num-4', 'Num-1', 'Space', 'NumLk', 'Down', 'Home', 'N/A',
-                   'Num-8', 'Num-5', 'Num-2', 'Num-0', 'Num-/', 'Right', 'N/A', 'Del',
-                   'Num-9', 'Num-6', 'Num-3', 'Num-.', 'Num-*', 'Num--', 'N/A', 'PgDn',
-                   'Num-+', 'N/A', 'Num-Enter', 'Up', 'N/A', 'Left', 'N/A', 'End',
-                   'N/A', 'Shift-L', 'Shift-R', 'N/A', 'WinKey', 'Fn', 'N/A', 'N/A']
-
-    # Key order for the ENG-UK keyboard, only 101 keys are used
-    eng_uk_keys = ['N/A', 'N/A', 'N/A', 'N/A', 'Ctrl-R', 'PgUp', 'Ctrl-L', 'F5',
-                   'Q', 'Tab', 'A', 'ESC', 'Z', 'N/A', '~', '1',
-                   'W', 'Caps', 'S', 'N/A', 'X', 'N/A', 'F1', '2',
-                   'E', 'F3', 'D', 'F4', 'C', 'N/A', 'F2', '3',
-                   'R', 'T', 'F', 'G', 'V', 'B', '5', '4',
-                   'U', 'Y', 'J', 'H', 'M', 'N', '6', '7',
-                   'I', ']', 'K', 'F6', ',', 'N/A', '=', '8',
-                   'O', 'F7', 'L', 'N/A', '.', 'Menu', 'F8', '9',
-                   'P', '[', ';', "'", '#', '/', '-', '0',
-                   'N/A', 'N/A', 'N/A', 'Alt-L', 'N/A', 'Alt-R', 'N/A', 'Pause',
-                   'N/A', 'Backspace', 'N/A', 'F11', 'Enter', 'F12', 'F9', 'F10',
-                   'Num-7', 'Num-4', 'Num-1', 'Space', 'NumLk', 'Down', 'Home', 'N/A',
-                   'Num-8', 'Num-5', 'Num-2', 'Num-0', 'Num-/', 'Right', 'N/A', 'Del',
-                   'Num-9', 'Num-6', 'Num-3', 'Num-.', 'Num-*', 'Num--', 'N/A', 'PgDn',
-                   'Num-+', 'N/A', 'Num-Enter', 'Up', 'N/A', 'Left', 'N/A', 'End',
-                   'N/A', 'Shift-L', 'Shift-R', 'N/A', 'WinKey', 'Fn', 'N/A', 'N/A']
-
-    # for now only ENG-US and ENG-UK layouts are supported
-    if layout == 'eng_us':
-      self.keys = eng_us_keys
-    elif layout == 'eng_uk':
-      self.keys = eng_uk_keys
-    else:
-      self.keys = eng_us_keys
-
-    # empty HID device
-    self.hid_kb = hid.device()
+    # number of colors (RGB) at the end of the configuration of each mode
+    self.mode_n_colors = {0x00:1, 0x01:1, 0x02:0, 0x03:1, 0x04:1, 0x05:1,
+                          0x06:0, 0x07:1, 0x08:1, 0x09:1, 0x0A:1,
+                          0x0B:1, 0x0C:1, 0x0D:2, 0x0E:2, 0x0F:0,
+                          0x10:2, 0x11:2, 0x12:0}
+
+    # Key name of each of the 128 slots, the key order may change for other
+    # keyboard layouts (ENG-US and ENG-UK: 101 keys used). The layouts are
+    # defined in keyboard_fusion_layouts/*.txt and read once per process,
+    # layout can also be the path of a layout file. Unknown layouts raise ValueError
+    self.layout = get_layout(layout)
+    self.keys = self.layout.keys
+
+    # Shadow copy of the keyboard state, updated with every successful request:
+    #   status       : last known status (response to 0x82), it contains mode,
+    #                  brightness and mode configuration
+    #   custom_pages : last known requests for the Custom mode frame (page 1 and 2)
+    # None if the content in the keyboard is unknown. Entries older than
+    # cache_ttl_s seconds are read again from the keyboard (None = never), so
+    # changes by other means (another instance, the daemon or the vendor tool)
+    # are not overwritten with an old state
+    self.cache_ttl_s = cache_ttl_s
+    self.invalidate_cache()
+
+    # if False, the cleaning command is only sent when the mode changes
+    self.always_clean = always_clean
+
+    # list where the mode, brightness and frame calls are recorded instead of
+    # sent (see batch()), None to send them
+    self._capture = None
+    # if True the requests are only counted and tracked, nothing is sent
+    self._dry_run = False
+    self.n_reports = 0   # feature reports sent and received
+
+    # preallocated requests, only their variable bytes are patched in each call:
+    #   set mode (0x02), one per mode: [bytearray, memoryview, config start, config length]
+    #   Custom mode frame (0x06) page 1 and 2, with NumPy views of their color
+    #   planes created on first use
+    self._mode_requests = {}
+    self._custom_requests = (bytearray(_CUSTOM_WRITE_1 + bytes(256)),
+                             bytearray(_CUSTOM_WRITE_2 + bytes(256)))
+    self._custom_planes = None
+
+    # color correction applied when the requests are built
+    # (keyboard_fusion_color.ColorPipeline), None for no correction
+    self.color_pipeline = None
+    # last Custom mode frame built with a correction: (colors given, corrected
+    # colors as bytes), the shadow copy and the keyboard hold the corrected ones
+    self._custom_source = None
+
+    # I/O instrumentation (see enable_stats()), None when disabled
+    self.stats = None
+
+    # transport to the keyboard, by default the HID device
+    if transport is None:
+      transport = HIDTransport(path)
+    self.hid_kb = transport
 
 
   def open_hid_comm(self):
     '''
     Opens the communication with the HID keyboard and checks for errors
+
+    Returns
+    -------
+    is_open : Boolean
+      DESCRIPTION. True if the HID keyboard is open
     '''
 
+    if self.is_open:
+      return True
     try:
       self.handle = self.hid_kb.open(self.vendor_id, self.product_id)
-    except:
-      print("Could not open HID keyboard")
+      self.is_open = True
+    except Exception as error:
+      self._error('open', 'Could not open HID keyboard: {}'.format(error))
+    return self.is_open
 
 
   def close_hid_comm(self):
@@ -122,11 +480,92 @@ class KeyboardFusionRGB:
     '''
 
     self.hid_kb.close()
+    self.is_open = False
+
+
+  def reopen_hid_comm(self):
+    '''
+    Closes and opens again the communication with the HID keyboard,
+    used to recover a stale handle (e.g. keyboard suspended or reconnected)
+
+    Returns
+    -------
+    is_open : Boolean
+      DESCRIPTION. True if the HID keyboard is open
+    '''
+
+    try:
+      self.close_hid_comm()
+    except Exception:
+      self.is_open = False
+    return self.open_hid_comm()
+
+
+  def open(self):
+    '''
+    Starts a session: the HID keyboard is kept open for all the following
+    requests until close() is called
+    '''
+
+    self.persistent = True
+    self.open_hid_comm()
+    return self
+
+
+  def close(self):
+    '''
+    Ends the session and closes the HID keyboard
+    '''
+
+    if self.is_open:
+      self.close_hid_comm()
+
+
+  def __enter__(self):
+    return self.open()
+
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+
+  @property
+  def delay_s(self):
+    '''
+    Base gap in seconds between feature reports
+    '''
+
+    return self.pacer.gap_s
+
+  @delay_s.setter
+  def delay_s(self, delay_s):
+    self.pacer.set_gap(delay_s)
+
+
+  def _transfer(self, buf_req, has_rsp):
+    '''
+    Sends a request and reads the response if indicated, exceptions are raised
+    '''
+
+    self.pacer.wait()
+    self.hid_kb.send_feature_report(buf_req)
+    self.pacer.done()
+    self.n_reports += 1
+    if not has_rsp:
+      return None
+    self.pacer.wait()
+    buf_rsp = self.hid_kb.get_feature_report(self.data_size, self.data_size)
+    self.pacer.done()
+    self.n_reports += 1
+    return buf_rsp
 
 
   def write_keyboard_request(self, buf_req, has_rsp=False):
     '''
-    Writes a request to the HID keyboard and reads the response if indicated
+    Writes a request to the HID keyboard and reads the response if indicated.
+    In session mode (persistent = True) the HID keyboard stays open after the
+    request. A failed request increases the gap between reports, and it is
+    sent again (after reopening the keyboard) up to max_retries times.
 
     Parameters
     ----------
@@ -141,29 +580,399 @@ class KeyboardFusionRGB:
       DESCRIPTION. Response of the HID keyboard, or None if has_rsp == False
     '''
 
-    self.open_hid_comm()
-    # send request
-    try:
-      self.hid_kb.send_feature_report(buf_req)
-      time.sleep(self.delay_s)
-    except:
-      print('Error at send_feature_report()')
-      self.close_hid_comm()
+    if self._dry_run:
+      return self._dry_run_request(buf_req, has_rsp)
+    if not self.open_hid_comm():
       return None
-    # read if there is response
+    buf_rsp = None
+    for i_try in range(self.max_retries + 1):
+      try:
+        buf_rsp = self._transfer(buf_req, has_rsp)
+        self._track_request(buf_req, buf_rsp)
+        break
+      except Exception as error:
+        if not self._retry_after_error(error, i_try):
+          break
+    self._end_request()
+    return buf_rsp
+
+  def _retry_after_error(self, error, i_try):
+    '''
+    Handles a failed transfer of write_keyboard_request() (also used by the
+    asyncio API): increases the gap and reopens the keyboard. After the last
+    try the error is reported and the shadow copy is forgotten
+
+    Returns
+    -------
+    retry : Boolean
+      DESCRIPTION. True if the request has to be sent again
+    '''
+
+    self.pacer.error()
+    if self.stats is not None:
+      self.stats.error('transfer', str(error))
+    # the handle may be stale, reopen it before retrying
+    if i_try == self.max_retries or not self.reopen_hid_comm():
+      self._error('request', 'Error at send_feature_report() or get_feature_report(): {}'.format(error))
+      self.close_hid_comm()
+      self.invalidate_cache()
+      return False
+    return True
+
+  def _end_request(self):
+    '''
+    Closes the keyboard after a request if not in session mode
+    '''
+
+    if not self.persistent and self.is_open:
+      self.close_hid_comm()
+
+
+  def _error(self, kind, message):
+    '''
+    Reports an error, it is printed and counted in the I/O stats if enabled
+    '''
+
+    print(message)
+    if self.stats is not None:
+      self.stats.error(kind, message)
+
+
+  def enable_stats(self):
+    '''
+    Enables the I/O instrumentation: reports and bytes per opcode, time in
+    send/get and sleeping, errors, and latency histograms of the public
+    methods. It costs nothing while disabled
+
+    Returns
+    -------
+    stats : keyboard_fusion_stats.IOStats
+      DESCRIPTION. Counters, use stats.snapshot() and stats.add_hook()
+    '''
+
+    import keyboard_fusion_stats
+    if self.stats is None:
+      self.stats = keyboard_fusion_stats.IOStats(self)
+      keyboard_fusion_stats.install(self, self.stats)
+    return self.stats
+
+
+  def disable_stats(self):
+    '''
+    Disables the I/O instrumentation
+
+    Returns
+    -------
+    stats : keyboard_fusion_stats.IOStats
+      DESCRIPTION. Final counters, or None if it was not enabled
+    '''
+
+    stats, self.stats = self.stats, None
+    if stats is not None:
+      import keyboard_fusion_stats
+      keyboard_fusion_stats.uninstall(self)
+    return stats
+
+
+  def start_trace(self, path):
+    '''
+    Starts recording every feature report sent and received in a trace file,
+    see keyboard_fusion_trace
+
+    Parameters
+    ----------
+    path : String
+      DESCRIPTION. Trace file, the reports are appended if it exists
+
+    Returns
+    -------
+    writer : keyboard_fusion_trace.TraceWriter
+    '''
+
+    import keyboard_fusion_trace
+    self.stop_trace()
+    writer = keyboard_fusion_trace.TraceWriter(path, self.data_size)
+    self.hid_kb = keyboard_fusion_trace.TracingTransport(self.hid_kb, writer)
+    return writer
+
+
+  def stop_trace(self):
+    '''
+    Stops recording the feature reports and closes the trace file
+
+    Returns
+    -------
+    n_records : Int
+      DESCRIPTION. Reports recorded, 0 if there was no trace
+    '''
+
+    import keyboard_fusion_trace
+    tracing = self._remove_transport_wrapper(keyboard_fusion_trace.TracingTransport)
+    if tracing is None:
+      return 0
+    tracing.writer.close()
+    return tracing.writer.n_records
+
+
+  def _remove_transport_wrapper(self, cls):
+    '''
+    Removes the transport wrapper (instrumentation, trace) of class cls,
+    wherever it is in the chain of wrappers
+
+    Returns
+    -------
+    wrapper : cls
+      DESCRIPTION. Removed wrapper, or None if there was not one
+    '''
+
+    parent, transport = None, self.hid_kb
+    while transport is not None:
+      if isinstance(transport, cls):
+        if parent is None:
+          self.hid_kb = transport.transport
+        else:
+          parent.transport = transport.transport
+        return transport
+      parent, transport = transport, transport.__dict__.get('transport')
+    return None
+
+
+  def _dry_run_request(self, buf_req, has_rsp):
+    '''
+    Counts and tracks a request without sending it, the response is taken
+    from the shadow copy
+    '''
+
+    opcode, page = buf_req[1], buf_req[3]
+    buf_rsp = None
     if has_rsp:
+      if opcode == 0x82 and self.status is not None:
+        buf_rsp = list(self.status)
+      elif opcode == 0x86 and self.custom_pages.get(page) is not None:
+        buf_rsp = list(self.custom_pages[page])
+      else:
+        buf_rsp = [0x07] + [0x00] * (self.data_size - 1)
+    self.n_reports += 2 if has_rsp else 1
+    self._track_request(buf_req, buf_rsp)
+    return buf_rsp
+
+
+  def batch(self):
+    '''
+    Transaction for several mode, brightness and Custom mode frame calls:
+    the calls inside the with block are recorded, and at the end only the
+    requests needed to reach the final state are sent. Nothing is read from
+    the keyboard while recording, the dictionaries of set_custom_configuration()
+    are merged with the current frame at the end
+
+      with keyboard.batch() as batch:
+        keyboard.set_custom_mode(brightness = 100)
+        keyboard.set_custom_configuration(dict_keys)
+        keyboard.set_brightness(80)
+      print(batch.n_reports, batch.n_saved)
+
+    Returns
+    -------
+    batch : Batch
+    '''
+
+    return Batch(self)
+
+
+  def invalidate_cache(self):
+    '''
+    Forgets the shadow copy of the keyboard state, it is read again when needed
+    '''
+
+    self.status   = None
+    self.status_t = None
+    self.mode_request = None  # last set mode request (0x02)
+    self.custom_pages = {0x01: None, 0x02: None}
+    self.custom_t     = {0x01: None, 0x02: None}
+
+
+  def _track_request(self, buf_req, buf_rsp):
+    '''
+    Updates the shadow copy of the keyboard state after a successful request
+    '''
+
+    opcode, page = buf_req[1], buf_req[3]
+    now = time.monotonic()
+    if opcode == 0x02:
+      self.mode_request = bytes(buf_req)
+      self.status = bytes([0x07, 0x82]) + self.mode_request[2:]
+      self.status_t = now
+    elif opcode == 0x82:
+      self.status = bytes(buf_rsp)
+      self.status_t = now
+      # mode, brightness or mode configuration changed by other means
+      if self.mode_request is not None and self.mode_request[10:] != self.status[10:]:
+        self.mode_request = None
+    elif opcode == 0x06 and page in self.custom_pages:
+      self.custom_pages[page] = bytes(buf_req)
+      self.custom_t[page] = now
+    elif opcode == 0x86 and page in self.custom_pages:
+      self.custom_pages[page] = bytes([0x07, 0x06]) + bytes(buf_req[2:8]) + bytes(buf_rsp[8:])
+      self.custom_t[page] = now
+
+
+  def _is_fresh(self, t):
+    '''
+    True if a cache entry stored at time t can be used
+    '''
+
+    return t is not None and (self.cache_ttl_s is None or time.monotonic() - t < self.cache_ttl_s)
+
+
+  def get_cached_status(self):
+    '''
+    Gets the configuration of the HID keyboard from the shadow copy,
+    it is read from the keyboard only if it is unknown or expired
+
+    Returns
+    -------
+    buf_rsp : List of integers (8 bits)
+      DESCRIPTION. Current configuration of the HID keyboard
+    '''
+
+    if not self._is_fresh(self.status_t):
+      return self.get_current_status()
+    return list(self.status)
+
+
+  def get_cached_custom_frame(self):
+    '''
+    Gets the Custom mode frame from the shadow copy,
+    it is read from the keyboard only if it is unknown or expired.
+    As get_custom_frame(), the colors are the ones before keyboard.color_pipeline
+
+    Returns
+    -------
+    frame : CustomFrame
+      DESCRIPTION. RGB color for each key slot
+    '''
+
+    if not all(self._is_fresh(self.custom_t[page]) for page in self.custom_pages):
+      return self.get_custom_frame()
+    return self._caller_frame(CustomFrame.decode_reports(self.custom_pages[0x01], self.custom_pages[0x02]))
+
+
+  def revalidate(self):
+    '''
+    Reads again the status and the Custom mode frame from the keyboard
+    '''
+
+    self.get_current_status()
+    self.get_custom_frame()
+
+
+  def calibrate_delay(self, min_s = 0.0005, max_s = 0.05, n_reports = 10, margin = 1.25):
+    '''
+    Finds the minimum gap between feature reports that the keyboard handles
+    without errors, by reading the current status with a binary search over
+    the gap. The found gap (times margin) is used as new delay_s
+
+    Parameters
+    ----------
+    min_s : Float, optional
+      DESCRIPTION. Smallest gap in seconds to test, the default is 0.0005
+    max_s : Float, optional
+      DESCRIPTION. Largest gap in seconds to test, the default is 0.05
+    n_reports : Int, optional
+      DESCRIPTION. Number of status reads for each tested gap, the default is 10
+    margin : Float, optional
+      DESCRIPTION. Safety factor applied to the found gap, the default is 1.25
+
+    Returns
+    -------
+    delay_s : Float
+      DESCRIPTION. New gap in seconds between feature reports
+    '''
+
+    buf_req = _STATUS_REQUEST
+
+    def gap_is_safe(gap_s):
+      self.pacer.set_gap(gap_s)
       try:
-        buf_rsp = self.hid_kb.get_feature_report(self.data_size, self.data_size)
-        time.sleep(self.delay_s)
-        self.close_hid_comm()
-        return buf_rsp
-      except:
-        print('Error at get_feature_report()')
-        self.close_hid_comm()
-        return None
+        for _ in range(n_reports):
+          buf_rsp = self._transfer(buf_req, True)
+          if buf_rsp is None or len(buf_rsp) != self.data_size or buf_rsp[0] != 0x07:
+            raise IOError
+        return True
+      except Exception:
+        # let the keyboard recover before the next test
+        time.sleep(max_s)
+        self.reopen_hid_comm()
+        return False
+
+    if not self.open_hid_comm():
+      return self.delay_s
+    low, high = min_s, max_s
+    if gap_is_safe(low):
+      high = low
     else:
+      # binary search, 'low' fails and 'high' is assumed to be safe
+      while high - low > max(min_s, 0.1 * low):
+        mid = (low + high) / 2
+        if gap_is_safe(mid):
+          high = mid
+        else:
+          low = mid
+    self.delay_s = high * margin
+    if not self.persistent:
       self.close_hid_comm()
-      return None
+    return self.delay_s
+
+  def build_mode_request(self, mode, brightness, buf_mode):
+    '''
+    Builds the request to set a mode with its configuration
+
+    Parameters
+    ----------
+    mode : Int (8-bit)
+    brightness : Int (8-bit), optional
+      DESCRIPTION. Brightness level 0 to 100
+    buf_mode : List Int (8-bit)
+      DESCRIPTION. Specific configuration for the indicated mode
+
+    Returns
+    -------
+    buf_req : bytearray
+      DESCRIPTION. Request of 264 bytes, the same buffer is reused in the
+      next call for this mode, copy it to keep it
+    '''
+
+    request = self._mode_requests.get(mode)
+    if request is None:
+      buf_req = bytearray(self.data_size)
+      buf_req[0:2] = [0x07, 0x02]  # instructions to set mode
+      buf_req[10]  = mode          # mode code
+      request = [buf_req, memoryview(buf_req), 13 + self.mode_offsets[mode], 0]
+      self._mode_requests[mode] = request
+    buf_req, mv_req, start, n_prev = request
+    buf_mode = self._corrected_mode_config(mode, buf_mode)
+    n_mode = len(buf_mode)
+    mv_req[12] = brightness                         # brightness
+    mv_req[start:start + n_mode] = bytes(buf_mode)  # configuration buffer for mode
+    if n_mode < n_prev:
+      mv_req[start + n_mode:start + n_prev] = bytes(n_prev - n_mode)
+    request[3] = n_mode
+    return buf_req
+
+
+  def _corrected_mode_config(self, mode, buf_mode):
+    '''
+    Mode configuration with keyboard.color_pipeline applied to its colors,
+    buf_mode is not changed
+    '''
+
+    n_colors = 3 * self.mode_n_colors.get(mode, 0)
+    pipeline = self._active_pipeline()
+    if pipeline is None or not n_colors or len(buf_mode) < n_colors:
+      return buf_mode
+    # the colors are at the end of the configuration
+    return list(buf_mode[:-n_colors]) + pipeline.apply_colors(buf_mode[-n_colors:])
+
 
   def set_mode_configuration(self, mode, brightness, buf_mode):
     '''
@@ -178,16 +987,120 @@ class KeyboardFusionRGB:
       DESCRIPTION. Specific configuration for the indicated mode
     '''
 
-    offset = self.mode_offsets[mode]
-    buf_req = ([0x07, 0x02] + [0x00] * 8 + # instructions to set mode
-               [mode]                    + # mode code
-               [0x00]                    + # seems useless
-               [brightness]              + # brightness
-               [0x00] * offset           + # offset
-               buf_mode)                   # configuration buffer for mode
-    n_fill = self.data_size - len(buf_req)
-    buf_req = buf_req + [0x00] * n_fill    # fill up to 264 bytes
+    self.write_keyboard_request(self.build_mode_request(mode, brightness, buf_mode))
+
+
+  def apply_mode_configuration(self, mode, brightness, buf_mode, force = False):
+    '''
+    Sets a mode with its configuration, used by all the set_*_mode() methods.
+    Nothing is sent if the keyboard is already in the same mode with the same
+    configuration, and the cleaning command is skipped if the mode does not
+    change (unless always_clean is True)
+
+    Parameters
+    ----------
+    mode : Int (8-bit)
+    brightness : Int (8-bit), optional
+      DESCRIPTION. Brightness level 0 to 100
+    buf_mode : List Int (8-bit)
+      DESCRIPTION. Specific configuration for the indicated mode
+    force : Boolean, optional
+      DESCRIPTION. Cleans and sets the mode even if it did not change, the default is False
+
+    Returns
+    -------
+    is_sent : Boolean
+      DESCRIPTION. True if the request was sent to the keyboard
+    '''
+
+    if self._capture is not None:
+      # the call is recorded instead of sent (see batch())
+      self._capture.append(('mode', mode, brightness, list(buf_mode), force))
+      return False
+    buf_req, needs_clean = self._plan_mode_request(mode, brightness, buf_mode, force)
+    if buf_req is None:
+      return False
+    if needs_clean:
+      self.clean_configuration()
     self.write_keyboard_request(buf_req)
+    return True
+
+
+  def record_mode_call(self, name, *args, **kwargs):
+    '''
+    Calls a mode setter (e.g. 'set_static_mode') without sending anything,
+    and returns the arguments it would pass to apply_mode_configuration().
+    A batch() in progress keeps recording after the call
+
+    Returns
+    -------
+    mode, brightness, buf_mode, force : Tuple
+    '''
+
+    capture, self._capture = self._capture, []
+    try:
+      getattr(self, name)(*args, **kwargs)
+      (_, mode, brightness, buf_mode, force), = self._capture
+    finally:
+      self._capture = capture
+    return mode, brightness, buf_mode, force
+
+
+  def _plan_mode_request(self, mode, brightness, buf_mode, force):
+    '''
+    Returns the set mode request (None if the mode is already set) and
+    whether the cleaning command is needed before it
+    '''
+
+    buf_req = self.build_mode_request(mode, brightness, buf_mode)
+    is_needed, needs_clean = self._mode_request_needed(buf_req, force)
+    return (buf_req if is_needed else None), needs_clean
+
+  def _mode_request_cached(self, buf_req, force = False):
+    '''
+    True if the shadow copy shows that the keyboard is already in the mode
+    and configuration of a set mode request
+    '''
+
+    return (not force and self._is_fresh(self.status_t) and self.mode_request is not None
+            and buf_req == self.mode_request)
+
+  def _mode_request_needed(self, buf_req, force = False, confirm = True):
+    '''
+    Compares a set mode request with the shadow copy, used for the requests
+    built here and the prebuilt ones (see keyboard_fusion_presets). The mode
+    may have been changed by other means (another instance, the daemon or the
+    vendor tool), so a request is only skipped after reading the status once
+
+    Parameters
+    ----------
+    confirm : Boolean, optional
+      DESCRIPTION. Reads the status before skipping the request, False if it
+      was just read (see keyboard_fusion_async). The default is True
+
+    Returns
+    -------
+    is_needed : Boolean
+      DESCRIPTION. False if the keyboard is already in this mode and configuration
+    needs_clean : Boolean
+      DESCRIPTION. True if the cleaning command has to be sent before it
+    '''
+
+    if confirm and self._mode_request_cached(buf_req, force):
+      self.get_current_status()
+    if self._mode_request_cached(buf_req, force):
+      return False, False
+    is_known = self._is_fresh(self.status_t)
+    return True, force or self.always_clean or not is_known or self.status[10] != buf_req[10]
+
+  def _custom_request_needed(self, buf_req, force = False):
+    '''
+    True if a Custom mode frame request (page 1 or 2) differs from the shadow
+    copy, or the page is unknown
+    '''
+
+    page = buf_req[3]
+    return force or not self._is_fresh(self.custom_t[page]) or buf_req != self.custom_pages[page]
 
 
   def get_current_status(self):
@@ -200,8 +1113,7 @@ class KeyboardFusionRGB:
       DESCRIPTION. Current configuration of the HID keyboard
     '''
 
-    buf_req = [0x07, 0x82] + [0x00] * 262
-    buf_rsp = self.write_keyboard_request(buf_req, has_rsp=True)
+    buf_rsp = self.write_keyboard_request(_STATUS_REQUEST, has_rsp=True)
     return buf_rsp
 
 
@@ -210,15 +1122,28 @@ class KeyboardFusionRGB:
     Write the cleaning configuration command and check for error
     '''
 
-    buf_req = [0x07, 0x8A] + [0x00] * 262
-    buf_rsp = self.write_keyboard_request(buf_req, has_rsp=True)
-    # check the the response for cleaning is full of 0x00
-    buf_rsp.pop(0) # except the first byte
-    if not all(element == 0x00 for element in buf_rsp):
-      print('Error at Response for Cleaning command')
+    buf_rsp = self.write_keyboard_request(_CLEAN_REQUEST, has_rsp=True)
+    # check the the response for cleaning is full of 0x00, except the first byte
+    if buf_rsp is None:
+      self._error('clean', 'No Response for Cleaning command')
+    elif any(buf_rsp[1:]):
+      self._error('clean', 'Error at Response for Cleaning command')
 
   def set_brightness(self, brightness):
-    buf_req = self.get_current_status()
+    '''
+    Changes the brightness of the current mode, the current status is taken
+    from the shadow copy so usually only one request is sent
+
+    Parameters
+    ----------
+    brightness : Int (8-bit)
+      DESCRIPTION. Brightness level 0 to 100
+    '''
+
+    if self._capture is not None:
+      self._capture.append(('brightness', brightness))
+      return
+    buf_req = self.get_cached_status()
     buf_req[1] = 0x02         # change instruction
     buf_req[12] = brightness  # change brightness
     self.write_keyboard_request(buf_req)
@@ -237,9 +1162,8 @@ class KeyboardFusionRGB:
       DESCRIPTION. Brightness level 0 to 100, the default is 50
     '''
 
-    self.clean_configuration()
     buf_mode = [0x00] + color_rgb
-    self.set_mode_configuration(0x00, brightness, buf_mode)
+    self.apply_mode_configuration(0x00, brightness, buf_mode)
 
 
   def set_breathing_mode(self, color_rgb = [0xFF, 0xFF, 0xFF], speed = 50, brightness = 50):
@@ -256,10 +1180,9 @@ class KeyboardFusionRGB:
       DESCRIPTION. Brightness level 0 to 100, the default is 50
     '''
 
-    self.clean_configuration()
     speed = 10 - round(speed / 10)
     buf_mode = [speed] + [0x00] + color_rgb
-    self.set_mode_configuration(0x01, brightness, buf_mode)
+    self.apply_mode_configuration(0x01, brightness, buf_mode)
 
   def set_flow_mode(self, speed = 50, direction = 'right', brightness = 50):
     '''
@@ -275,7 +1198,6 @@ class KeyboardFusionRGB:
       DESCRIPTION. Brightness level 0 to 100, the default is 50
     '''
 
-    self.clean_configuration()
     speed = 10 - round(speed / 10)
     if direction == 'right':
       dir_mode = 0
@@ -288,7 +1210,7 @@ class KeyboardFusionRGB:
     else:
       dir_mode = 0
     buf_mode = [speed, dir_mode]
-    self.set_mode_configuration(0x02, brightness, buf_mode)
+    self.apply_mode_configuration(0x02, brightness, buf_mode)
 
   def set_firework_mode(self, color_rgb = [0xFF, 0xFF, 0xFF], random = False, speed = 50, brightness = 50):
     '''
@@ -306,10 +1228,9 @@ class KeyboardFusionRGB:
       DESCRIPTION. Brightness level 0 to 100, the default is 50
     '''
 
-    self.clean_configuration()
     speed = 10 - round(speed / 10)
     buf_mode = [speed, int(random)] + color_rgb
-    self.set_mode_configuration(0x03, brightness, buf_mode)
+    self.apply_mode_configuration(0x03, brightness, buf_mode)
 
   def set_ripple_mode(self, color_rgb = [0xFF, 0xFF, 0xFF], speed = 50, brightness = 50):
     '''
@@ -325,10 +1246,9 @@ class KeyboardFusionRGB:
       DESCRIPTION. Brightness level 0 to 100, the default is 50
     '''
 
-    self.clean_configuration()
     speed = 10 - round(speed / 10)
     buf_mode = [speed, 0x02] + color_rgb
-    self.set_mode_configuration(0x04, brightness, buf_mode)
+    self.apply_mode_configuration(0x04, brightness, buf_mode)
 
   def set_rain_mode(self, color_rgb = [0xFF, 0xFF, 0xFF], random = False, speed = 50, brightness = 50):
     '''
@@ -346,10 +1266,9 @@ class KeyboardFusionRGB:
       DESCRIPTION. Brightness level 0 to 100, the default is 50
     '''
 
-    self.clean_configuration()
     speed = 10 - round(speed / 10)
     buf_mode = [speed, int(random)] + color_rgb
-    self.set_mode_configuration(0x05, brightness, buf_mode)
+    self.apply_mode_configuration(0x05, brightness, buf_mode)
 
   def set_cycling_mode(self, speed = 50, brightness = 50):
     '''
@@ -363,10 +1282,9 @@ class KeyboardFusionRGB:
       DESCRIPTION. Brightness level 0 to 100, the default is 50
     '''
 
-    self.clean_configuration()
     speed = 10 - round(speed / 10)
     buf_mode = [speed]
-    self.set_mode_configuration(0x06, brightness, buf_mode)
+    self.apply_mode_configuration(0x06, brightness, buf_mode)
 
   def set_trigger_mode(self, color_rgb = [0xFF, 0xFF, 0xFF], random = False, speed = 50, brightness = 50):
     '''
@@ -384,10 +1302,9 @@ class KeyboardFusionRGB:
       DESCRIPTION. Brightness level 0 to 100, the default is 50
     '''
 
-    self.clean_configuration()
     speed = 10 - round(speed / 10)
     buf_mode = [speed, int(random)] + color_rgb
-    self.set_mode_configuration(0x07, brightness, buf_mode)
+    self.apply_mode_configuration(0x07, brightness, buf_mode)
 
   def set_pulse_mode(self, color_rgb = [0xFF, 0xFF, 0xFF], random = False, speed = 50, brightness = 50):
     '''
@@ -405,10 +1322,9 @@ class KeyboardFusionRGB:
       DESCRIPTION. Brightness level 0 to 100, the default is 50
     '''
 
-    self.clean_configuration()
     speed = 10 - round(speed / 10)
     buf_mode = [speed, int(random)] + color_rgb
-    self.set_mode_configuration(0x08, brightness, buf_mode)
+    self.apply_mode_configuration(0x08, brightness, buf_mode)
 
   def set_radar_mode(self, color_rgb = [0xFF, 0xFF, 0xFF], random = False, speed = 50, direction = 'cw', brightness = 50):
     '''
@@ -428,7 +1344,6 @@ class KeyboardFusionRGB:
       DESCRIPTION. Brightness level 0 to 100, the default is 50
     '''
 
-    self.clean_configuration()
     speed = 10 - round(speed / 10)
     if direction == 'cw':
       dir_mode = 1
@@ -437,7 +1352,7 @@ class KeyboardFusionRGB:
     else:
       dir_mode = 1
     buf_mode = [speed, int(random), dir_mode] + color_rgb
-    self.set_mode_configuration(0x09, brightness, buf_mode)
+    self.apply_mode_configuration(0x09, brightness, buf_mode)
 
   def set_star_mode(self, color_rgb = [0xFF, 0xFF, 0xFF], random = False, speed = 50, brightness = 50):
     '''
@@ -455,10 +1370,9 @@ class KeyboardFusionRGB:
       DESCRIPTION. Brightness level 0 to 100, the default is 50
     '''
 
-    self.clean_configuration()
     speed = 10 - round(speed / 10)
     buf_mode = [speed, int(random)] + color_rgb
-    self.set_mode_configuration(0x0A, brightness, buf_mode)
+    self.apply_mode_configuration(0x0A, brightness, buf_mode)
 
   def set_wave_mode(self, color_rgb = [0xFF, 0xFF, 0xFF], random = False, speed = 50, direction = 'right', brightness = 50):
     '''
@@ -478,7 +1392,6 @@ class KeyboardFusionRGB:
       DESCRIPTION. Brightness level 0 to 100, the default is 50
     '''
 
-    self.clean_configuration()
     speed = 10 - round(speed / 10)
     if direction == 'right':
       dir_mode = 0
@@ -491,7 +1404,7 @@ class KeyboardFusionRGB:
     else:
       dir_mode = 0
     buf_mode = [speed, int(random), dir_mode] + color_rgb
-    self.set_mode_configuration(0x0B, brightness, buf_mode)
+    self.apply_mode_configuration(0x0B, brightness, buf_mode)
 
   def set_cross_mode(self, color_rgb = [0xFF, 0xFF, 0xFF], random = False, speed = 50, brightness = 50):
     '''
@@ -509,10 +1422,9 @@ class KeyboardFusionRGB:
       DESCRIPTION. Brightness level 0 to 100, the default is 50
     '''
 
-    self.clean_configuration()
     speed = 10 - round(speed / 10)
     buf_mode = [speed, int(random)] + color_rgb
-    self.set_mode_configuration(0x0C, brightness, buf_mode)
+    self.apply_mode_configuration(0x0C, brightness, buf_mode)
 
   def set_dragonstrike_mode(self, color_rgb_1 = [0xFF, 0x00, 0x00], color_rgb_2 = [0x00, 0x00, 0xFF],
                             random = False, speed = 50, direction = 'right', brightness = 50):
@@ -535,7 +1447,6 @@ class KeyboardFusionRGB:
       DESCRIPTION. Brightness level 0 to 100, the default is 50
     '''
 
-    self.clean_configuration()
     speed = 10 - round(speed / 10)
     if direction == 'right':
       dir_mode = 0
@@ -544,7 +1455,7 @@ class KeyboardFusionRGB:
     else:
       dir_mode = 0
     buf_mode = [speed, int(random), dir_mode] + color_rgb_1 + color_rgb_2
-    self.set_mode_configuration(0x0D, brightness, buf_mode)
+    self.apply_mode_configuration(0x0D, brightness, buf_mode)
 
   def set_bloom_mode(self, color_rgb_1 = [0xFF, 0x00, 0x00], color_rgb_2 = [0x00, 0x00, 0xFF],
                             random = False, speed = 50, brightness = 50):
@@ -565,10 +1476,9 @@ class KeyboardFusionRGB:
       DESCRIPTION. Brightness level 0 to 100, the default is 50
     '''
 
-    self.clean_configuration()
     speed = 10 - round(speed / 10)
     buf_mode = [speed, int(random)] + color_rgb_1 + color_rgb_2
-    self.set_mode_configuration(0x0E, brightness, buf_mode)
+    self.apply_mode_configuration(0x0E, brightness, buf_mode)
 
   def set_spiral_mode(self, speed = 50, direction = 'cw', brightness = 50):
     '''
@@ -584,7 +1494,6 @@ class KeyboardFusionRGB:
       DESCRIPTION. Brightness level 0 to 100, the default is 50
     '''
 
-    self.clean_configuration()
     speed = 10 - round(speed / 10)
     if direction == 'cw':
       dir_mode = 0
@@ -593,7 +1502,7 @@ class KeyboardFusionRGB:
     else:
       dir_mode = 0
     buf_mode = [dir_mode, speed]
-    self.set_mode_configuration(0x0F, brightness, buf_mode)
+    self.apply_mode_configuration(0x0F, brightness, buf_mode)
 
   def set_merge_mode(self, color_rgb_1 = [0xFF, 0x00, 0x00], color_rgb_2 = [0x00, 0x00, 0xFF],
                             random = False, speed = 50, brightness = 50):
@@ -614,10 +1523,9 @@ class KeyboardFusionRGB:
       DESCRIPTION. Brightness level 0 to 100, the default is 50
     '''
 
-    self.clean_configuration()
     speed = 10 - round(speed / 10)
     buf_mode = [speed, int(random)] + color_rgb_1 + color_rgb_2
-    self.set_mode_configuration(0x10, brightness, buf_mode)
+    self.apply_mode_configuration(0x10, brightness, buf_mode)
 
   def set_crash_mode(self, color_rgb_1 = [0xFF, 0x00, 0x00], color_rgb_2 = [0x00, 0x00, 0xFF],
                             random = False, speed = 50, direction = 'horizontal', brightness = 50):
@@ -640,7 +1548,6 @@ class KeyboardFusionRGB:
       DESCRIPTION. Brightness level 0 to 100, the default is 50
     '''
 
-    self.clean_configuration()
     speed = 10 - round(speed / 10)
     if direction == 'horizontal':
       dir_mode = 0
@@ -649,7 +1556,7 @@ class KeyboardFusionRGB:
     else:
       dir_mode = 0
     buf_mode = [speed, int(random), dir_mode] + color_rgb_1 + color_rgb_2
-    self.set_mode_configuration(0x11, brightness, buf_mode)
+    self.apply_mode_configuration(0x11, brightness, buf_mode)
 
   # Custom mode 0x12
   def set_custom_mode(self, dict_keys = [], brightness = 50):
@@ -670,59 +1577,238 @@ class KeyboardFusionRGB:
     Returns
     -------
     dict_keys : Dictionary
-      DESCRIPTION. Dictionary for the color RGB for each key
+      DESCRIPTION. Dictionary for the color RGB for each key, None inside
+      batch() (nothing is read from the keyboard while recording)
     '''
 
-    self.clean_configuration()
-    self.set_mode_configuration(0x12, brightness, [])
+    self.apply_mode_configuration(0x12, brightness, [])
     if dict_keys:
       # write new configuration
       self.set_custom_configuration(dict_keys)
-    # read current configuration
-    dict_keys = self.get_custom_configuration()
+    if self._capture is not None:
+      return None
+    # current configuration, read from the keyboard only if it is unknown
+    dict_keys = self.get_cached_custom_frame().to_dict(self.layout)
     return dict_keys
 
+  def get_custom_frame(self):
+    '''
+    Gets the stored light values in the Custom mode. With keyboard.color_pipeline
+    the keyboard stores the corrected colors, the colors returned are the
+    ones before the correction, so they can be written back as they are
+
+    Returns
+    -------
+    frame : CustomFrame
+      DESCRIPTION. RGB color for each key slot
+    '''
+
+    return self._caller_frame(self._read_custom_frame())
+
+  def _read_custom_frame(self):
+    '''
+    Reads the Custom mode frame as stored in the keyboard (corrected colors)
+    '''
+
+    buf_rsp_1 = self.write_keyboard_request(_CUSTOM_READ_1, has_rsp=True)
+    buf_rsp_2 = self.write_keyboard_request(_CUSTOM_READ_2, has_rsp=True)
+    return CustomFrame.decode_reports(buf_rsp_1, buf_rsp_2)
+
+  def _caller_frame(self, stored):
+    '''
+    Frame stored in the keyboard to the frame before keyboard.color_pipeline:
+    the last frame given if its corrected colors are the stored ones,
+    otherwise the stored colors with the correction inverted
+    '''
+
+    pipeline = self._active_pipeline()
+    if pipeline is None:
+      return stored
+    source = self._custom_source
+    if source is not None and source[1] == stored.rgb.tobytes():
+      return CustomFrame(source[0].copy())
+    return CustomFrame(pipeline.invert(stored.rgb))
+
+  def _active_pipeline(self):
+    '''
+    keyboard.color_pipeline, or None if there is no correction to apply
+    '''
+
+    pipeline = self.color_pipeline
+    if pipeline is None or pipeline.is_identity:
+      return None
+    return pipeline
+
+  def set_custom_frame(self, frame, force = False, verify = False):
+    '''
+    Sets the stored light values in the Custom mode. Only the requests
+    (Red and Green planes, and Blue plane) that changed with respect to the
+    last written frame are sent
+
+    Parameters
+    ----------
+    frame : CustomFrame or Array (128, 3) of Int (8-bit)
+      DESCRIPTION. RGB color for each key slot
+    force : Boolean, optional
+      DESCRIPTION. Sends both requests even if they did not change, the default is False
+    verify : Boolean, optional
+      DESCRIPTION. Reads the frame back from the keyboard and reports an error
+      if it differs, see verify_custom_frame(). The default is False
+
+    Returns
+    -------
+    n_sent : Int
+      DESCRIPTION. Number of requests sent to the keyboard (0, 1 or 2)
+    '''
+
+    if self._capture is not None:
+      frame = frame.copy() if isinstance(frame, CustomFrame) else CustomFrame(np.array(frame))
+      self._capture.append(('frame', frame, force))
+      return 0
+    buf_reqs = self._plan_custom_requests(frame, force)
+    for buf_req in buf_reqs:
+      self.write_keyboard_request(buf_req)
+    if verify:
+      mismatched = self.verify_custom_frame()
+      if len(mismatched):
+        self._error('verify', 'Custom mode frame read back differs in slots {}'.format(mismatched.tolist()))
+    return len(buf_reqs)
+
+  def get_custom_bytes(self):
+    '''
+    Gets the stored light values in the Custom mode as raw bytes, as
+    get_custom_frame() the colors are the ones before keyboard.color_pipeline
+
+    Returns
+    -------
+    buf : bytes
+      DESCRIPTION. 384 bytes of the color planes (Red, Green, Blue), one value
+      per key slot, including the unused slots
+    '''
+
+    return self.get_custom_frame().to_bytes()
+
+  def set_custom_bytes(self, buf, force = False, verify = False):
+    '''
+    Sets the stored light values in the Custom mode from raw bytes, all the
+    384 bytes are written as they are (except for keyboard.color_pipeline)
+
+    Parameters
+    ----------
+    buf : bytes
+      DESCRIPTION. 384 bytes of the color planes (Red, Green, Blue)
+    force, verify : Boolean, optional
+      DESCRIPTION. See set_custom_frame()
+
+    Returns
+    -------
+    n_sent : Int
+      DESCRIPTION. Number of requests sent to the keyboard (0, 1 or 2)
+    '''
+
+    if len(buf) != 3 * CustomFrame.n_keys:
+      raise ValueError('Custom mode frame must have {:d} bytes'.format(3 * CustomFrame.n_keys))
+    return self.set_custom_frame(CustomFrame.from_bytes(buf), force, verify)
+
+  def verify_custom_frame(self, frame = None):
+    '''
+    Reads the Custom mode frame from the keyboard and compares it, byte by
+    byte, with the expected frame
+
+    Parameters
+    ----------
+    frame : CustomFrame or Array (128, 3) of Int (8-bit), optional
+      DESCRIPTION. Expected frame, keyboard.color_pipeline is applied to it.
+      The default is None, the last frame written (shadow copy)
+
+    Returns
+    -------
+    mismatched : Array of Int
+      DESCRIPTION. Key slots whose color differs, empty if the frames are equal
+    '''
+
+    if frame is None:
+      if None in self.custom_pages.values():
+        raise ValueError('Custom mode frame not written nor read, nothing to verify')
+      expected = CustomFrame.decode_reports(self.custom_pages[0x01], self.custom_pages[0x02]).rgb
+    else:
+      expected = frame.rgb if isinstance(frame, CustomFrame) else CustomFrame(frame).rgb
+      pipeline = self._active_pipeline()
+      if pipeline is not None:
+        expected = pipeline.apply(expected)
+    stored = self._read_custom_frame().rgb
+    return np.flatnonzero((stored != expected).any(axis=1))
+
+
+  @property
+  def geometry(self):
+    '''
+    Positions, distance matrix, row/column masks and neighbors of the key
+    slots of the layout, see keyboard_fusion_geometry.Geometry
+    '''
+
+    from keyboard_fusion_geometry import get_geometry
+    return get_geometry(self.layout)
+
+  def _get_custom_planes(self):
+    '''
+    NumPy views of the color planes in the preallocated Custom mode requests:
+    Red and Green (2, 128) in page 1, and Blue (1, 128) in page 2
+    '''
+
+    if self._custom_planes is None:
+      self._custom_planes = (
+        np.frombuffer(self._custom_requests[0], np.uint8)[8:].reshape(2, self.n_keys),
+        np.frombuffer(self._custom_requests[1], np.uint8)[8:136].reshape(1, self.n_keys))
+    return self._custom_planes
+
+  def _plan_custom_requests(self, frame, force):
+    '''
+    Returns the Custom mode frame requests that have to be sent
+    '''
+
+    if not isinstance(frame, CustomFrame):
+      frame = CustomFrame(frame)
+    rgb = frame.rgb
+    pipeline = self._active_pipeline()
+    if pipeline is not None:
+      rgb = pipeline.apply(rgb)
+      self._custom_source = (frame.rgb.copy(), rgb.tobytes())
+    # write the color planes into the preallocated requests
+    planes_rg, planes_b = self._get_custom_planes()
+    planes_rg[...] = rgb[:, :2].T
+    planes_b[...]  = rgb[:, 2:].T
+    return [buf_req for buf_req in self._custom_requests if self._custom_request_needed(buf_req, force)]
+
   def get_custom_configuration(self):
     '''
-    Gets the stored light values in the Custom mode
+    Gets the stored light values in the Custom mode, the unused slots are
+    not included (see get_custom_bytes())
 
     Returns
     -------
     dict_keys : Dictionary
       DESCRIPTION. Dictionary for the color RGB for each key
     '''
-    
-    buf_req = [0x07, 0x86, 0x00, 0x01] + [0x00] * 260
-    buf_rsp_1 = self.write_keyboard_request(buf_req, has_rsp=True)
-    buf_req = [0x07, 0x86, 0x00, 0x02] + [0x00] * 260
-    buf_rsp_2 = self.write_keyboard_request(buf_req, has_rsp=True)
-    buf_rsp = buf_rsp_1[8:] + buf_rsp_2[8:] 
-    # convert these buffers to dictionary
-    tmp = np.array(buf_rsp[:384]) # 128 keys times 3 bytes for color (RGB)
-    hex_rgb = np.reshape(tmp, (128,3), order='F') 
-    dict_keys = {}
-    for ix_key in range(128):
-      dict_keys[self.keys[ix_key]] = list(hex_rgb[ix_key, :]) 
-    return dict_keys
 
-  def set_custom_configuration(self, dict_keys):
+    return self.get_custom_frame().to_dict(self.layout)
+
+  def set_custom_configuration(self, dict_keys, force = False):
     '''
-    Sets the stored light values in the Custom mode
+    Sets the stored light values in the Custom mode. The keys that are not in
+    the dictionary, and the unused slots, keep their current color (shadow copy)
 
     Parameters
     ----------
     dict_keys : Dictionary
       DESCRIPTION. Dictionary for the color RGB for each key
+    force : Boolean, optional
+      DESCRIPTION. Sends the full frame even if it did not change, the default is False
     '''
 
-    # dictionary to buffers
-    hex_rgb = np.zeros((128, 3), int)
-    for ix_key in range(128):
-      hex_rgb[ix_key, :] = np.array(dict_keys[self.keys[ix_key]])
-    tmp = list(np.reshape(hex_rgb, 384, 'F'))
-    msg_1 = tmp[:256] # Red and Green
-    msg_2 = tmp[256:] # Blue
-    buf_req_1 = [0x07, 0x06, 0x00, 0x01] + [0x00] * 4 + msg_1
-    buf_req_2 = [0x07, 0x06, 0x00, 0x02] + [0x00] * 4 + msg_2 + [0x00]*128
-    self.write_keyboard_request(buf_req_1)
-    self.write_keyboard_request(buf_req_2)
+    if self._capture is not None:
+      # merged with the current frame at the end of the batch
+      self._capture.append(('config', {key: list(color_rgb) for key, color_rgb in dict_keys.items()}, force))
+      return
+    frame = CustomFrame.from_dict(dict_keys, self.layout, base=self.get_cached_custom_frame())
+    self.set_custom_frame(frame, force)
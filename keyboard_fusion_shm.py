@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared-memory frame for the Custom mode of the Fusion RGB Keyboard
+
+Several processes (producers) paint the keys of a (128, 3) uint8 frame that
+lives in shared memory, and a FramePusher sends it to the keyboard at a
+bounded rate. A sequence counter next to the frame tells the pusher when the
+frame changed. The frame is never serialized nor copied between processes.
+
+Example:
+  # pusher process, creates the shared frame
+  shared = SharedFrame(create=True)
+  keyboard.set_custom_mode(brightness = 100)
+  FramePusher(keyboard, shared, max_fps = 30).run()
+
+  # producer process
+  shared = SharedFrame()
+  with shared.edit() as rgb:
+    rgb[keyboard.layout.slot('A')] = [0xFF, 0x00, 0x00]
+
+@author: Raymundo Cassani
+"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+class SharedFrame:
+  """
+  (128, 3) uint8 frame with a sequence counter in shared memory
+
+  Memory layout: sequence counter (uint64, 8 bytes), RGB for each key slot (384 bytes)
+  """
+
+  n_keys = 128
+
+  def __init__(self, name = 'keyboard-fusion-rgb', create = False):
+    '''
+    Parameters
+    ----------
+    name : String, optional
+      DESCRIPTION. Name of the shared memory block, the default is 'keyboard-fusion-rgb'
+    create : Boolean, optional
+      DESCRIPTION. Creates the shared memory block (all keys OFF), otherwise
+      attaches to an existing one, the default is False
+    '''
+
+    from multiprocessing import shared_memory
+    size = 8 + 3 * self.n_keys
+    # only the creator removes the block: the resource tracker of an attached
+    # process would remove it when that process exits, under the producer
+    untrack = not create and os.name == 'posix'
+    if untrack and sys.version_info >= (3, 13):
+      self.shm = shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+    else:
+      self.shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+      if untrack:
+        from multiprocessing import resource_tracker
+        # registered with the name given to shm_open(), with a leading '/'
+        resource_tracker.unregister('/' + self.shm.name, 'shared_memory')
+    self.is_owner = create
+    self._sequence = np.ndarray((1,), np.uint64, buffer=self.shm.buf, offset=0)
+    self.rgb = np.ndarray((self.n_keys, 3), np.uint8, buffer=self.shm.buf, offset=8)
+    if create:
+      self._sequence[0] = 0
+      self.rgb[...] = 0
+
+  @property
+  def sequence(self):
+    '''
+    Sequence counter, incremented every time a producer changes the frame
+    '''
+
+    return int(self._sequence[0])
+
+  def mark_changed(self):
+    '''
+    Increments the sequence counter, to be called after writing in rgb
+    '''
+
+    self._sequence[0] += 1
+
+  @contextmanager
+  def edit(self):
+    '''
+    Context manager that gives the shared (128, 3) array to write in place,
+    and marks the frame as changed at the end
+    '''
+
+    try:
+      yield self.rgb
+    finally:
+      self.mark_changed()
+
+  def close(self):
+    '''
+    Detaches from the shared memory block, and removes it if it was created here
+    '''
+
+    del self._sequence, self.rgb
+    self.shm.close()
+    if self.is_owner:
+      self.shm.unlink()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+
+class FramePusher:
+  """
+  Sends a SharedFrame to the keyboard when its sequence counter changes
+  """
+
+  def __init__(self, keyboard, shared, max_fps = 30, refresh_s = 1.0):
+    '''
+    Parameters
+    ----------
+    keyboard : KeyboardFusionRGB
+      DESCRIPTION. Keyboard, it has to be in Custom mode
+    shared : SharedFrame
+      DESCRIPTION. Shared frame to send
+    max_fps : Float, optional
+      DESCRIPTION. Maximum frames sent per second, the default is 30
+    refresh_s : Float, optional
+      DESCRIPTION. The frame is also checked every refresh_s seconds even if the
+      counter did not change (e.g. concurrent increments), only changed requests
+      are sent, the default is 1.0
+    '''
+
+    self.keyboard  = keyboard
+    self.shared    = shared
+    self.max_fps   = max_fps
+    self.refresh_s = refresh_s
+    self.running   = False
+    self.n_pushed  = 0   # frames with changes sent to the keyboard
+
+  def push(self):
+    '''
+    Sends the current content of the shared frame
+
+    Returns
+    -------
+    n_sent : Int
+      DESCRIPTION. Number of requests sent to the keyboard (0, 1 or 2)
+    '''
+
+    n_sent = self.keyboard.set_custom_frame(self.shared.rgb)
+    if n_sent:
+      self.n_pushed += 1
+    return n_sent
+
+  def stop(self):
+    self.running = False
+
+  def run(self, duration_s = None):
+    '''
+    Sends the shared frame when it changes, until the duration is reached or
+    stop() is called
+    '''
+
+    period = 1.0 / self.max_fps
+    t_start = time.monotonic()
+    t_next = t_start
+    t_refresh = t_start
+    last_sequence = None
+    self.running = True
+    while self.running:
+      now = time.monotonic()
+      if duration_s is not None and now - t_start >= duration_s:
+        break
+      sequence = self.shared.sequence
+      if sequence != last_sequence or now >= t_refresh:
+        # the counter is read before sending, a change during the sending
+        # is sent in the next period
+        last_sequence = sequence
+        t_refresh = now + self.refresh_s
+        self.push()
+      t_next = max(t_next + period, time.monotonic())
+      time.sleep(max(0.0, t_next - time.monotonic()))
+    self.running = False
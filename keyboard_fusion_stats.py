@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Instrumentation of the HID I/O of the Fusion RGB Keyboard
+
+IOStats counts the feature reports sent and received per opcode, the bytes
+transferred, the time spent in send_feature_report() / get_feature_report()
+and sleeping between reports, the errors, and keeps a latency histogram for
+each public method of KeyboardFusionRGB. Hooks (callables) are called with
+every event.
+
+Nothing is measured while the instrumentation is disabled: enabling it wraps
+the transport and the public methods of the keyboard instance, and disabling
+it removes the wrappers. The calls recorded by batch(), or counted in its dry
+run, send nothing and are not added to the latency histograms.
+
+Example:
+  stats = keyboard.enable_stats()
+  stats.add_hook(lambda event, name, value: print(event, name, value))
+  keyboard.set_static_mode(color_rgb=[0xff, 0x00, 0x00])
+  print(stats.snapshot())
+  keyboard.disable_stats()
+
+Events given to the hooks as hook(event, name, value):
+  'send'    : opcode of the request,  seconds in send_feature_report()
+  'receive' : opcode of the request,  seconds in get_feature_report()
+  'call'    : name of the method,     seconds in the method
+  'error'   : kind of error,          message
+
+@author: Raymundo Cassani
+"""
+import math
+import time
+from functools import wraps
+
+from keyboard_fusion_rgb import MODE_SETTERS
+
+# public methods of KeyboardFusionRGB with a latency histogram
+INSTRUMENTED_METHODS = MODE_SETTERS + ('set_custom_mode', 'set_brightness', 'apply_mode_configuration',
+                                       'get_current_status', 'clean_configuration',
+                                       'get_custom_frame', 'set_custom_frame',
+                                       'get_custom_configuration', 'set_custom_configuration',
+                                       'write_keyboard_request')
+
+OPCODE_NAMES = {0x02: 'set mode', 0x82: 'read status', 0x8A: 'clean',
+                0x06: 'write custom frame', 0x86: 'read custom frame'}
+
+
+class LatencyHistogram:
+  """
+  Histogram of durations with logarithmic bins (powers of 2 seconds), from 1 us to 64 s
+  """
+
+  min_exp = -20   # 2**-20 s ~ 1 us
+  max_exp = 6     # 2**6 s = 64 s
+
+  def __init__(self):
+    self.bins    = [0] * (self.max_exp - self.min_exp + 1)
+    self.count   = 0
+    self.total_s = 0.0
+    self.min_s   = math.inf
+    self.max_s   = 0.0
+
+  def add(self, seconds):
+    '''
+    Adds a duration, bin i has the durations in [2**(i-1), 2**i) * 2**min_exp seconds
+    '''
+
+    exp = math.frexp(seconds)[1] if seconds > 0 else self.min_exp
+    ix = min(max(exp, self.min_exp), self.max_exp) - self.min_exp
+    self.bins[ix] += 1
+    self.count   += 1
+    self.total_s += seconds
+    if seconds < self.min_s:
+      self.min_s = seconds
+    if seconds > self.max_s:
+      self.max_s = seconds
+
+  def percentile(self, q):
+    '''
+    Upper limit of the bin that contains the q-th percentile (0 to 100)
+
+    Returns
+    -------
+    seconds : Float
+      DESCRIPTION. Approximate q-th percentile, 0 if there are no durations
+    '''
+
+    if self.count == 0:
+      return 0.0
+    target = q / 100 * self.count
+    n = 0
+    for ix, n_bin in enumerate(self.bins):
+      n += n_bin
+      if n >= target and n_bin:
+        return min(self.max_s, 2.0 ** (ix + self.min_exp))
+    return self.max_s
+
+  def to_dict(self):
+    return {'count'  : self.count,
+            'total_s': self.total_s,
+            'mean_s' : self.total_s / self.count if self.count else 0.0,
+            'min_s'  : self.min_s if self.count else 0.0,
+            'max_s'  : self.max_s,
+            'p50_s'  : self.percentile(50),
+            'p99_s'  : self.percentile(99),
+            'bins'   : {2.0 ** (ix + self.min_exp): n for ix, n in enumerate(self.bins) if n}}
+
+
+class InstrumentedTransport:
+  """
+  Transport wrapper that measures the feature reports of another transport
+  """
+
+  def __init__(self, transport, stats):
+    self.transport = transport
+    self.stats  = stats
+    self.opcode = None   # opcode of the last request, the response is counted for it
+
+  def open(self, vendor_id, product_id):
+    return self.transport.open(vendor_id, product_id)
+
+  def close(self):
+    return self.transport.close()
+
+  def send_feature_report(self, buf_req):
+    t_start = time.perf_counter()
+    n_bytes = self.transport.send_feature_report(buf_req)
+    self.opcode = buf_req[1]
+    self.stats.sent(self.opcode, len(buf_req), time.perf_counter() - t_start)
+    return n_bytes
+
+  def get_feature_report(self, report_num, max_length):
+    t_start = time.perf_counter()
+    buf_rsp = self.transport.get_feature_report(report_num, max_length)
+    self.stats.received(self.opcode, len(buf_rsp), time.perf_counter() - t_start)
+    return buf_rsp
+
+  def __getattr__(self, name):
+    # other attributes of the transport (e.g. status of EmulatedKeyboard)
+    return getattr(self.transport, name)
+
+
+class IOStats:
+  """
+  Counters and latency histograms of a KeyboardFusionRGB
+  """
+
+  def __init__(self, keyboard):
+    '''
+    Parameters
+    ----------
+    keyboard : KeyboardFusionRGB
+      DESCRIPTION. Keyboard to measure, the time sleeping is read from its pacer
+    '''
+
+    self.keyboard = keyboard
+    self.hooks = []
+    self.reset()
+
+  def reset(self):
+    '''
+    Sets all the counters and histograms to zero
+    '''
+
+    self.n_sent     = {}   # opcode: reports sent
+    self.n_received = {}   # opcode: responses received
+    self.bytes_sent     = 0
+    self.bytes_received = 0
+    self.send_s    = 0.0   # time in send_feature_report()
+    self.receive_s = 0.0   # time in get_feature_report()
+    self.errors    = {}    # kind: count
+    self.methods   = {}    # method: LatencyHistogram
+    self._sleep_start_s = self.keyboard.pacer.slept_s
+    self._t_start = time.perf_counter()
+
+  def add_hook(self, hook):
+    '''
+    Adds a callable hook(event, name, value), see the module description
+    '''
+
+    self.hooks.append(hook)
+
+  def remove_hook(self, hook):
+    self.hooks.remove(hook)
+
+  def _notify(self, event, name, value):
+    for hook in self.hooks:
+      hook(event, name, value)
+
+  def sent(self, opcode, n_bytes, seconds):
+    self.n_sent[opcode] = self.n_sent.get(opcode, 0) + 1
+    self.bytes_sent += n_bytes
+    self.send_s += seconds
+    if self.hooks:
+      self._notify('send', opcode, seconds)
+
+  def received(self, opcode, n_bytes, seconds):
+    self.n_received[opcode] = self.n_received.get(opcode, 0) + 1
+    self.bytes_received += n_bytes
+    self.receive_s += seconds
+    if self.hooks:
+      self._notify('receive', opcode, seconds)
+
+  def called(self, name, seconds):
+    histogram = self.methods.get(name)
+    if histogram is None:
+      histogram = self.methods[name] = LatencyHistogram()
+    histogram.add(seconds)
+    if self.hooks:
+      self._notify('call', name, seconds)
+
+  def error(self, kind, message):
+    self.errors[kind] = self.errors.get(kind, 0) + 1
+    if self.hooks:
+      self._notify('error', kind, message)
+
+  @property
+  def sleep_s(self):
+    '''
+    Time in seconds sleeping between reports since the last reset
+    '''
+
+    return self.keyboard.pacer.slept_s - self._sleep_start_s
+
+  def snapshot(self):
+    '''
+    Copy of the current counters
+
+    Returns
+    -------
+    snapshot : Dictionary
+      DESCRIPTION. Counters and histograms as plain values, the opcodes are
+      the keys of 'sent' and 'received'
+    '''
+
+    return {'elapsed_s'     : time.perf_counter() - self._t_start,
+            'sent'          : dict(self.n_sent),
+            'received'      : dict(self.n_received),
+            'bytes_sent'    : self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'send_s'        : self.send_s,
+            'receive_s'     : self.receive_s,
+            'sleep_s'       : self.sleep_s,
+            'errors'        : dict(self.errors),
+            'methods'       : {name: histogram.to_dict() for name, histogram in self.methods.items()}}
+
+  def report(self):
+    '''
+    Snapshot as text table
+    '''
+
+    lines = ['{:<26} {:>8} {:>8}'.format('opcode', 'sent', 'received')]
+    for opcode in sorted(set(self.n_sent) | set(self.n_received)):
+      lines.append('{:<26} {:>8d} {:>8d}'.format('0x{:02X} {}'.format(opcode, OPCODE_NAMES.get(opcode, '')),
+                                                  self.n_sent.get(opcode, 0),
+                                                  self.n_received.get(opcode, 0)))
+    lines.append('bytes sent / received : {:d} / {:d}'.format(self.bytes_sent, self.bytes_received))
+    lines.append('time send / receive / sleep (s) : {:.4f} / {:.4f} / {:.4f}'.format(
+                 self.send_s, self.receive_s, self.sleep_s))
+    lines.append('errors : ' + (', '.join('{} {:d}'.format(kind, n) for kind, n in self.errors.items())
+                                or 'none'))
+    lines.append('{:<26} {:>6} {:>10} {:>10} {:>10}'.format('method', 'calls', 'mean ms', 'p99 ms', 'max ms'))
+    for name, histogram in sorted(self.methods.items()):
+      stats = histogram.to_dict()
+      lines.append('{:<26} {:>6d} {:>10.3f} {:>10.3f} {:>10.3f}'.format(
+                   name, stats['count'], stats['mean_s'] * 1e3, stats['p99_s'] * 1e3, stats['max_s'] * 1e3))
+    return '\n'.join(lines)
+
+
+def _timed_method(stats, keyboard, name, method):
+  '''
+  Bound method that adds its duration to the histogram of name, except while
+  the keyboard records a batch() or counts its requests (nothing is sent)
+  '''
+
+  @wraps(method)
+  def timed(*args, **kwargs):
+    if keyboard._capture is not None or keyboard._dry_run:
+      return method(*args, **kwargs)
+    t_start = time.perf_counter()
+    try:
+      return method(*args, **kwargs)
+    finally:
+      stats.called(name, time.perf_counter() - t_start)
+  return timed
+
+
+def install(keyboard, stats):
+  '''
+  Wraps the transport and the public methods of the keyboard instance
+  '''
+
+  keyboard.hid_kb = InstrumentedTransport(keyboard.hid_kb, stats)
+  for name in INSTRUMENTED_METHODS:
+    setattr(keyboard, name, _timed_method(stats, keyboard, name, getattr(keyboard, name)))
+
+
+def uninstall(keyboard):
+  '''
+  Removes the wrappers added by install()
+  '''
+
+  keyboard._remove_transport_wrapper(InstrumentedTransport)
+  for name in INSTRUMENTED_METHODS:
+    keyboard.__dict__.pop(name, None)
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Protocol trace capture and replay for the Fusion RGB Keyboard
+
+Every feature report sent to and received from the keyboard is appended to a
+binary trace file with its timestamp. A trace is replayed by streaming the
+recorded requests directly to the transport, without the mode logic of
+KeyboardFusionRGB, so a pre-rendered light show costs only the I/O. The
+trace is read with mmap, hour-long traces are not loaded in memory.
+
+File format, all integers are little endian:
+  Header : magic b'KFTRACE\\0' (8 bytes), version (2 bytes), report size (2 bytes)
+  Record : time (float64, seconds since the epoch), direction (1 byte,
+           0 = sent, 1 = received), report (report size bytes)
+
+Example:
+  keyboard.start_trace('show.kftrace')
+  Animation(keyboard, frame_fn, fps = 30).run(duration_s = 60)
+  keyboard.stop_trace()
+
+  replay(keyboard, 'show.kftrace')                  # original timing
+  replay(keyboard, 'show.kftrace', timing = 'fast') # as fast as the keyboard allows
+
+@author: Raymundo Cassani
+"""
+import mmap
+import os
+import struct
+import time
+
+MAGIC     = b'KFTRACE\0'
+VERSION   = 1
+SENT      = 0
+RECEIVED  = 1
+
+_HEADER = struct.Struct('<8sHH')
+_RECORD = struct.Struct('<dB')
+
+
+class TraceWriter:
+  """
+  Appends feature reports to a trace file
+  """
+
+  def __init__(self, path, report_size = 264):
+    '''
+    Parameters
+    ----------
+    path : String
+      DESCRIPTION. Trace file, the records are appended if it exists
+    report_size : Int, optional
+      DESCRIPTION. Bytes of each report, the default is 264
+    '''
+
+    self.path = path
+    self.report_size = report_size
+    self.n_records = 0
+    self.file = open(path, 'ab')
+    if self.file.tell() == 0:
+      self.file.write(_HEADER.pack(MAGIC, VERSION, report_size))
+    else:
+      with open(path, 'rb') as f:
+        magic, version, size = _HEADER.unpack(f.read(_HEADER.size))
+      if magic != MAGIC or size != report_size:
+        self.file.close()
+        raise ValueError('Not a trace with {:d}-byte reports: {}'.format(report_size, path))
+
+  def record(self, direction, buf):
+    '''
+    Appends a report, shorter reports are padded with zeros
+    '''
+
+    buf = bytes(buf)
+    if len(buf) != self.report_size:
+      buf = buf[:self.report_size].ljust(self.report_size, b'\0')
+    self.file.write(_RECORD.pack(time.time(), direction))
+    self.file.write(buf)
+    self.n_records += 1
+
+  def flush(self):
+    self.file.flush()
+
+  def close(self):
+    self.file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+
+class TracingTransport:
+  """
+  Transport wrapper that records the feature reports of another transport
+  """
+
+  def __init__(self, transport, writer):
+    self.transport = transport
+    self.writer = writer
+
+  def open(self, vendor_id, product_id):
+    return self.transport.open(vendor_id, product_id)
+
+  def close(self):
+    return self.transport.close()
+
+  def send_feature_report(self, buf_req):
+    n_bytes = self.transport.send_feature_report(buf_req)
+    self.writer.record(SENT, buf_req)
+    return n_bytes
+
+  def get_feature_report(self, report_num, max_length):
+    buf_rsp = self.transport.get_feature_report(report_num, max_length)
+    self.writer.record(RECEIVED, buf_rsp)
+    return buf_rsp
+
+  def __getattr__(self, name):
+    return getattr(self.transport, name)
+
+
+class Trace:
+  """
+  Read-only access to a trace file through mmap
+  """
+
+  def __init__(self, path):
+    self.path = path
+    self.file = open(path, 'rb')
+    size = os.fstat(self.file.fileno()).st_size
+    if size < _HEADER.size:
+      self.file.close()
+      raise ValueError('Not a trace file: ' + path)
+    self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, self.report_size = _HEADER.unpack_from(self.mm, 0)
+    if magic != MAGIC or version != VERSION:
+      self.close()
+      raise ValueError('Not a trace file: ' + path)
+    self.record_size = _RECORD.size + self.report_size
+    # an incomplete last record (e.g. writer interrupted) is ignored
+    self.n_records = (size - _HEADER.size) // self.record_size
+
+  def __len__(self):
+    return self.n_records
+
+  def _offset(self, ix):
+    return _HEADER.size + ix * self.record_size
+
+  def __getitem__(self, ix):
+    '''
+    Returns
+    -------
+    t : Float
+      DESCRIPTION. Time of the report in seconds since the epoch
+    direction : Int
+      DESCRIPTION. SENT or RECEIVED
+    report : bytes
+      DESCRIPTION. Feature report
+    '''
+
+    if ix < 0:
+      ix += self.n_records
+    if not 0 <= ix < self.n_records:
+      raise IndexError('record out of range')
+    offset = self._offset(ix)
+    t, direction = _RECORD.unpack_from(self.mm, offset)
+    start = offset + _RECORD.size
+    return t, direction, self.mm[start:start + self.report_size]
+
+  def __iter__(self):
+    for ix in range(self.n_records):
+      yield self[ix]
+
+  @property
+  def duration_s(self):
+    if self.n_records < 2:
+      return 0.0
+    return self[-1][0] - self[0][0]
+
+  def close(self):
+    self.mm.close()
+    self.file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+
+def replay(keyboard, path, timing = 'original', speed = 1.0, read_responses = True):
+  '''
+  Sends the requests of a trace to the keyboard, the mode logic and the
+  shadow copy of KeyboardFusionRGB are skipped. The shadow copy is invalidated
+  at the end, as the state of the keyboard is the one left by the trace
+
+  Parameters
+  ----------
+  keyboard : KeyboardFusionRGB
+    DESCRIPTION. Keyboard, its transport and pacer are used
+  path : String
+    DESCRIPTION. Trace file
+  timing : String, optional
+    DESCRIPTION. 'original' keeps the time between the recorded requests
+    (divided by speed), 'fast' sends them as fast as the pacer allows,
+    the default is 'original'
+  speed : Float, optional
+    DESCRIPTION. Speed factor for the 'original' timing, the default is 1.0
+  read_responses : Boolean, optional
+    DESCRIPTION. Reads the response of the requests that had one in the trace
+    (the keyboard may expect it), the responses are discarded, the default is True
+
+  Returns
+  -------
+  n_sent : Int
+    DESCRIPTION. Number of requests sent
+  '''
+
+  if timing not in ('original', 'fast'):
+    raise ValueError("timing must be 'original' or 'fast'")
+  if not keyboard.open_hid_comm():
+    return 0
+  pacer = keyboard.pacer
+  transport = keyboard.hid_kb
+  report_size = keyboard.data_size
+  n_sent = n_received = 0
+  with Trace(path) as trace:
+    mm, n_records, record_size = trace.mm, trace.n_records, trace.record_size
+    unpack_from = _RECORD.unpack_from
+    t_first = None
+    t_start = time.perf_counter()
+    for ix in range(n_records):
+      offset = trace._offset(ix)
+      t, direction = unpack_from(mm, offset)
+      if direction != SENT:
+        continue
+      start = offset + _RECORD.size
+      buf_req = mm[start:start + trace.report_size]
+      # direction of the next record, right after its time
+      has_rsp = (read_responses and ix + 1 < n_records and
+                 mm[offset + record_size + 8] == RECEIVED)
+      if timing == 'original':
+        if t_first is None:
+          t_first = t
+        delay = t_start + (t - t_first) / speed - time.perf_counter()
+        if delay > 0:
+          time.sleep(delay)
+      try:
+        pacer.wait()
+        transport.send_feature_report(buf_req)
+        pacer.done()
+        n_sent += 1
+        if has_rsp:
+          pacer.wait()
+          transport.get_feature_report(report_size, report_size)
+          pacer.done()
+          n_received += 1
+      except Exception as error:
+        pacer.error()
+        keyboard._error('replay', 'Error replaying record {:d} of the trace: {}'.format(ix, error))
+        break
+  keyboard.n_reports += n_sent + n_received
+  keyboard.invalidate_cache()
+  if not keyboard.persistent and keyboard.is_open:
+    keyboard.close_hid_comm()
+  return n_sent
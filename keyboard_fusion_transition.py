@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Transitions between Custom mode frames of the Fusion RGB Keyboard
+
+The whole sequence of interpolated frames between a start and an end frame
+is computed at once, as a (steps, 128, 3) uint8 array, with an easing curve
+and optionally blended in linear light (gamma-correct) through lookup
+tables. The sequence is then streamed to the keyboard at the paced rate, so
+a fade costs almost no CPU.
+
+Example:
+  keyboard.set_custom_mode(brightness = 100)
+  fade(keyboard, night_profile, duration_s = 2.0)     # from the current frame
+
+  frames = crossfade(frame_a, frame_b, steps = 50, easing = 'ease_out', gamma = 2.2)
+  play(keyboard, frames)
+
+@author: Raymundo Cassani
+"""
+import time
+
+import numpy as np
+
+from keyboard_fusion_rgb import CustomFrame
+
+# easing curves, progress 0..1 to weight 0..1
+EASINGS = {
+  'linear'     : lambda x: x,
+  'ease_in'    : lambda x: x * x,
+  'ease_out'   : lambda x: x * (2 - x),
+  'ease_in_out': lambda x: x * x * (3 - 2 * x),
+  'cubic'      : lambda x: np.where(x < 0.5, 4 * x ** 3, 1 - (-2 * x + 2) ** 3 / 2),
+}
+
+_ENCODE_SIZE = 4096   # entries of the linear to 8-bit table
+_MIN_FRAME_S = 0.01   # shortest frame of fade(), even with no gap between reports
+_gamma_luts = {}
+
+
+def gamma_luts(gamma = 2.2):
+  '''
+  Lookup tables between 8-bit values and linear light
+
+  Returns
+  -------
+  decode : Array (256,) of Float (32-bit)
+    DESCRIPTION. Linear light 0..1 of each 8-bit value
+  encode : Array (4096,) of Int (8-bit)
+    DESCRIPTION. 8-bit value of the linear light in (index / 4095)
+  '''
+
+  if gamma not in _gamma_luts:
+    decode = (np.arange(256) / 255) ** gamma
+    encode = np.rint((np.arange(_ENCODE_SIZE) / (_ENCODE_SIZE - 1)) ** (1 / gamma) * 255)
+    _gamma_luts[gamma] = (decode.astype(np.float32), encode.astype(np.uint8))
+  return _gamma_luts[gamma]
+
+
+def _as_rgb(frame, layout = None, base = None):
+  '''
+  (128, 3) uint8 array from a CustomFrame, an array or a dictionary (needs
+  layout, the keys not in it keep their color in base as in set_custom_configuration())
+  '''
+
+  if isinstance(frame, dict):
+    frame = CustomFrame.from_dict(frame, layout, base)
+  if isinstance(frame, CustomFrame):
+    return frame.rgb
+  return np.asarray(frame, dtype=np.uint8).reshape(-1, 3)
+
+
+def crossfade(start, end, steps, easing = 'ease_in_out', gamma = None):
+  '''
+  Computes the frames of a transition from start to end
+
+  Parameters
+  ----------
+  start, end : CustomFrame or Array (128, 3) of Int (8-bit)
+    DESCRIPTION. First and last frame
+  steps : Int
+    DESCRIPTION. Number of frames (at least 1), the last one is end
+  easing : String or callable, optional
+    DESCRIPTION. Name in EASINGS or function of the progress (Array 0..1),
+    the default is 'ease_in_out'
+  gamma : Float, optional
+    DESCRIPTION. Blends in linear light with this gamma (e.g. 2.2), so the
+    fades do not dip in brightness. The default is None, blends the 8-bit values
+
+  Returns
+  -------
+  frames : Array (steps, 128, 3) of Int (8-bit)
+  '''
+
+  if steps < 1:
+    raise ValueError('steps must be >= 1')
+  ease = EASINGS[easing] if isinstance(easing, str) else easing
+  weight = np.asarray(ease(np.arange(1, steps + 1) / steps), np.float32)[:, None, None]
+  start, end = _as_rgb(start), _as_rgb(end)
+  if gamma is None:
+    mix = start + (end.astype(np.float32) - start) * weight
+    return (mix + 0.5).astype(np.uint8)
+  decode, encode = gamma_luts(gamma)
+  lin_start, lin_end = decode[start], decode[end]
+  mix = lin_start + (lin_end - lin_start) * weight
+  frames = encode[(mix * (_ENCODE_SIZE - 1) + 0.5).astype(np.intp)]
+  # the encode table does not resolve the darkest values, the colors that do
+  # not change and the last frame are kept exact
+  is_same = start == end
+  frames[:, is_same] = start[is_same]
+  frames[-1] = end
+  return frames
+
+
+def play(keyboard, frames, fps = None):
+  '''
+  Sends the frames one after the other, only the changed requests of each
+  frame are sent
+
+  Parameters
+  ----------
+  keyboard : KeyboardFusionRGB
+    DESCRIPTION. Keyboard in Custom mode
+  frames : Array (steps, 128, 3) of Int (8-bit)
+    DESCRIPTION. Frames to send
+  fps : Float, optional
+    DESCRIPTION. Frames per second, a frame that is late is sent right away.
+    The default is None, as fast as the pacer of the keyboard allows
+
+  Returns
+  -------
+  n_sent : Int
+    DESCRIPTION. Number of requests sent
+  '''
+
+  n_sent = 0
+  t_start = time.perf_counter()
+  for ix, frame in enumerate(frames):
+    if fps is not None:
+      delay = t_start + ix / fps - time.perf_counter()
+      if delay > 0:
+        time.sleep(delay)
+    n_sent += keyboard.set_custom_frame(frame) or 0
+  return n_sent
+
+
+def fade(keyboard, end, duration_s = 1.0, easing = 'ease_in_out', gamma = 2.2, start = None):
+  '''
+  Fades the Custom mode frame of the keyboard to end
+
+  Parameters
+  ----------
+  keyboard : KeyboardFusionRGB
+    DESCRIPTION. Keyboard in Custom mode
+  end : CustomFrame, Array (128, 3) of Int (8-bit), or Dictionary
+    DESCRIPTION. Final frame, a dictionary as for set_custom_configuration():
+    the keys that are not in it keep their color in start
+  duration_s : Float, optional
+    DESCRIPTION. Duration in seconds, the number of frames is the ones the
+    keyboard can show in this time, the default is 1.0. With 0 only the
+    final frame is sent
+  easing, gamma :
+    DESCRIPTION. See crossfade(), the default gamma is 2.2
+  start : optional
+    DESCRIPTION. First frame, the default is None, the current frame (shadow copy)
+
+  Returns
+  -------
+  n_sent : Int
+    DESCRIPTION. Number of requests sent
+  '''
+
+  if start is None:
+    start = keyboard.get_cached_custom_frame()
+  start = CustomFrame(_as_rgb(start, keyboard.layout))
+  end = _as_rgb(end, keyboard.layout, base=start)
+  if duration_s <= 0:
+    return keyboard.set_custom_frame(end) or 0
+  # as many frames as the keyboard can show, a frame is up to 2 reports
+  steps = max(1, int(round(duration_s / max(2 * keyboard.delay_s, _MIN_FRAME_S))))
+  frames = crossfade(start, end, steps, easing, gamma)
+  return play(keyboard, frames, fps = steps / duration_s)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Non-blocking access to the Fusion RGB Keyboard
+
+The methods of KeyboardFusionRGB are called from a dedicated thread, that
+owns the HID keyboard while the writer is running. The calls return
+immediately with a Future. Pending Custom mode frames (set_custom_frame())
+and brightness changes are coalesced: only the newest one is sent, and the
+Futures of the discarded ones complete with it.
+
+Example:
+  with BackgroundWriter(keyboard) as writer:
+    writer.set_custom_mode(brightness = 100)
+    for frame in frames:
+      writer.set_custom_frame(frame)       # returns immediately
+    writer.set_brightness(80).result()     # waits until it is sent
+
+@author: Raymundo Cassani
+"""
+import collections
+import threading
+from concurrent.futures import Future, wait
+
+class BackgroundWriter:
+  """
+  Calls the methods of a KeyboardFusionRGB from a dedicated I/O thread
+  """
+
+  # methods whose pending calls are replaced by newer calls with the same key
+  # (set_custom_configuration() is not: a dictionary may update only some keys)
+  coalesce_keys = {'set_custom_frame': 'frame',
+                   'set_brightness':   'brightness'}
+
+  def __init__(self, keyboard):
+    '''
+    Parameters
+    ----------
+    keyboard : KeyboardFusionRGB
+      DESCRIPTION. Keyboard, it should not be used directly while the writer runs
+    '''
+
+    self.keyboard  = keyboard
+    self.pending   = collections.deque()  # [method name, args, kwargs, futures]
+    self.condition = threading.Condition()
+    self.in_flight   = []                 # futures of the call being sent
+    self.n_coalesced = 0
+    self.is_running  = True
+    self.thread = threading.Thread(target=self._run, name='KeyboardFusionRGB writer', daemon=True)
+    self.thread.start()
+
+  def submit(self, name, *args, **kwargs):
+    '''
+    Queues a call to the method name of the keyboard
+
+    Returns
+    -------
+    future : Future
+      DESCRIPTION. Completed with the return value of the method
+    '''
+
+    future = Future()
+    key = self.coalesce_keys.get(name)
+    with self.condition:
+      if not self.is_running:
+        raise RuntimeError('BackgroundWriter is closed')
+      # a pending call with the same key is replaced, unless a call that is
+      # not coalesced (e.g. a mode change) is queued after it
+      for request in reversed(self.pending):
+        request_key = self.coalesce_keys.get(request[0])
+        if request_key is None:
+          break
+        if key is not None and request_key == key:
+          request[0:3] = [name, args, kwargs]
+          request[3].append(future)
+          self.n_coalesced += 1
+          return future
+      self.pending.append([name, args, kwargs, [future]])
+      self.condition.notify()
+    return future
+
+  def __getattr__(self, name):
+    '''
+    Non-blocking version of the KeyboardFusionRGB methods, they return a Future
+    '''
+
+    if name.startswith('_') or not callable(getattr(self.keyboard, name, None)):
+      raise AttributeError(name)
+    def method(*args, **kwargs):
+      return self.submit(name, *args, **kwargs)
+    return method
+
+  def _run(self):
+    # session mode while the thread runs, the mode of the caller is restored after it
+    persistent = self.keyboard.persistent
+    self.keyboard.open()
+    try:
+      while True:
+        with self.condition:
+          while self.is_running and not self.pending:
+            self.condition.wait()
+          if not self.pending:
+            break
+          name, args, kwargs, futures = self.pending.popleft()
+          self.in_flight = futures
+        futures = [future for future in futures if future.set_running_or_notify_cancel()]
+        if not futures:
+          continue
+        try:
+          result = getattr(self.keyboard, name)(*args, **kwargs)
+        except BaseException as error:
+          for future in futures:
+            future.set_exception(error)
+        else:
+          for future in futures:
+            future.set_result(result)
+    finally:
+      self.keyboard.close()
+      self.keyboard.persistent = persistent
+
+  def flush(self, timeout = None):
+    '''
+    Waits until all the queued calls are sent
+    '''
+
+    with self.condition:
+      futures = self.in_flight + [f for request in self.pending for f in request[3]]
+    wait(futures, timeout)
+
+  def close(self, wait = True):
+    '''
+    Sends the queued calls and stops the thread
+    '''
+
+    with self.condition:
+      self.is_running = False
+      self.condition.notify()
+    if wait:
+      self.thread.join()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
@@ -3,7 +3,17 @@ from setuptools import setup
 setup(name='keyboard_fusion_rgb',
       version='1.0',
       description='Driver to control the lights in the keyboard (ID 1044:7AEC) in laptop AOURUS',
-      py_modules=['keyboard_fusion_rgb'],
+      py_modules=['keyboard_fusion_rgb', 'keyboard_fusion_emulator',
+                  'keyboard_fusion_animation', 'keyboard_fusion_writer',
+                  'keyboard_fusion_async', 'keyboard_fusion_daemon',
+                  'keyboard_fusion_shm', 'keyboard_fusion_manager',
+                  'keyboard_fusion_cli', 'keyboard_fusion_stats',
+                  'keyboard_fusion_trace', 'keyboard_fusion_geometry',
+                  'keyboard_fusion_effects', 'keyboard_fusion_transition',
+                  'keyboard_fusion_color', 'keyboard_fusion_presets'],
+      packages=['keyboard_fusion_layouts'],
+      package_data={'keyboard_fusion_layouts': ['*.txt']},
+      entry_points={'console_scripts': ['keyboard-fusion-rgb=keyboard_fusion_cli:main']},
       url='https://github.com/rcassani/keyboard-fusion-rgb',
       author='Raymundo Cassani',
       author_email='raymundo.cassani@gmail.com',
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fixtures for the behaviour tests, they run against the emulated keyboard
+
+@author: Raymundo Cassani
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from keyboard_fusion_rgb import KeyboardFusionRGB
+from keyboard_fusion_emulator import EmulatedKeyboard
+
+
+@pytest.fixture
+def emulator():
+  return EmulatedKeyboard()
+
+
+@pytest.fixture
+def keyboard(emulator):
+  # no gap between reports, the emulator does not need it
+  keyboard = KeyboardFusionRGB(transport=emulator)
+  keyboard.delay_s = 0
+  return keyboard
+
+
+def n_handled(emulator):
+  '''
+  Feature reports handled by the emulator (sent and received)
+  '''
+
+  return emulator.n_sent + emulator.n_received
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fixed frame rate animations with frame dropping
+
+@author: Raymundo Cassani
+"""
+import numpy as np
+import pytest
+
+from keyboard_fusion_animation import Animation, AnimationStats
+from keyboard_fusion_emulator import EmulatedKeyboard
+from keyboard_fusion_rgb import KeyboardFusionRGB
+
+
+def _frame(ix, t):
+  return np.full((128, 3), ix % 256, np.uint8)
+
+
+def test_frames_are_shown_in_order(keyboard, emulator):
+  shown = []
+  animation = Animation(keyboard, lambda ix, t: shown.append(ix) or _frame(ix, t), fps=50)
+  stats = animation.run(n_frames=5)
+  assert shown == [0, 1, 2, 3, 4]
+  assert stats.frames_shown == 5 and stats.frames_dropped == 0
+  assert emulator.custom_pages[0x01][0] == 4
+
+
+def test_late_frames_are_dropped():
+  # each frame takes 2 reports of 20 ms, the schedule is 10 ms per frame
+  keyboard = KeyboardFusionRGB(transport=EmulatedKeyboard(latency_s=0.02))
+  keyboard.delay_s = 0
+  stats = Animation(keyboard, _frame, fps=100).run(n_frames=20)
+  assert stats.frames_dropped > 0
+  assert stats.frames_shown + stats.frames_dropped == 20
+  assert stats.achieved_fps < 100
+
+
+def test_none_stops_the_animation(keyboard):
+  animation = Animation(keyboard, lambda ix, t: _frame(ix, t) if ix < 3 else None, fps=100)
+  stats = animation.run(duration_s=10)
+  assert stats.frames_shown == 3
+  assert not animation.running
+
+
+def test_lateness_statistics():
+  stats = AnimationStats(30)
+  for lateness_s in (0.001, 0.003, 0.002):
+    stats.add_lateness(lateness_s)
+  assert stats.n_lateness == 3
+  assert stats.mean_lateness_s == pytest.approx(0.002)
+  assert stats.max_lateness_s == 0.003
+  assert stats.jitter_s == pytest.approx(0.001)
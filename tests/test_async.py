@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+asyncio API
+
+@author: Raymundo Cassani
+"""
+import asyncio
+
+import numpy as np
+import pytest
+
+from keyboard_fusion_async import AsyncKeyboardFusionRGB
+
+
+@pytest.fixture
+def async_keyboard(emulator):
+  keyboard = AsyncKeyboardFusionRGB(transport=emulator)
+  keyboard.keyboard.delay_s = 0
+  return keyboard
+
+
+def test_mode_setters_are_idempotent(async_keyboard, emulator):
+  async def main():
+    async with async_keyboard:
+      await async_keyboard.set_wave_mode(color_rgb=[0x10, 0x20, 0x30], brightness=70)
+      n_set, n_status = emulator.n_opcodes[0x02], emulator.n_opcodes.get(0x82, 0)
+      assert not await async_keyboard.set_wave_mode(color_rgb=[0x10, 0x20, 0x30], brightness=70)
+      assert emulator.n_opcodes[0x02] == n_set
+      assert emulator.n_opcodes[0x82] == n_status + 1      # confirmed with the status
+  asyncio.run(main())
+  assert emulator.status[10] == 0x0B and emulator.status[12] == 70
+
+
+def test_custom_mode_and_frames(async_keyboard, emulator):
+  async def main():
+    async with async_keyboard:
+      dict_keys = await async_keyboard.set_custom_mode({'A': [0x01, 0x02, 0x03]}, brightness=100)
+      assert dict_keys['A'] == [0x01, 0x02, 0x03]
+      assert await async_keyboard.set_custom_frame(np.full((128, 3), 0x40, np.uint8)) == 2
+      assert await async_keyboard.set_custom_frame(np.full((128, 3), 0x40, np.uint8)) == 0
+      frame = await async_keyboard.get_custom_frame()
+      assert (frame.rgb == 0x40).all()
+  asyncio.run(main())
+  assert emulator.status[10] == 0x12
+
+
+def test_gaps_do_not_block_the_event_loop(async_keyboard, emulator):
+  async_keyboard.keyboard.delay_s = 0.01
+  ticks = []
+
+  async def ticker():
+    for _ in range(20):
+      ticks.append(emulator.n_sent)
+      await asyncio.sleep(0.001)
+
+  async def main():
+    async with async_keyboard:
+      await asyncio.gather(ticker(), async_keyboard.set_brightness(10),
+                           async_keyboard.set_brightness(20), async_keyboard.set_brightness(30))
+  asyncio.run(main())
+  assert emulator.status[12] == 30
+  # the ticker ran between the reports
+  assert len(set(ticks)) > 1
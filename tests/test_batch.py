@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batch transactions
+
+@author: Raymundo Cassani
+"""
+from conftest import n_handled
+
+
+def test_batch_sends_the_final_state(keyboard, emulator):
+  keyboard.set_static_mode()
+  keyboard.get_custom_frame()                    # frame known
+  n_start = n_handled(emulator)
+  with keyboard.batch() as batch:
+    keyboard.set_custom_mode(brightness=100)
+    keyboard.set_custom_configuration({'A': [0x00, 0x00, 0xFF]})
+    keyboard.set_brightness(80)
+    assert n_handled(emulator) == n_start       # nothing sent while recording
+  # clean (2 reports), set mode with the final brightness, Blue page of the frame
+  assert batch.n_reports == 4
+  assert n_handled(emulator) == n_start + batch.n_reports
+  assert emulator.n_opcodes[0x02] == 2
+  assert emulator.status[10] == 0x12 and emulator.status[12] == 80
+  assert batch.n_saved > 0
+
+
+def test_batch_counts_the_reads_at_commit(keyboard, emulator):
+  slot = keyboard.layout.slot('Z')
+  emulator.custom_pages[0x01][slot] = 0x77       # frame not known by the driver
+  n_start = n_handled(emulator)
+  with keyboard.batch() as batch:
+    assert keyboard.set_custom_mode(brightness=100) is None
+    keyboard.set_custom_configuration({'A': [0x01, 0x02, 0x03]})
+    keyboard.set_custom_configuration({'S': [0x04, 0x05, 0x06]})
+    assert n_handled(emulator) == n_start
+  assert n_handled(emulator) == n_start + batch.n_reports
+  frame = keyboard.get_custom_frame()
+  assert frame.rgb[keyboard.layout.slot('A')].tolist() == [0x01, 0x02, 0x03]
+  assert frame.rgb[keyboard.layout.slot('S')].tolist() == [0x04, 0x05, 0x06]
+  assert frame.rgb[slot, 0] == 0x77
+
+
+def test_record_mode_call_keeps_recording(keyboard, emulator):
+  n_start = n_handled(emulator)
+  with keyboard.batch():
+    keyboard.set_static_mode(color_rgb=[0xFF, 0x00, 0x00])
+    keyboard.record_mode_call('set_wave_mode')
+    keyboard.set_brightness(10)
+    assert n_handled(emulator) == n_start
+  assert emulator.status[10] == 0x00 and emulator.status[12] == 10
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shadow copy of the keyboard state
+
+@author: Raymundo Cassani
+"""
+import time
+
+from conftest import n_handled
+
+from keyboard_fusion_rgb import KeyboardFusionRGB
+
+
+def _n_frame_reads(emulator):
+  return emulator.n_opcodes.get(0x86, 0)
+
+
+def test_brightness_is_one_report(keyboard, emulator):
+  keyboard.set_static_mode(color_rgb=[0xFF, 0x00, 0x00])
+  n_start = n_handled(emulator)
+  keyboard.set_brightness(80)
+  assert n_handled(emulator) == n_start + 1
+  assert emulator.status[12] == 80
+  assert emulator.status[14:17] == bytes([0xFF, 0x00, 0x00])
+
+
+def test_custom_mode_uses_the_cached_frame(keyboard, emulator):
+  keyboard.set_custom_mode({'A': [0x01, 0x02, 0x03]}, brightness=100)
+  n_reads = _n_frame_reads(emulator)
+  dict_keys = keyboard.set_custom_mode(brightness=100)
+  assert dict_keys['A'] == [0x01, 0x02, 0x03]
+  assert _n_frame_reads(emulator) == n_reads
+
+
+def test_invalidate_cache_reads_again(keyboard, emulator):
+  keyboard.set_static_mode()
+  keyboard.invalidate_cache()
+  n_status = emulator.n_opcodes.get(0x82, 0)
+  keyboard.set_brightness(30)
+  assert emulator.n_opcodes[0x82] == n_status + 1
+
+
+def test_expired_entries_are_read_again(emulator):
+  keyboard = KeyboardFusionRGB(transport=emulator, cache_ttl_s=0)
+  keyboard.delay_s = 0
+  keyboard.set_static_mode()
+  n_status = emulator.n_opcodes.get(0x82, 0)
+  keyboard.set_brightness(30)
+  assert emulator.n_opcodes[0x82] == n_status + 1
+
+
+def test_revalidate_sees_external_changes(keyboard, emulator):
+  keyboard.set_custom_mode({'A': [0x01, 0x02, 0x03]}, brightness=100)
+  slot = keyboard.layout.slot('A')
+  emulator.custom_pages[0x01][slot] = 0xAA    # changed by other means
+  emulator.status[12] = 10
+  assert keyboard.get_cached_custom_frame().rgb[slot, 0] == 0x01
+  keyboard.revalidate()
+  assert keyboard.get_cached_custom_frame().rgb[slot, 0] == 0xAA
+  assert keyboard.get_cached_status()[12] == 10
+
+
+def test_external_changes_are_seen_after_the_ttl(emulator):
+  keyboard = KeyboardFusionRGB(transport=emulator, cache_ttl_s=0.05)
+  keyboard.delay_s = 0
+  keyboard.set_static_mode(color_rgb=[0xFF, 0x00, 0x00])
+  other = KeyboardFusionRGB(transport=emulator)
+  other.delay_s = 0
+  other.set_wave_mode()
+  time.sleep(0.06)
+  keyboard.set_brightness(80)
+  assert emulator.status[10] == 0x0B and emulator.status[12] == 80
+
+
+def test_default_ttl_is_finite(emulator):
+  assert KeyboardFusionRGB(transport=emulator).cache_ttl_s is not None
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Command line interface
+
+@author: Raymundo Cassani
+"""
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from keyboard_fusion_cli import build_parser, load_frame, main, parse_color, save_frame
+from keyboard_fusion_rgb import CustomFrame
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def test_parse_color():
+  assert parse_color('#ff8000') == [0xFF, 0x80, 0x00]
+  assert parse_color('1,2,3') == [1, 2, 3]
+  with pytest.raises(Exception):
+    parse_color('12345')
+
+
+def test_mode_options_do_not_depend_on_argv(capsys):
+  with pytest.raises(SystemExit):
+    build_parser().parse_args(['wave', '--help'])
+  help_text = capsys.readouterr().out
+  assert '--direction' in help_text and '--speed' in help_text
+  # an option value equal to the name of another command
+  args = build_parser().parse_args(['--layout', 'wave', 'static', '--color', 'ff0000'])
+  assert args.layout == 'wave' and args.setter == 'set_static_mode'
+  assert args.color_rgb == [0xFF, 0x00, 0x00]
+
+
+def test_mode_command(capsys):
+  assert main(['--emulate', 'wave', '--random', '--speed', '90', '--direction', 'left']) == 0
+  assert main(['--emulate', '--delay-ms', '0', 'status']) == 0
+  assert 'mode       : 0x00' in capsys.readouterr().out   # new emulated keyboard each time
+
+
+def test_json_frames(tmp_path, capsys):
+  file_name = str(tmp_path / 'frame.json')
+  assert main(['--emulate', 'frame-save', file_name]) == 0
+  with open(file_name) as f:
+    dict_keys = json.load(f)
+  assert dict_keys['A'] == [0, 0, 0] and 'N/A' not in dict_keys
+  with open(file_name, 'w') as f:
+    json.dump({'not a key': [1, 2, 3]}, f)
+  assert main(['--emulate', 'frame-load', file_name]) == 1
+  assert 'Unknown key name' in capsys.readouterr().err
+
+
+def test_raw_frames_are_color_planes(keyboard, emulator, tmp_path):
+  frame = np.arange(384, dtype=np.uint16).reshape(128, 3).astype(np.uint8)
+  keyboard.set_custom_frame(frame)
+  file_name = str(tmp_path / 'frame.raw')
+  with open(file_name, 'wb') as f:
+    f.write(keyboard.get_custom_bytes())
+  keyboard.set_custom_frame(np.zeros((128, 3), np.uint8))
+  load_frame(keyboard, file_name)
+  assert (keyboard.get_custom_frame().rgb == frame).all()
+  save_frame(keyboard, keyboard.get_custom_frame(), file_name)
+  with open(file_name, 'rb') as f:
+    assert f.read() == emulator.get_custom_bytes() == CustomFrame(frame).to_bytes()
+
+
+def test_mode_command_does_not_load_numpy():
+  code = ('import sys, keyboard_fusion_cli\n'
+          'keyboard_fusion_cli.main(["--emulate", "static"])\n'
+          'print("numpy" in sys.modules)')
+  output = subprocess.run([sys.executable, '-c', code], env=dict(os.environ, PYTHONPATH=ROOT),
+                          check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+  assert output.strip() == 'False'
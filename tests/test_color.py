@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Color pipeline and color conversions
+
+@author: Raymundo Cassani
+"""
+import colorsys
+
+import numpy as np
+import pytest
+
+from keyboard_fusion_color import ColorPipeline, hsl_to_rgb, hsv_to_rgb, rgb_to_hsv, to_uint8
+
+_GRID = np.linspace(0, 1, 11)
+
+
+def _grid():
+  return [(h, s, x) for h in _GRID for s in _GRID for x in _GRID]
+
+
+def test_hsv_and_hsl_match_colorsys():
+  h, s, x = np.array(_grid()).T
+  assert np.allclose(hsv_to_rgb(h, s, x), [colorsys.hsv_to_rgb(*hsx) for hsx in _grid()])
+  assert np.allclose(hsl_to_rgb(h, s, x), [colorsys.hls_to_rgb(h, l, s) for h, s, l in _grid()])
+  rgb = np.array(_grid())
+  hsv = rgb_to_hsv(rgb)
+  expected = np.array([colorsys.rgb_to_hsv(*color) for color in rgb])
+  assert np.allclose(hsv[:, 1:], expected[:, 1:])
+  # the hue is only defined for the colors that are not grey
+  is_grey = expected[:, 1] == 0
+  assert np.allclose(hsv[~is_grey, 0], expected[~is_grey, 0])
+
+
+def test_conversions_keep_the_shape():
+  h = np.random.rand(4, 128)
+  rgb = hsv_to_rgb(h, 1.0, 0.5)
+  assert rgb.shape == (4, 128, 3)
+  assert hsl_to_rgb(h, 0.5, 0.5).shape == (4, 128, 3)
+  assert rgb_to_hsv(to_uint8(rgb)).shape == (4, 128, 3)
+  assert to_uint8(rgb).dtype == np.uint8
+  assert list(to_uint8([[-0.5, 0.5, 2.0]])[0]) == [0, 128, 255]
+
+
+def test_lut_values():
+  values = np.arange(256)
+  assert ColorPipeline().is_identity
+  assert np.array_equal(ColorPipeline().lut, np.tile(values, (3, 1)))
+
+  pipeline = ColorPipeline(gamma=2.2)
+  assert not pipeline.is_identity
+  assert np.array_equal(pipeline.lut[0], np.rint((values / 255) ** 2.2 * 255))
+  assert pipeline.lut[0, 0] == 0 and pipeline.lut[0, 255] == 255
+
+  pipeline = ColorPipeline(white_balance=[1.0, 0.5, 0.25])
+  assert list(pipeline.lut[:, 255]) == [255, 128, 64]
+  assert list(pipeline.lut[:, 100]) == [100, 50, 25]
+
+  pipeline = ColorPipeline(dimming=0.5)
+  assert list(pipeline.lut[:, 200]) == [100, 100, 100]
+  pipeline.dimming = 1.0
+  assert pipeline.is_identity
+
+
+def test_apply_and_invert_round_trip():
+  pipeline = ColorPipeline(gamma=[2.2, 2.0, 1.8], white_balance=[1.0, 0.8, 0.6], dimming=0.9)
+  frames = np.random.randint(0, 256, (5, 128, 3)).astype(np.uint8)
+  corrected = pipeline.apply(frames)
+  assert corrected.shape == (5, 128, 3) and corrected.dtype == np.uint8
+  assert list(corrected[0, 0]) == [pipeline.lut[ix, frames[0, 0, ix]] for ix in range(3)]
+  inverted = pipeline.invert(corrected)
+  assert inverted.shape == (5, 128, 3)
+  assert np.array_equal(pipeline.apply(inverted), corrected)
+  # the inverse table gives back a value with the same correction
+  for ix in range(3):
+    assert np.array_equal(pipeline.lut[ix, pipeline.inverse_lut[ix, pipeline.lut[ix]]], pipeline.lut[ix])
+
+
+def test_apply_colors_matches_apply():
+  pipeline = ColorPipeline(gamma=2.2, white_balance=[1.0, 0.8, 0.6])
+  values = [0x10, 0x80, 0xFF, 0xFF, 0x00, 0x40]
+  assert pipeline.apply_colors(values) == pipeline.apply(np.reshape(values, (2, 3))).ravel().tolist()
+
+
+@pytest.mark.parametrize('setter, params, n_colors', [
+  ('set_static_mode', {'color_rgb': [0xFF, 0x80, 0x20]}, 1),
+  ('set_wave_mode', {'color_rgb': [0x10, 0x80, 0xFF]}, 1),
+])
+def test_mode_colors_are_corrected(keyboard, emulator, setter, params, n_colors):
+  pipeline = ColorPipeline(gamma=2.2, white_balance=[1.0, 0.8, 0.6])
+  getattr(keyboard, setter)(**params)
+  plain = bytes(emulator.status)
+  keyboard.color_pipeline = pipeline
+  getattr(keyboard, setter)(**params)
+  corrected = bytes(emulator.status)
+  # the colors are the last values of the mode configuration
+  end = max(ix for ix in range(len(plain)) if plain[ix] != 0) + 1
+  start = end - 3 * n_colors
+  assert list(corrected[start:end]) == pipeline.apply_colors(list(plain[start:end]))
+  assert corrected[:start] == plain[:start]
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Custom mode frames: delta writes and lossless round trip
+
+@author: Raymundo Cassani
+"""
+import os
+
+import numpy as np
+import pytest
+
+from keyboard_fusion_color import ColorPipeline
+from keyboard_fusion_rgb import CustomFrame, KeyboardFusionRGB
+
+
+def _n_writes(emulator):
+  return emulator.n_opcodes.get(0x06, 0)
+
+
+def test_unchanged_frame_sends_nothing(keyboard, emulator):
+  frame = CustomFrame(np.full((128, 3), 0x40, np.uint8))
+  assert keyboard.set_custom_frame(frame) == 2
+  n_writes = _n_writes(emulator)
+  assert keyboard.set_custom_frame(frame.copy()) == 0
+  assert _n_writes(emulator) == n_writes
+
+
+def test_only_changed_pages_are_sent(keyboard, emulator):
+  frame = CustomFrame()
+  keyboard.set_custom_frame(frame)
+  slot = keyboard.layout.slot('A')
+
+  frame.rgb[slot] = [0x10, 0x00, 0x00]      # Red: page 1
+  n_writes = _n_writes(emulator)
+  assert keyboard.set_custom_frame(frame) == 1
+  assert _n_writes(emulator) == n_writes + 1
+  assert emulator.custom_pages[0x01][slot] == 0x10
+
+  frame.rgb[slot] = [0x10, 0x00, 0x20]      # Blue: page 2
+  assert keyboard.set_custom_frame(frame) == 1
+  assert emulator.custom_pages[0x02][slot] == 0x20
+  assert emulator.get_custom_bytes() == frame.to_bytes()
+
+
+def test_force_sends_both_pages(keyboard):
+  frame = CustomFrame()
+  keyboard.set_custom_frame(frame)
+  assert keyboard.set_custom_frame(frame, force=True) == 2
+
+
+def test_raw_bytes_round_trip(keyboard, emulator):
+  raw = os.urandom(384)
+  keyboard.set_custom_bytes(raw, verify=True)
+  assert emulator.get_custom_bytes() == raw
+  keyboard.invalidate_cache()
+  assert keyboard.get_custom_bytes() == raw
+
+
+def test_dictionary_has_no_unused_slots(keyboard):
+  dict_keys = keyboard.get_custom_configuration()
+  assert 'N/A' not in dict_keys
+  assert set(dict_keys) == set(keyboard.layout.index)
+
+
+def test_dictionary_round_trip_keeps_unused_slots(keyboard, emulator):
+  raw = os.urandom(384)
+  emulator.custom_pages[0x01][:] = raw[:256]
+  emulator.custom_pages[0x02][:128] = raw[256:]
+
+  dict_keys = keyboard.get_custom_configuration()
+  keyboard.set_custom_configuration(dict_keys)
+  assert emulator.get_custom_bytes() == raw
+
+  dict_keys['A'] = [0x01, 0x02, 0x03]
+  keyboard.set_custom_configuration(dict_keys)
+  expected = CustomFrame.from_bytes(raw)
+  expected.rgb[keyboard.layout.slot('A')] = [0x01, 0x02, 0x03]
+  assert emulator.get_custom_bytes() == expected.to_bytes()
+
+
+def test_partial_dictionary_keeps_other_keys(keyboard):
+  keyboard.set_custom_configuration({'A': [0x11, 0x22, 0x33]})
+  keyboard.set_custom_configuration({'S': [0x44, 0x55, 0x66]})
+  dict_keys = keyboard.get_custom_configuration()
+  assert dict_keys['A'] == [0x11, 0x22, 0x33]
+  assert dict_keys['S'] == [0x44, 0x55, 0x66]
+
+
+def test_verify_detects_mismatch(keyboard, emulator):
+  keyboard.set_custom_frame(CustomFrame(np.full((128, 3), 0x80, np.uint8)))
+  assert len(keyboard.verify_custom_frame()) == 0
+  emulator.custom_pages[0x02][5] ^= 0xFF
+  assert keyboard.verify_custom_frame().tolist() == [5]
+
+
+def _restarted(keyboard, emulator):
+  '''
+  New driver for the same keyboard, without the shadow copy of the other one
+  '''
+
+  restarted = KeyboardFusionRGB(transport=emulator)
+  restarted.delay_s = 0
+  restarted.color_pipeline = keyboard.color_pipeline
+  return restarted
+
+
+@pytest.mark.parametrize('cold_cache', [False, True])
+def test_partial_dictionary_with_color_pipeline(keyboard, emulator, cold_cache):
+  keyboard.color_pipeline = ColorPipeline(dimming=0.5)
+  keyboard.set_custom_mode({'A': [100, 100, 100]}, brightness=100)
+  slot = keyboard.layout.slot('A')
+  stored = emulator.get_custom_bytes()
+  assert stored[slot] == 50
+
+  # keys that are not given are not corrected again
+  for value in (10, 20, 30):
+    if cold_cache:
+      keyboard = _restarted(keyboard, emulator)
+    keyboard.set_custom_configuration({'Q': [value, value, value]})
+    assert emulator.get_custom_bytes()[slot] == 50
+
+  keyboard.set_custom_configuration(keyboard.get_custom_configuration())
+  assert emulator.get_custom_bytes()[slot] == 50
+  if not cold_cache:
+    assert keyboard.get_custom_configuration()['A'] == [100, 100, 100]
+
+
+def test_color_pipeline_round_trip_is_byte_identical(keyboard, emulator):
+  keyboard.color_pipeline = ColorPipeline(gamma=2.2, white_balance=[1.0, 0.8, 0.6])
+  keyboard.set_custom_bytes(os.urandom(384))
+  stored = emulator.get_custom_bytes()
+  keyboard = _restarted(keyboard, emulator)
+  keyboard.set_custom_bytes(keyboard.get_custom_bytes(), force=True)
+  assert emulator.get_custom_bytes() == stored
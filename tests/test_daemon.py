@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lighting daemon and its client
+
+@author: Raymundo Cassani
+"""
+import os
+import socket
+import stat
+import threading
+
+import numpy as np
+import pytest
+
+from keyboard_fusion_daemon import KeyboardClient, KeyboardDaemon, OP_SET_MODE
+from keyboard_fusion_rgb import CustomFrame
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+  return str(tmp_path / 'kb.sock')
+
+
+@pytest.fixture
+def daemon(keyboard, socket_path):
+  daemon = KeyboardDaemon(keyboard, socket_path)
+  thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+  thread.start()
+  yield daemon
+  daemon.server.shutdown()
+  thread.join()
+
+
+def test_clients_share_the_keyboard(daemon, socket_path, emulator):
+  with KeyboardClient(socket_path, wait=True) as client_1, KeyboardClient(socket_path, wait=True) as client_2:
+    client_1.set_static_mode(color_rgb=[0xFF, 0x00, 0x00])
+    client_2.set_brightness(80)
+    status, frame = client_1.read_state()
+  assert status[10] == 0x00 and status[12] == 80
+  assert status[14:17] == bytes([0xFF, 0x00, 0x00])
+  assert len(frame) == 384
+  assert bytes(emulator.status) == status
+
+
+def test_frames_are_color_planes(daemon, socket_path, emulator):
+  frame = CustomFrame(np.arange(384, dtype=np.uint16).reshape(128, 3).astype(np.uint8))
+  with KeyboardClient(socket_path, wait=True) as client:
+    client.push_frame(frame)
+    assert client.read_state()[1] == frame.to_bytes() == emulator.get_custom_bytes()
+    client.push_frame(frame.rgb[::-1].copy())
+    assert CustomFrame.from_bytes(client.read_state()[1]) == CustomFrame(frame.rgb[::-1])
+    client.push_frame(frame.to_bytes())
+    assert client.read_state()[1] == frame.to_bytes()
+
+
+def test_arrays_are_converted_to_8_bit(daemon, socket_path):
+  rgb = np.arange(384).reshape(128, 3) % 256
+  with KeyboardClient(socket_path, wait=True) as client:
+    for frame in (rgb, rgb.astype(np.float64), rgb.astype(np.uint16)):
+      client.push_frame(frame)
+      assert client.read_state()[1] == CustomFrame(rgb).to_bytes()
+    with pytest.raises(ValueError):
+      client.push_frame(rgb.reshape(3, 128))
+    with pytest.raises(ValueError):
+      client.push_frame(rgb.ravel())
+
+
+def test_invalid_requests_are_answered_with_an_error(daemon, socket_path):
+  with KeyboardClient(socket_path) as client:
+    with pytest.raises(IOError):
+      client.request(OP_SET_MODE, bytes([0x55, 50]))
+    with pytest.raises(IOError):
+      client.push_frame(bytes(10))
+    client.set_brightness(20)       # the connection is still usable
+
+
+def test_socket_is_private(daemon, socket_path):
+  assert stat.S_IMODE(os.stat(socket_path).st_mode) & 0o077 == 0
+
+
+def test_live_daemon_is_not_replaced(daemon, keyboard, socket_path):
+  with pytest.raises(RuntimeError):
+    KeyboardDaemon(keyboard, socket_path)
+  with KeyboardClient(socket_path) as client:
+    client.set_brightness(20)
+
+
+def test_stale_socket_is_replaced(keyboard, socket_path):
+  stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  stale.bind(socket_path)
+  stale.close()                     # the file is left, nobody answers
+  daemon = KeyboardDaemon(keyboard, socket_path)
+  daemon.close()
+  assert not os.path.exists(socket_path)
+
+
+def test_other_files_are_not_removed(keyboard, socket_path):
+  with open(socket_path, 'w') as f:
+    f.write('data')
+  with pytest.raises(RuntimeError):
+    KeyboardDaemon(keyboard, socket_path)
+  assert os.path.exists(socket_path)
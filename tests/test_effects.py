@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Software-rendered effects
+
+@author: Raymundo Cassani
+"""
+import numpy as np
+import pytest
+
+from keyboard_fusion_animation import Animation
+from keyboard_fusion_effects import Fire, Gradient, Noise, Plasma, Ripple, Starfield, Wave
+
+
+def _effects(geometry):
+  return [Gradient(geometry, speed=0.5), Wave(geometry), Ripple(geometry, 'G'), Plasma(geometry),
+          Fire(geometry), Starfield(geometry), Noise(geometry)]
+
+
+def test_batched_frames_match_single_frames(keyboard):
+  geometry = keyboard.geometry
+  t = np.arange(8) / 30
+  for effect in _effects(geometry):
+    frames = effect.render(t)
+    assert frames.shape == (8, 128, 3) and frames.dtype == np.uint8
+    assert not frames[:, ~geometry.used].any()
+    for ix in (0, 5):
+      assert np.array_equal(frames[ix], effect.render(t[ix])[0]), type(effect).__name__
+
+
+def test_effects_are_deterministic(keyboard):
+  geometry = keyboard.geometry
+  for cls in (Fire, Starfield, Noise):
+    assert np.array_equal(cls(geometry, seed=3).render([0.5, 1.5]), cls(geometry, seed=3).render([0.5, 1.5]))
+  assert not np.array_equal(Noise(geometry, seed=1).render(0.5), Noise(geometry, seed=2).render(0.5))
+
+
+def test_gradient_goes_from_first_to_last_color(keyboard):
+  geometry = keyboard.geometry
+  frame = Gradient(geometry, colors_rgb=([0xFF, 0x00, 0x00], [0x00, 0x00, 0xFF])).render(0)[0]
+  left, right = np.nanargmin(geometry.x), np.nanargmax(geometry.x)
+  assert frame[left].tolist() == [0xFF, 0x00, 0x00]
+  assert frame[right].tolist() == [0x00, 0x00, 0xFF]
+
+
+def test_frame_fn_renders_in_batches(keyboard):
+  effect = Wave(keyboard.geometry)
+  frame_fn = effect.frame_fn(fps=30, batch=4)
+  expected = effect.frames(fps=30, duration_s=10 / 30)
+  for ix in range(10):
+    assert np.array_equal(frame_fn(ix, ix / 30), expected[ix])
+
+
+def test_configuration_and_animation(keyboard, emulator):
+  effect = Plasma(keyboard.geometry)
+  dict_keys = effect.configuration(t=0.25)
+  assert set(dict_keys) == set(keyboard.layout.index)
+  keyboard.set_custom_configuration(dict_keys)
+  assert keyboard.get_custom_configuration() == dict_keys
+  stats = Animation(keyboard, effect.frame_fn(fps=100), fps=100).run(n_frames=5)
+  assert stats.frames_shown + stats.frames_dropped == 5
+  with pytest.raises(KeyError):
+    Ripple(keyboard.geometry, 'not a key')
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Emulated keyboard used as transport
+
+@author: Raymundo Cassani
+"""
+import pytest
+
+from keyboard_fusion_emulator import EmulatedKeyboard
+from keyboard_fusion_rgb import KeyboardFusionRGB, _STATUS_REQUEST
+
+
+def test_status_after_power_on(keyboard):
+  status = keyboard.get_current_status()
+  assert len(status) == 264
+  assert status[0:2] == [0x07, 0x82]
+  assert status[10] == 0x00 and status[12] == 50
+
+
+def test_set_mode_is_read_back(keyboard, emulator):
+  keyboard.set_wave_mode(color_rgb=[0x10, 0x20, 0x30], brightness=70)
+  keyboard.invalidate_cache()
+  status = keyboard.get_current_status()
+  assert status[10] == 0x0B and status[12] == 70
+  assert bytes(status) == bytes(emulator.status)
+
+
+def test_invalid_requests_are_rejected(emulator):
+  emulator.open()
+  with pytest.raises(ValueError):
+    emulator.send_feature_report(bytes(10))
+  with pytest.raises(ValueError):
+    emulator.send_feature_report(bytes([0x07, 0x55]) + bytes(262))
+  with pytest.raises(IOError):
+    emulator.get_feature_report(264, 264)      # no response pending
+
+
+def test_reports_before_the_minimum_gap_are_rejected():
+  emulator = EmulatedKeyboard(min_gap_s=10)
+  emulator.open()
+  emulator.send_feature_report(_STATUS_REQUEST)
+  with pytest.raises(IOError):
+    emulator.get_feature_report(264, 264)
+  assert emulator.n_rejected == 1
+
+
+def test_stale_handle_is_reopened(keyboard, emulator):
+  keyboard.open()
+  emulator.disconnect()
+  keyboard.set_static_mode(color_rgb=[0x00, 0xFF, 0x00])
+  assert keyboard.is_open
+  assert emulator.status[14:17] == bytes([0x00, 0xFF, 0x00])
+
+
+def test_closed_after_each_request_without_session(emulator):
+  keyboard = KeyboardFusionRGB(transport=emulator, persistent=False)
+  keyboard.delay_s = 0
+  keyboard.set_static_mode()
+  assert not emulator.is_open and not keyboard.is_open
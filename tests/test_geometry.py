@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Spatial key geometry
+
+@author: Raymundo Cassani
+"""
+import numpy as np
+
+from keyboard_fusion_geometry import get_geometry
+
+
+def test_distances(keyboard):
+  geometry = keyboard.geometry
+  slot_a, slot_s = geometry.slot('A'), geometry.slot('S')
+  assert geometry.distance_from('A')[slot_s] == 1.0
+  assert np.array_equal(geometry.distances, geometry.distances.T)
+  assert geometry.distance_from(slot_a)[slot_a] == 0.0
+  unused = ~geometry.used
+  assert unused.any() and np.isinf(geometry.distance_from('A')[unused]).all()
+
+
+def test_neighbors(keyboard):
+  geometry = keyboard.geometry
+  neighbors = set(geometry.neighbors('G').tolist())
+  assert {geometry.slot('F'), geometry.slot('H')} <= neighbors
+  assert geometry.slot('G') not in neighbors
+  assert geometry.slot('P') not in neighbors
+  assert (geometry.distances[geometry.slot('G'), list(neighbors)] <= geometry.neighbor_radius).all()
+
+
+def test_rows_and_masks(keyboard):
+  geometry = keyboard.geometry
+  row = geometry.rows[geometry.slot('A')]
+  assert geometry.row_masks[row, geometry.slot('L')]
+  assert not geometry.row_masks[row, geometry.slot('Q')]
+  assert geometry.row_masks[:, geometry.used].sum(axis=0).tolist() == [1] * geometry.used.sum()
+  assert geometry.mask(['A', 'S']).sum() == 2
+
+
+def test_normalized_positions(keyboard):
+  geometry = keyboard.geometry
+  assert geometry.x_norm.min() == 0.0 and geometry.x_norm.max() == 1.0
+  assert geometry.x_norm[geometry.slot('A')] < geometry.x_norm[geometry.slot('L')]
+  assert geometry.y_norm[geometry.slot('ESC')] < geometry.y_norm[geometry.slot('Space')]
+
+
+def test_geometry_is_built_once(keyboard):
+  assert keyboard.geometry is get_geometry(keyboard.layout)
+  assert get_geometry('eng_us') is get_geometry('eng_us')
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Keyboard layouts read from the data files
+
+@author: Raymundo Cassani
+"""
+import numpy as np
+import pytest
+
+from keyboard_fusion_layouts import LAYOUTS_DIR, N_SLOTS, available_layouts, get_layout, parse_layout
+from keyboard_fusion_rgb import KeyboardFusionRGB
+
+
+def test_shipped_layouts():
+  assert available_layouts() == ['eng_uk', 'eng_us']
+  eng_us, eng_uk = get_layout('eng_us'), get_layout('eng_uk')
+  assert len(eng_us.keys) == len(eng_uk.keys) == N_SLOTS
+  assert len(eng_us.index) == len(eng_uk.index) == 101
+  assert '\\' in eng_us.index and '\\' not in eng_uk.index
+  assert '#' in eng_uk.index and '#' not in eng_us.index
+
+
+def test_layout_is_read_once():
+  assert get_layout('eng_us') is get_layout('eng_us')
+  assert get_layout(get_layout('eng_uk')) is get_layout('eng_uk')
+
+
+def test_slots_and_masks():
+  layout = get_layout('eng_us')
+  assert layout.keys[layout.slot('A')] == 'A'
+  assert list(layout.slots(['Q', 'A'])) == [layout.slot('Q'), layout.slot('A')]
+  assert layout.used.sum() == 101
+  assert not layout.used[0]
+  for group, mask in layout.group_masks.items():
+    assert mask.sum() == len(layout.groups[group])
+  with pytest.raises(KeyError):
+    layout.slot('not a key')
+
+
+def test_unknown_layout(emulator):
+  with pytest.raises(ValueError, match='eng_uk, eng_us'):
+    get_layout('fr_fr')
+  with pytest.raises(ValueError):
+    KeyboardFusionRGB(transport=emulator, layout='fr_fr')
+
+
+def test_layout_file_path(tmp_path, emulator):
+  with open(LAYOUTS_DIR + '/eng_us.txt', encoding='utf-8') as f:
+    text = f.read()
+  path = tmp_path / 'custom.txt'
+  path.write_text(text.replace('Caps', 'Fn-Lock'), encoding='utf-8')
+  keyboard = KeyboardFusionRGB(transport=emulator, layout=str(path))
+  assert keyboard.layout.name == 'custom'
+  assert keyboard.layout.slot('Fn-Lock') == get_layout('eng_us').slot('Caps')
+
+
+@pytest.mark.parametrize('text, message', [
+  ('[slots]\n' + 'K ' * 127, '127 slots'),
+  ('[slots]\n' + 'K ' * 128, 'repeated'),
+  ('A B\n', 'outside'),
+  ('[slots]\n' + ' '.join('K{:d}'.format(ix) for ix in range(128)) + '\n[groups]\nrow = Q', 'unknown keys'),
+])
+def test_invalid_layout_files(text, message):
+  with pytest.raises(ValueError, match=message):
+    parse_layout(text)
+
+
+def test_frame_dictionaries_use_the_layout(keyboard, emulator):
+  keyboard.set_custom_mode({'A': [0x01, 0x02, 0x03]})
+  dict_keys = keyboard.get_custom_configuration()
+  assert len(dict_keys) == 101
+  assert list(dict_keys['A']) == [0x01, 0x02, 0x03]
+  assert np.count_nonzero(keyboard.get_custom_frame().rgb) == 3
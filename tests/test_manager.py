@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Several keyboards driven in parallel
+
+@author: Raymundo Cassani
+"""
+import time
+
+import numpy as np
+import pytest
+
+from keyboard_fusion_emulator import EmulatedKeyboard
+from keyboard_fusion_manager import KeyboardManager
+from keyboard_fusion_rgb import KeyboardFusionRGB
+
+
+def _manager(n_keyboards, latency_s = 0.0):
+  emulators = [EmulatedKeyboard(latency_s=latency_s) for _ in range(n_keyboards)]
+  keyboards = [KeyboardFusionRGB(transport=emulator) for emulator in emulators]
+  for keyboard in keyboards:
+    keyboard.delay_s = 0
+  return KeyboardManager(keyboards), emulators
+
+
+def test_calls_reach_all_the_keyboards():
+  manager, emulators = _manager(3)
+  with manager:
+    manager.set_static_mode(color_rgb=[0xFF, 0x00, 0x00], synchronized=True)
+    assert manager.set_brightness(80) == [None] * 3
+  for emulator in emulators:
+    assert emulator.status[10] == 0x00 and emulator.status[12] == 80
+    assert not emulator.is_open
+
+
+def test_keyboards_are_updated_in_parallel():
+  # clean (2 reports) and set mode (1 report) of 20 ms each per keyboard
+  manager, emulators = _manager(4, latency_s=0.02)
+  with manager:
+    t_start = time.perf_counter()
+    manager.set_static_mode()
+    elapsed_s = time.perf_counter() - t_start
+  assert elapsed_s < 2 * 3 * 0.02
+  assert all(emulator.n_opcodes[0x02] == 1 for emulator in emulators)
+
+
+def test_each_keyboard_gets_its_arguments():
+  manager, emulators = _manager(2)
+  frames = [np.full((128, 3), value, np.uint8) for value in (0x11, 0x22)]
+  with manager:
+    assert manager.call_each('set_custom_frame', [(frame,) for frame in frames]) == [2, 2]
+    with pytest.raises(ValueError):
+      manager.call_each('set_custom_frame', [(frames[0],)])
+  assert [emulator.custom_pages[0x02][0] for emulator in emulators] == [0x11, 0x22]
+
+
+def test_only_keyboard_methods_are_forwarded():
+  manager, _ = _manager(1)
+  with pytest.raises(AttributeError):
+    manager.not_a_method
+  manager.close()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Idempotent mode setters
+
+@author: Raymundo Cassani
+"""
+import pytest
+
+from keyboard_fusion_rgb import KeyboardFusionRGB, MODE_SETTERS
+
+
+def _counts(emulator):
+  return emulator.n_opcodes.get(0x8A, 0), emulator.n_opcodes.get(0x02, 0)
+
+
+@pytest.mark.parametrize('setter', MODE_SETTERS)
+def test_same_mode_is_not_sent_again(keyboard, emulator, setter):
+  getattr(keyboard, setter)()
+  counts = _counts(emulator)
+  getattr(keyboard, setter)()
+  assert _counts(emulator) == counts
+
+
+def test_same_mode_other_configuration_skips_clean(keyboard, emulator):
+  keyboard.set_static_mode(color_rgb=[0xFF, 0x00, 0x00])
+  n_clean, n_set = _counts(emulator)
+  keyboard.set_static_mode(color_rgb=[0x00, 0xFF, 0x00])
+  assert _counts(emulator) == (n_clean, n_set + 1)
+  assert emulator.status[14:17] == bytes([0x00, 0xFF, 0x00])
+
+
+def test_mode_change_cleans(keyboard, emulator):
+  keyboard.set_static_mode()
+  n_clean, n_set = _counts(emulator)
+  keyboard.set_breathing_mode()
+  assert _counts(emulator) == (n_clean + 1, n_set + 1)
+  assert emulator.status[10] == 0x01
+
+
+def test_always_clean_and_force(keyboard, emulator):
+  keyboard.set_static_mode()
+  n_clean, n_set = _counts(emulator)
+  assert not keyboard.apply_mode_configuration(*keyboard.record_mode_call('set_static_mode')[:3])
+  assert keyboard.apply_mode_configuration(*keyboard.record_mode_call('set_static_mode')[:3], force=True)
+  assert _counts(emulator) == (n_clean + 1, n_set + 1)
+
+  keyboard.always_clean = True
+  keyboard.set_static_mode(color_rgb=[0x00, 0x00, 0xFF])
+  assert _counts(emulator) == (n_clean + 2, n_set + 2)
+
+
+def test_mode_changed_by_other_means_is_set_again(keyboard, emulator):
+  keyboard.set_static_mode(color_rgb=[0xFF, 0x00, 0x00])
+  other = KeyboardFusionRGB(transport=emulator)
+  other.delay_s = 0
+  other.set_wave_mode()
+  assert emulator.status[10] == 0x0B
+  keyboard.set_static_mode(color_rgb=[0xFF, 0x00, 0x00])
+  assert emulator.status[10] == 0x00
+  assert emulator.status[14:17] == bytes([0xFF, 0x00, 0x00])
+
+
+def test_configuration_changed_by_other_means_is_set_again(keyboard, emulator):
+  keyboard.set_static_mode(color_rgb=[0xFF, 0x00, 0x00])
+  emulator.status[14:17] = [0x00, 0x00, 0xFF]
+  n_clean, n_set = _counts(emulator)
+  keyboard.set_static_mode(color_rgb=[0xFF, 0x00, 0x00])
+  assert _counts(emulator) == (n_clean, n_set + 1)    # same mode, no cleaning
+  assert emulator.status[14:17] == bytes([0xFF, 0x00, 0x00])
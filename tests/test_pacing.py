@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pacing between feature reports: back-off and calibration
+
+@author: Raymundo Cassani
+"""
+import time
+
+from keyboard_fusion_emulator import EmulatedKeyboard
+from keyboard_fusion_rgb import KeyboardFusionRGB, Pacer
+
+
+def test_backoff_and_recovery():
+  pacer = Pacer(0.001, max_gap_s=0.005, backoff=2.0, recover_after=3)
+  pacer.error()
+  assert pacer.current_gap_s == 0.002
+  pacer.error()
+  pacer.error()
+  assert pacer.current_gap_s == 0.005          # limited to max_gap_s
+  for _ in range(3):
+    pacer.done()
+  assert pacer.current_gap_s == 0.0025
+  for _ in range(6):
+    pacer.done()
+  assert pacer.current_gap_s == 0.001          # back to the base gap
+
+
+def test_deadline_only_waits_the_remaining_gap():
+  pacer = Pacer(0.02)
+  pacer.done()
+  time.sleep(0.03)
+  pacer.wait()
+  assert pacer.slept_s == 0.0
+  pacer.done()
+  pacer.wait()
+  assert 0.0 < pacer.slept_s <= 0.02
+
+
+def test_failed_reports_are_sent_again_with_a_larger_gap():
+  emulator = EmulatedKeyboard(min_gap_s=0.003)
+  keyboard = KeyboardFusionRGB(transport=emulator)
+  keyboard.delay_s = 0
+  status = keyboard.get_current_status()
+  assert status is not None and status[0] == 0x07
+  assert emulator.n_rejected >= 1
+  assert keyboard.pacer.current_gap_s >= 0.003
+
+
+def test_calibrate_delay_finds_a_safe_gap():
+  emulator = EmulatedKeyboard(min_gap_s=0.002)
+  keyboard = KeyboardFusionRGB(transport=emulator)
+  delay_s = keyboard.calibrate_delay(n_reports=4)
+  assert 0.002 <= delay_s < 0.05
+  assert keyboard.delay_s == delay_s
+  n_rejected = emulator.n_rejected
+  for _ in range(5):
+    keyboard.get_current_status()
+  assert emulator.n_rejected == n_rejected
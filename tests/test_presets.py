@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compiled preset store
+
+@author: Raymundo Cassani
+"""
+import numpy as np
+
+from keyboard_fusion_color import ColorPipeline
+from keyboard_fusion_emulator import EmulatedKeyboard
+from keyboard_fusion_presets import PresetStore
+from keyboard_fusion_rgb import KeyboardFusionRGB
+
+
+def test_compiling_does_not_change_the_keyboard(keyboard, emulator, tmp_path):
+  keyboard.color_pipeline = ColorPipeline(gamma=2.2)
+  frame = np.full((128, 3), 10, np.uint8)
+  keyboard.set_custom_mode(brightness=80)
+  keyboard.set_custom_frame(frame)
+  keyboard.set_wave_mode(color_rgb=[0x10, 0x20, 0x30])
+  custom_pages = dict(keyboard.custom_pages)
+  mode_requests = {mode: bytes(request[0]) for mode, request in keyboard._mode_requests.items()}
+  n_sent = emulator.n_sent
+
+  store = PresetStore(str(tmp_path / 'presets.kfp'), keyboard)
+  store.add_mode('alert', 'set_wave_mode', color_rgb=[0xFF, 0x00, 0x00], brightness=100)
+  store.add_custom('white', np.full((128, 3), 0xFF, np.uint8), brightness=100)
+
+  assert emulator.n_sent == n_sent
+  assert keyboard.custom_pages == custom_pages
+  assert {mode: bytes(request[0]) for mode, request in keyboard._mode_requests.items()} == mode_requests
+  assert (keyboard.get_cached_custom_frame().rgb == frame).all()
+
+
+def test_compiled_reports_match_the_driver(keyboard, emulator, tmp_path):
+  keyboard.color_pipeline = ColorPipeline(gamma=2.2, white_balance=[1.0, 0.8, 0.6])
+  frame = np.arange(384, dtype=np.uint16).reshape(128, 3).astype(np.uint8)
+  store = PresetStore(str(tmp_path / 'presets.kfp'), keyboard)
+  store.add_mode('wave', 'set_wave_mode', color_rgb=[0x10, 0x20, 0x30], brightness=70)
+  store.add_custom('frame', frame, brightness=80)
+
+  store.apply('wave')
+  status = bytes(emulator.status)
+  store.apply('frame')
+  stored = emulator.get_custom_bytes()
+
+  other_emulator = EmulatedKeyboard()
+  other = KeyboardFusionRGB(transport=other_emulator)
+  other.delay_s = 0
+  other.color_pipeline = keyboard.color_pipeline
+  other.set_wave_mode(color_rgb=[0x10, 0x20, 0x30], brightness=70)
+  assert bytes(other_emulator.status) == status
+  other.set_custom_mode(brightness=80)
+  other.set_custom_frame(frame)
+  assert other_emulator.get_custom_bytes() == stored
+
+
+def test_applied_preset_is_not_sent_again(keyboard, emulator, tmp_path):
+  store = PresetStore(str(tmp_path / 'presets.kfp'), keyboard)
+  store.add_custom('typing', {'A': [0x01, 0x02, 0x03]}, brightness=80)
+  assert store.apply('typing') == 4
+  assert emulator.status[10] == 0x12
+  assert emulator.get_custom_bytes()[keyboard.layout.slot('A')] == 0x01
+  assert store.apply('typing') == 0
+  assert store.apply('typing', force=True) == 4
+
+
+def test_store_is_saved_and_loaded(keyboard, tmp_path):
+  path = str(tmp_path / 'presets.kfp')
+  store = PresetStore(path, keyboard)
+  store.add_mode('alert', 'set_static_mode', color_rgb=[0xFF, 0x00, 0x00], brightness=100)
+  store.add_custom('typing', {'A': [0x01, 0x02, 0x03]})
+
+  loaded = PresetStore(path, keyboard)
+  assert loaded.names() == ['alert', 'typing']
+  assert loaded.presets == store.presets
+  assert loaded.n_recompiled == 0
+
+
+def test_other_layout_is_compiled_again(keyboard, tmp_path):
+  path = str(tmp_path / 'presets.kfp')
+  PresetStore(path, keyboard).add_custom('typing', {'A': [0x01, 0x02, 0x03]})
+  store = PresetStore(path, keyboard)
+  store.layout_hash = bytes(16)
+  store.load()
+  assert store.n_recompiled == 1
+
+
+def test_changed_pipeline_is_compiled_again(keyboard, emulator, tmp_path):
+  path = str(tmp_path / 'presets.kfp')
+  store = PresetStore(path, keyboard)
+  store.add_mode('alert', 'set_static_mode', color_rgb=[0xC8, 0xC8, 0xC8], brightness=100)
+  store.apply('alert')
+  assert emulator.status[14:17] == bytes([0xC8, 0xC8, 0xC8])
+
+  keyboard.color_pipeline = ColorPipeline(dimming=0.5)
+  store.apply('alert')
+  assert emulator.status[14:17] == bytes([100, 100, 100])
+  keyboard.color_pipeline.dimming = 0.25
+  store.apply('alert')
+  assert emulator.status[14:17] == bytes([50, 50, 50])
+  assert store.n_recompiled == 2
+
+  # the file was saved with the new reports, and is not compiled again
+  assert PresetStore(path, keyboard).n_recompiled == 0
+  keyboard.color_pipeline = None
+  assert PresetStore(path, keyboard).n_recompiled == 1
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared-memory frame and its pusher
+
+@author: Raymundo Cassani
+"""
+import os
+import subprocess
+import sys
+import threading
+import uuid
+
+import pytest
+
+from keyboard_fusion_shm import FramePusher, SharedFrame
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+@pytest.fixture
+def shared():
+  shared = SharedFrame('kf-test-' + uuid.uuid4().hex[:8], create=True)
+  yield shared
+  shared.close()
+
+
+def test_producers_write_in_place(shared):
+  producer = SharedFrame(shared.shm.name)
+  with producer.edit() as rgb:
+    rgb[3] = [0x10, 0x20, 0x30]
+  assert shared.sequence == 1
+  assert shared.rgb[3].tolist() == [0x10, 0x20, 0x30]
+  producer.close()
+
+
+def test_attached_process_does_not_remove_the_block(shared):
+  code = ('from keyboard_fusion_shm import SharedFrame\n'
+          'producer = SharedFrame({!r})\n'
+          'producer.rgb[0] = [1, 2, 3]\n'
+          'producer.close()').format(shared.shm.name)
+  result = subprocess.run([sys.executable, '-c', code], env=dict(os.environ, PYTHONPATH=ROOT),
+                          capture_output=True, text=True, timeout=60)
+  assert result.returncode == 0, result.stderr
+  assert 'leaked' not in result.stderr
+  # the block still exists after the producer exited
+  consumer = SharedFrame(shared.shm.name)
+  assert consumer.rgb[0].tolist() == [1, 2, 3]
+  consumer.close()
+
+
+def test_changed_frames_are_pushed(keyboard, emulator, shared):
+  pusher = FramePusher(keyboard, shared, max_fps=200)
+  assert pusher.push() == 2
+  assert pusher.push() == 0                 # unchanged, nothing is sent
+  with shared.edit() as rgb:
+    rgb[5] = [0x00, 0x00, 0x40]
+  assert pusher.push() == 1                 # only the Blue page
+  assert emulator.custom_pages[0x02][5] == 0x40
+  assert pusher.n_pushed == 2
+
+
+def test_run_is_limited_to_max_fps(keyboard, emulator, shared):
+  pusher = FramePusher(keyboard, shared, max_fps=20)
+  is_done = threading.Event()
+
+  def produce():
+    value = 0
+    while not is_done.is_set():
+      value = (value + 1) % 256
+      with shared.edit() as rgb:
+        rgb[0, 0] = value
+
+  producer = threading.Thread(target=produce)
+  producer.start()
+  try:
+    pusher.run(duration_s=0.2)
+  finally:
+    is_done.set()
+    producer.join()
+  assert 1 <= pusher.n_pushed <= 5
+  pusher.push()
+  assert emulator.custom_pages[0x01][0] == shared.rgb[0, 0]
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HID I/O instrumentation
+
+@author: Raymundo Cassani
+"""
+import asyncio
+
+import pytest
+
+from keyboard_fusion_async import AsyncKeyboardFusionRGB
+from keyboard_fusion_emulator import EmulatedKeyboard
+from keyboard_fusion_rgb import KeyboardFusionRGB
+from keyboard_fusion_stats import LatencyHistogram
+
+
+def test_reports_are_counted_per_opcode(keyboard):
+  stats = keyboard.enable_stats()
+  keyboard.set_static_mode(color_rgb=[0xFF, 0x00, 0x00])
+  snapshot = stats.snapshot()
+  assert snapshot['sent'] == {0x8A: 1, 0x02: 1}
+  assert snapshot['received'] == {0x8A: 1}
+  assert snapshot['bytes_sent'] == 2 * 264
+  assert snapshot['methods']['set_static_mode']['count'] == 1
+  assert snapshot['methods']['write_keyboard_request']['count'] == 2
+  assert 'set_static_mode' in stats.report()
+
+
+def test_hooks_receive_the_events(keyboard):
+  events = []
+  stats = keyboard.enable_stats()
+  stats.add_hook(lambda event, name, value: events.append((event, name)))
+  keyboard.get_current_status()
+  assert ('send', 0x82) in events and ('receive', 0x82) in events
+  assert ('call', 'get_current_status') in events
+
+
+def test_batch_calls_are_not_measured(keyboard):
+  stats = keyboard.enable_stats()
+  with keyboard.batch():
+    for brightness in range(10, 60, 10):
+      keyboard.set_static_mode(brightness=brightness)
+  methods = stats.snapshot()['methods']
+  # only the calls at commit, not the recorded ones nor the dry run
+  assert methods['apply_mode_configuration']['count'] == 1
+  assert 'set_static_mode' not in methods
+  assert methods['write_keyboard_request']['count'] == sum(stats.n_sent.values())
+
+
+def test_errors_are_counted(keyboard, emulator):
+  stats = keyboard.enable_stats()
+  keyboard.open()
+  emulator.disconnect()
+  keyboard.get_current_status()
+  assert stats.errors['transfer'] == 1
+
+
+class _NoKeyboard(EmulatedKeyboard):
+  """
+  Transport of a keyboard that is not connected
+  """
+
+  def open(self, vendor_id = None, product_id = None):
+    raise OSError('open failed')
+
+
+@pytest.mark.parametrize('use_async', [False, True])
+def test_clean_without_response_is_an_error(use_async, capsys):
+  if use_async:
+    async_keyboard = AsyncKeyboardFusionRGB(transport=_NoKeyboard())
+    keyboard = async_keyboard.keyboard
+  else:
+    keyboard = KeyboardFusionRGB(transport=_NoKeyboard())
+  keyboard.delay_s = 0
+  stats = keyboard.enable_stats()
+  if use_async:
+    asyncio.run(async_keyboard.set_static_mode(color_rgb=[0xFF, 0x00, 0x00]))
+  else:
+    keyboard.set_static_mode(color_rgb=[0xFF, 0x00, 0x00])
+  assert stats.errors['clean'] == 1
+  assert stats.errors['open'] == 2       # clean and set mode
+  assert 'No Response for Cleaning command' in capsys.readouterr().out
+
+
+def test_disable_removes_the_wrappers(keyboard, emulator):
+  keyboard.enable_stats()
+  stats = keyboard.disable_stats()
+  keyboard.set_static_mode()
+  assert stats.n_sent == {}
+  assert keyboard.hid_kb is emulator
+  assert 'set_static_mode' not in keyboard.__dict__
+
+
+def test_histogram_percentiles():
+  histogram = LatencyHistogram()
+  for seconds in [0.001] * 99 + [0.5]:
+    histogram.add(seconds)
+  assert histogram.percentile(50) == pytest.approx(2.0 ** -9)   # bin of 1 ms
+  assert histogram.percentile(100) == 0.5
+  assert histogram.to_dict()['count'] == 100
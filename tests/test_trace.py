@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Protocol trace capture and replay
+
+@author: Raymundo Cassani
+"""
+import time
+
+import numpy as np
+import pytest
+
+from keyboard_fusion_emulator import EmulatedKeyboard
+from keyboard_fusion_rgb import KeyboardFusionRGB
+from keyboard_fusion_trace import RECEIVED, SENT, Trace, replay
+
+
+def _record_show(keyboard, path):
+  keyboard.start_trace(path)
+  keyboard.set_custom_mode(brightness=100)
+  for value in (0x10, 0x20, 0x30):
+    keyboard.set_custom_frame(np.full((128, 3), value, np.uint8))
+    time.sleep(0.01)
+  return keyboard.stop_trace()
+
+
+def test_reports_are_recorded(keyboard, emulator, tmp_path):
+  path = str(tmp_path / 'show.kftrace')
+  n_records = _record_show(keyboard, path)
+  assert keyboard.hid_kb is emulator
+  with Trace(path) as trace:
+    assert len(trace) == n_records == emulator.n_sent + emulator.n_received
+    t, direction, report = trace[0]
+    assert direction == SENT and report[:2] == bytes([0x07, 0x8A])
+    assert trace[1][1] == RECEIVED
+    assert trace.duration_s >= 0.02
+
+
+def test_replay_reproduces_the_final_state(keyboard, emulator, tmp_path):
+  path = str(tmp_path / 'show.kftrace')
+  _record_show(keyboard, path)
+  other = EmulatedKeyboard()
+  player = KeyboardFusionRGB(transport=other)
+  player.delay_s = 0
+  n_sent = replay(player, path, timing='fast')
+  assert n_sent == emulator.n_sent
+  assert other.n_received == emulator.n_received
+  assert bytes(other.status) == bytes(emulator.status)
+  assert other.get_custom_bytes() == emulator.get_custom_bytes()
+  assert player.status is None              # shadow copy invalidated
+
+
+def test_original_timing_is_kept(keyboard, tmp_path):
+  path = str(tmp_path / 'show.kftrace')
+  _record_show(keyboard, path)
+  with Trace(path) as trace:
+    duration_s = trace.duration_s
+  player = KeyboardFusionRGB(transport=EmulatedKeyboard())
+  player.delay_s = 0
+  t_start = time.perf_counter()
+  replay(player, path, speed=2.0)
+  assert time.perf_counter() - t_start >= 0.9 * duration_s / 2
+
+
+def test_traces_are_checked(tmp_path):
+  path = tmp_path / 'not.kftrace'
+  path.write_bytes(b'not a trace file')
+  with pytest.raises(ValueError):
+    Trace(str(path))
+  with pytest.raises(ValueError):
+    replay(KeyboardFusionRGB(transport=EmulatedKeyboard()), str(path), timing='slow')
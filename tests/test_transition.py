@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Crossfade transitions between Custom mode frames
+
+@author: Raymundo Cassani
+"""
+import numpy as np
+import pytest
+
+from keyboard_fusion_rgb import CustomFrame
+from keyboard_fusion_transition import EASINGS, crossfade, fade, gamma_luts
+
+
+def _full(value):
+  return np.full((128, 3), value, np.uint8)
+
+
+@pytest.mark.parametrize('easing', sorted(EASINGS))
+def test_crossfade_ends_at_the_last_frame(easing):
+  frames = crossfade(_full(0), _full(200), steps=10, easing=easing)
+  assert frames.shape == (10, 128, 3) and frames.dtype == np.uint8
+  assert (frames[-1] == 200).all()
+  assert (np.diff(frames[:, 0, 0].astype(int)) >= 0).all()    # monotonic
+
+
+@pytest.mark.parametrize('steps', [0, -3])
+def test_crossfade_needs_a_step(steps):
+  with pytest.raises(ValueError, match='steps'):
+    crossfade(_full(0), _full(255), steps=steps)
+
+
+def test_linear_light_blend_is_brighter_at_the_middle():
+  plain = crossfade(_full(0), _full(255), steps=2, easing='linear')
+  linear_light = crossfade(_full(0), _full(255), steps=2, easing='linear', gamma=2.2)
+  assert plain[0, 0, 0] == 128
+  assert linear_light[0, 0, 0] > plain[0, 0, 0]
+
+
+def test_gamma_luts_are_built_once():
+  decode, encode = gamma_luts(2.2)
+  assert decode[0] == 0.0 and decode[255] == 1.0
+  assert encode[0] == 0 and encode[-1] == 255
+  assert gamma_luts(2.2)[0] is decode
+
+
+def test_dark_colors_are_exact_in_linear_light():
+  start, end = _full(3), _full(3)
+  start[0], end[0] = [1, 2, 5], [0, 7, 1]
+  frames = crossfade(start, end, steps=5, gamma=2.2)
+  assert (frames[:, 1:] == 3).all()             # colors that do not change
+  assert np.array_equal(frames[-1], end)
+
+
+def test_fade_from_the_current_frame(keyboard, emulator):
+  keyboard.set_custom_frame(_full(0x10))
+  slot = keyboard.layout.slot('A')
+  n_sent = fade(keyboard, {'A': [0xFF, 0x00, 0x00]}, duration_s=0.1)
+  assert n_sent > 2
+  frame = keyboard.get_custom_frame()
+  assert frame.rgb[slot].tolist() == [0xFF, 0x00, 0x00]
+  assert (np.delete(frame.rgb, slot, axis=0) == 0x10).all()     # the other keys keep their color
+
+
+def test_zero_duration_sends_the_final_frame(keyboard, emulator):
+  keyboard.set_custom_frame(_full(0))
+  assert fade(keyboard, CustomFrame(_full(0x20)), duration_s=0) == 2
+  assert emulator.get_custom_bytes() == bytes([0x20]) * 384
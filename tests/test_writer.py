@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Background writer with latest-wins coalescing
+
+@author: Raymundo Cassani
+"""
+import threading
+
+import numpy as np
+import pytest
+
+from keyboard_fusion_rgb import KeyboardFusionRGB
+from keyboard_fusion_writer import BackgroundWriter
+
+
+@pytest.fixture
+def writer(keyboard):
+  writer = BackgroundWriter(keyboard)
+  yield writer
+  writer.close()
+
+
+def _hold(writer):
+  '''
+  Keeps the writer thread busy until the returned event is set
+  '''
+
+  release = threading.Event()
+  writer.keyboard.hold = release.wait
+  writer.submit('hold')
+  return release
+
+
+def test_pending_frames_are_coalesced(writer, emulator):
+  release = _hold(writer)
+  futures = [writer.set_custom_frame(np.full((128, 3), value, np.uint8)) for value in range(1, 6)]
+  assert writer.n_coalesced == 4
+  release.set()
+  writer.flush()
+  assert [future.result() for future in futures] == [2] * 5
+  assert emulator.n_opcodes[0x06] == 2
+  assert emulator.custom_pages[0x01][0] == 5
+
+
+def test_mode_changes_are_not_reordered(writer, emulator):
+  release = _hold(writer)
+  writer.set_custom_frame(np.full((128, 3), 1, np.uint8))
+  writer.set_static_mode(color_rgb=[0xFF, 0x00, 0x00])
+  writer.set_custom_frame(np.full((128, 3), 2, np.uint8))
+  writer.set_brightness(10)
+  writer.set_brightness(20)
+  assert writer.n_coalesced == 1
+  release.set()
+  writer.flush()
+  assert emulator.n_opcodes[0x06] == 4
+  assert emulator.status[10] == 0x00 and emulator.status[12] == 20
+
+
+def test_errors_reach_the_future(writer):
+  future = writer.set_custom_configuration({'not a key': [0x00, 0x00, 0x00]})
+  with pytest.raises(KeyError):
+    future.result()
+
+
+def test_closed_writer_rejects_calls(writer):
+  writer.set_brightness(30)
+  writer.close()
+  assert not writer.thread.is_alive()
+  assert writer.keyboard.get_cached_status()[12] == 30
+  with pytest.raises(RuntimeError):
+    writer.set_brightness(40)
+
+
+def test_session_mode_is_restored(emulator):
+  keyboard = KeyboardFusionRGB(transport=emulator, persistent=False)
+  keyboard.delay_s = 0
+  writer = BackgroundWriter(keyboard)
+  writer.set_brightness(30).result()
+  assert keyboard.persistent
+  writer.close()
+  assert not keyboard.persistent and not keyboard.is_open
+  keyboard.set_brightness(40)
+  assert not keyboard.is_open           # closed after each request again